@@ -0,0 +1,85 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, correlation, minhash
+from scipy import sparse
+import numpy as np
+import argparse
+
+"""
+Recall of the approximate (MinHash + LSH) edges against the exact ones, on every character of the saved runs.
+
+    python -m benchmarks.approximate --corpus claremont krakoa
+    python -m benchmarks.approximate --synthetic 20000 30000   (characters, issues: timing only, no exact edges)
+"""
+
+def exact_edges(weights_df, soft_floor, hard_floor, top_n) -> prepare_edges.EdgeArrays:
+    return prepare_edges.extract_edges(prepare_edges.calculate_correlations(weights_df), soft_floor, hard_floor, top_n)
+
+def edge_set(edges:prepare_edges.EdgeArrays) -> set:
+    return set(zip(edges.source.tolist(), edges.target.tolist()))
+
+def all_pairs_edges(weights_df, soft_floor, hard_floor, top_n) -> prepare_edges.EdgeArrays:
+    """extract_edges_from_pairs with every pair listed: should be the same as the exact edges."""
+    corr = correlation.sparse_correlations(correlation.to_sparse_weights(weights_df))
+    rows, cols = np.triu_indices(len(corr), k=1)
+    values = corr[rows, cols]
+    keep = ~np.isnan(values)
+    return prepare_edges.extract_edges_from_pairs(np.asarray(weights_df.iloc[:, 0]), rows[keep], cols[keep], values[keep],
+                                                  soft_floor, hard_floor, top_n)
+
+def synthetic_matrix(n_characters:int, n_issues:int, seed:int=0) -> sparse.csr_matrix:
+    """Characters with a power law number of appearances, in teams that tend to appear together."""
+    rng = np.random.default_rng(seed)
+    appearances = np.minimum((rng.pareto(1.2, n_characters) + 1) * 2, n_issues).astype(int)
+    team = rng.integers(0, n_characters // 10, n_characters)
+    team_issues = rng.integers(0, n_issues, (n_characters // 10, 64))
+    rows, cols = [], []
+    for character in range(n_characters):
+        own = rng.integers(0, n_issues, appearances[character] // 2)
+        shared = rng.choice(team_issues[team[character]], min(appearances[character] - len(own), 64), replace=False)
+        rows.append(np.full(len(own) + len(shared), character))
+        cols.append(np.concatenate([own, shared]))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n_characters, n_issues))
+    matrix.data[:] = 1 # repeated (character, issue) pairs were summed
+    return matrix
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--thresholds", type=float, nargs=3, default=[0.5, 0.2, 3], metavar=("SOFT", "HARD", "TOP_N"))
+    parser.add_argument("--hashes", type=int, default=minhash.DEFAULT_HASHES)
+    parser.add_argument("--rows-per-band", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--synthetic", type=int, nargs=2, default=None, metavar=("CHARACTERS", "ISSUES"))
+    args = parser.parse_args()
+    soft_floor, hard_floor, top_n = args.thresholds[0], args.thresholds[1], int(args.thresholds[2])
+
+    if args.synthetic:
+        matrix = synthetic_matrix(*args.synthetic)
+        print(f"synthetic: {matrix.shape[0]} characters x {matrix.shape[1]} issues, {matrix.nnz} appearances")
+        for rows_per_band in args.rows_per_band:
+            elapsed, (rows, _, values) = timed(minhash.approximate_correlations, matrix, n_hashes=args.hashes, rows_per_band=rows_per_band)
+            print(f"  rows per band {rows_per_band}: {elapsed:7.2f}s   {len(rows)} candidate pairs "
+                  f"({len(rows) / (matrix.shape[0] * (matrix.shape[0] - 1) / 2):.2%} of all pairs), {(values > hard_floor).sum()} above the hard floor")
+        return
+
+    for corpus in args.corpus:
+        weights_df = prepare_edges.build_weights_df(load_table(corpus))
+        n = len(weights_df)
+        exact_time, exact = timed(exact_edges, weights_df, soft_floor, hard_floor, top_n)
+        print(f"{corpus} ({n} characters): exact {exact_time:6.2f}s, {len(exact)} edges   "
+              f"(every pair through extract_edges_from_pairs: same edges {edge_set(all_pairs_edges(weights_df, soft_floor, hard_floor, top_n)) == edge_set(exact)})")
+        exact_set = edge_set(exact)
+        strong = {edge for edge, value in zip(zip(exact.source.tolist(), exact.target.tolist()), exact.correlation) if value > soft_floor}
+        for rows_per_band in args.rows_per_band:
+            matrix = correlation.to_sparse_weights(weights_df)
+            candidates_time, (rows, _, _) = timed(minhash.approximate_correlations, matrix, n_hashes=args.hashes, rows_per_band=rows_per_band)
+            approximate_time, approximate = timed(prepare_edges.approximate_edges, weights_df, soft_floor, hard_floor, top_n,
+                                                  n_hashes=args.hashes, rows_per_band=rows_per_band)
+            found = edge_set(approximate)
+            print(f"  {args.hashes} hashes, {rows_per_band} per band: {approximate_time:6.2f}s   "
+                  f"candidates {len(rows) / (n * (n - 1) / 2):6.2%} of the pairs   "
+                  f"recall {len(found & exact_set) / len(exact_set):6.1%} (above the soft floor: {len(found & strong) / max(len(strong), 1):6.1%})   "
+                  f"precision {len(found & exact_set) / max(len(found), 1):6.1%}")
+
+if __name__ == "__main__":
+    main()
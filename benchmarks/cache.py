@@ -0,0 +1,41 @@
+from benchmarks.stub_server import StubWiki, pages_from_table
+from utils import parse_issues, scrape
+import pandas as pd
+import argparse
+import tempfile
+import time
+
+"""
+Cold, warm and stale (revalidated with 304s) runs of the scraper with the on-disk page cache.
+
+    python -m benchmarks.cache --issues 100
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table", default="results/Krakoa Era/data/table_of_appearances.csv")
+    parser.add_argument("--issues", type=int, default=100, help="number of issues to scrape")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stub waits before answering")
+    args = parser.parse_args()
+    
+    table = pd.read_csv(args.table)
+    issues = list(table.columns[1:args.issues+1])
+    pages = pages_from_table(table[["character name"] + issues])
+    
+    with StubWiki(pages, latency=args.latency) as wiki, tempfile.TemporaryDirectory() as cache_dir:
+        issue_list = wiki.issue_list(issues)
+        runs = [("cold", None), ("warm", None), ("stale (ttl=0)", 0)]
+        for name, ttl in runs:
+            cache = scrape.enable_cache(cache_dir)
+            if ttl is not None:
+                cache.ttl = ttl
+            served_before, not_modified_before = wiki.requests_served, wiki.not_modified_served
+            start = time.perf_counter()
+            parse_issues.build_full_table(issue_list, save_progress=False, requests_per_second=None)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>14}   {elapsed:6.2f}s   requests: {wiki.requests_served - served_before:>4}   "
+                  f"304s: {wiki.not_modified_served - not_modified_before:>4}   {cache.stats()}")
+        scrape.disable_cache()
+
+if __name__ == "__main__":
+    main()
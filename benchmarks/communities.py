@@ -0,0 +1,73 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, process_appearances, communities
+from community import community_louvain
+import networkx as nx
+import numpy as np
+import argparse
+
+"""
+Time and modularity of the communities: python-louvain on the networkx graph vs the vectorized Louvain on the
+CSR adjacency, from scratch and warm-started from a previous partition.
+
+The warm start is measured on the graph of the whole corpus, starting from the communities of the graph
+without its last 10% issues (like update_graph does after new issues are scraped).
+
+    python -m benchmarks.communities --corpus claremont krakoa
+    python -m benchmarks.communities --planted 200 100   (200 communities of 100 nodes)
+"""
+
+def graph_of(table, top_n_characters:int=None) -> tuple:
+    """Returns the names and the CSR adjacency of the filtered edges (only the characters with an edge)."""
+    if top_n_characters is not None:
+        stats = process_appearances.count_types_of_appearances(table)
+        table = process_appearances.filter_less_frequent_characters(table, stats, top_n_characters=top_n_characters,
+                                                                    character_percentile=0.5, min_number_of_apperances=2)
+    edges = prepare_edges.extract_edges(prepare_edges.calculate_correlations(prepare_edges.build_weights_df(table)), 0.5, 0.2, 3)
+    used = np.unique(np.concatenate([edges.source, edges.target]))
+    position = np.full(len(edges.names), -1)
+    position[used] = np.arange(len(used))
+    adjacency = communities.adjacency_from_edges(position[edges.source], position[edges.target], edges.correlation, len(used))
+    return edges.names[used], adjacency
+
+def python_louvain(adjacency, partition:np.ndarray=None, seed:int=0) -> np.ndarray:
+    G = nx.from_scipy_sparse_array(adjacency)
+    start = None if partition is None else dict(enumerate(partition.tolist()))
+    result = community_louvain.best_partition(G, partition=start, random_state=seed)
+    return np.array([result[node] for node in range(adjacency.shape[0])])
+
+def compare(label:str, adjacency, previous:np.ndarray=None, repeat:int=3) -> None:
+    print(f"{label}: {adjacency.shape[0]} nodes, {adjacency.nnz // 2} edges")
+    runs = [("python-louvain", python_louvain, None), ("csr", communities.louvain, None)]
+    if previous is not None:
+        runs += [("python-louvain, warm", python_louvain, previous), ("csr, warm", communities.louvain, previous)]
+    baseline = None
+    for name, function, start in runs:
+        elapsed, labels = timed(function, adjacency, partition=start, seed=0, repeat=repeat)
+        baseline = baseline or elapsed
+        print(f"  {name:>22}: {elapsed:7.3f}s   speedup x{baseline/elapsed:6.1f}   "
+              f"modularity {communities.modularity(adjacency, labels):.4f}   {labels.max() + 1} communities")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--planted", type=int, nargs=2, default=None, metavar=("COMMUNITIES", "SIZE"))
+    args = parser.parse_args()
+
+    if args.planted:
+        n_communities, size = args.planted
+        G = nx.planted_partition_graph(n_communities, size, 10 / size, 2 / (n_communities * size), seed=0)
+        compare(f"planted partition ({n_communities} x {size})", nx.to_scipy_sparse_array(G, format="csr").astype(float), repeat=1)
+        return
+
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        names, adjacency = graph_of(table, top_n_characters=200)
+        compare(f"{corpus} (top 200)", adjacency)
+        names, adjacency = graph_of(table)
+        # the communities before the last 10% of the issues, for the nodes that were already there
+        earlier_names, earlier_adjacency = graph_of(table.iloc[:, :1 + (table.shape[1] - 1) * 9 // 10])
+        earlier = dict(zip(earlier_names, communities.louvain(earlier_adjacency).tolist()))
+        compare(f"{corpus} (all)", adjacency, previous=communities.partition_to_labels(list(names), earlier))
+
+if __name__ == "__main__":
+    main()
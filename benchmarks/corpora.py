@@ -0,0 +1,45 @@
+from utils.incidence import TYPE_OF_APPEARANCE
+import pandas as pd
+import numpy as np
+import time
+
+"""
+The saved runs under results/, loaded as tables of appearances for the benchmarks.
+
+The Claremont run only kept its weights (weights_df.csv), so its types of appearance are read back from the weights.
+"""
+
+CORPORA = {"claremont": "results/Claremont X-Comics/data/weights_df.csv",
+           "krakoa": "results/Krakoa Era/data/table_of_appearances.csv",
+           "hickman": "results/Hickman's Fantastic Four/data/table_of_appearances.csv",
+           "savage": "results/Savage Avengers Vol 1/data/table_of_appearances.csv"}
+
+TYPE_OF_WEIGHT = {1.0: "Appearances", 0.5: "Minor Appearances", 0.1: "Mentions"}
+
+def load_table(corpus:str) -> pd.DataFrame:
+    """Returns the table_of_appearances of a corpus (a key of CORPORA, or a path to a csv)."""
+    path = CORPORA.get(corpus, corpus)
+    table = pd.read_csv(path)
+    if path.endswith("weights_df.csv"):
+        table = table.drop(columns=table.columns[0]) # saved with its index
+        types = {issue: table[issue].map(TYPE_OF_WEIGHT).astype(TYPE_OF_APPEARANCE) for issue in table.columns[1:]}
+        table = pd.DataFrame({"character name": table["character name"], **types})
+    return table
+
+def issue_tables(table:pd.DataFrame) -> list[pd.DataFrame]:
+    """Splits a table back into the per-issue tables that parse_issues.build_issue_table returns."""
+    tables = []
+    for issue in table.columns[1:]:
+        column = table[issue].dropna()
+        tables.append(pd.DataFrame({"character name": table.loc[column.index, "character name"].to_numpy(),
+                                    issue: column.astype(TYPE_OF_APPEARANCE).to_numpy()}))
+    return tables
+
+def timed(function, *args, repeat:int=1, **kwargs) -> tuple:
+    """Returns (best time in seconds, result) of calling function(*args, **kwargs) `repeat` times."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
@@ -0,0 +1,49 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, correlation
+import numpy as np
+import argparse
+
+"""
+Dense DataFrame.corr() vs the sparse correlation backend, on every character of a corpus.
+Checks that both give the same correlations, and that the top-k mode finds the same strongest edges.
+
+    python -m benchmarks.correlation --corpus claremont krakoa --k 3
+"""
+
+def top_k_from_dense(corr:np.ndarray, k:int) -> np.ndarray:
+    """The k highest correlations of each row of a dense matrix, in decreasing order."""
+    corr = corr.copy()
+    np.fill_diagonal(corr, -np.inf)
+    corr[np.isnan(corr)] = -np.inf
+    return -np.sort(-corr, axis=1)[:, :k]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+    
+    for corpus in args.corpus:
+        weights = prepare_edges.build_weights_df(load_table(corpus))
+        pandas_time, expected = timed(prepare_edges.calculate_correlations, weights, backend="pandas")
+        sparse_time, result = timed(prepare_edges.calculate_correlations, weights, backend="sparse")
+        expected, result = expected.to_numpy(), result.to_numpy()
+        same_nans = (np.isnan(expected) == np.isnan(result)).all()
+        max_difference = np.nanmax(np.abs(expected - result))
+        print(f"{corpus}: {weights.shape[0]} characters x {weights.shape[1]-1} issues")
+        print(f"  pandas: {pandas_time:7.3f}s   sparse: {sparse_time:7.3f}s   speedup x{pandas_time/sparse_time:6.1f}   "
+              f"max |difference|: {max_difference:.2e}   same NaNs: {same_nans}")
+        
+        matrix = correlation.to_sparse_weights(weights)
+        top_k_time, (rows, cols, values) = timed(correlation.top_k_correlations, matrix, args.k)
+        expected_top = top_k_from_dense(expected, args.k)
+        found_top = np.full(expected_top.shape, -np.inf)
+        for row in range(expected_top.shape[0]):
+            row_values = np.sort(values[rows == row])[::-1]
+            found_top[row, :len(row_values)] = row_values
+        finite = np.isfinite(expected_top)
+        same_top = (finite == np.isfinite(found_top)).all() and np.allclose(expected_top[finite], found_top[finite], atol=1e-6)
+        print(f"  top-{args.k}: {top_k_time:7.3f}s   {len(values)} edges   same as dense: {same_top}")
+
+if __name__ == "__main__":
+    main()
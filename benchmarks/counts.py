@@ -0,0 +1,65 @@
+from benchmarks.corpora import load_table, timed
+from utils import process_appearances
+from utils.incidence import TYPE_OF_APPEARANCE
+import pandas as pd
+import argparse
+
+"""
+Counting the types of appearance and selecting the characters to keep:
+one string comparison of the whole table per type + a full sort (the old way) vs a bincount over the int8 levels + argpartition.
+Checks that the counts and the characters kept are the same. The old full sort wasn't stable, so which of the characters
+tied at the cut (e.g. the 200th place) made it was arbitrary: now it's the first ones in key_df.
+
+    python -m benchmarks.counts --corpus claremont krakoa
+"""
+
+SETTINGS = {"min_number_of_apperances": 2, "top_n_characters": 200, "character_percentile": 0.5}
+
+def count_by_comparing(table:pd.DataFrame) -> pd.DataFrame:
+    characters = pd.DataFrame({"character name":    pd.Series(table["character name"]),
+                               "Appearances":       pd.Series((table.iloc[:,1:] == "Appearances").sum(axis=1)),
+                               "Minor Appearances": pd.Series((table.iloc[:,1:] == "Minor Appearances").sum(axis=1)),
+                               "Mentions":          pd.Series((table.iloc[:,1:] == "Mentions").sum(axis=1))})
+    characters["Total Appearances (Full and Minor)"] = characters["Appearances"] + characters["Minor Appearances"]
+    characters["Appearances and Mentions (Full + Minor + Mentions)"] = characters["Total Appearances (Full and Minor)"] + characters["Mentions"]
+    characters.sort_values(by="Appearances", ascending=False, inplace=True)
+    return characters
+
+def keep_by_sorting(key_df:pd.DataFrame, number_of_issues:int, min_number_of_apperances:int, top_n_characters:int,
+                    character_percentile:float) -> pd.Index:
+    number_of_characters_to_keep = int(min(top_n_characters, len(key_df) * character_percentile, len(key_df)))
+    top_characters = key_df.sort_values(by="Appearances", ascending=False).head(number_of_characters_to_keep)
+    return top_characters.index[top_characters["Appearances"] >= int(min(min_number_of_apperances, number_of_issues))]
+
+def same_up_to_ties(appearances:pd.Series, old_kept:pd.Index, new_kept:pd.Index) -> bool:
+    """Whether the characters kept only differ among the ones tied with the last character kept."""
+    cut = appearances[new_kept].min() if len(new_kept) else 0
+    different = set(old_kept).symmetric_difference(new_kept)
+    return len(old_kept) == len(new_kept) and all(appearances[character] == cut for character in different)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    args = parser.parse_args()
+
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        # as loaded from a csv, and as built by build_full_table
+        tables = {"strings": table.astype({issue: object for issue in table.columns[1:]}),
+                  "categoricals": table.astype({issue: TYPE_OF_APPEARANCE for issue in table.columns[1:]})}
+        for label, table in tables.items():
+            old_count_time, old_stats = timed(count_by_comparing, table, repeat=3)
+            new_count_time, new_stats = timed(process_appearances.count_types_of_appearances, table, repeat=3)
+            number_of_issues = table.shape[1] - 1
+            old_keep_time, old_kept = timed(keep_by_sorting, old_stats, number_of_issues, repeat=20, **SETTINGS)
+            new_keep_time, new_kept = timed(process_appearances.characters_to_keep, new_stats, number_of_issues, repeat=20, **SETTINGS)
+            same_counts = old_stats.sort_index().equals(new_stats.sort_index())
+            same_characters = set(old_kept) == set(new_kept)
+            print(f"{corpus} ({label}, {table.shape[0]} characters x {number_of_issues} issues):")
+            print(f"  count: {old_count_time*1000:8.1f}ms -> {new_count_time*1000:7.1f}ms   speedup x{old_count_time/new_count_time:6.1f}   "
+                  f"same counts: {same_counts}")
+            print(f"  keep:  {old_keep_time*1000:8.2f}ms -> {new_keep_time*1000:7.2f}ms   speedup x{old_keep_time/new_keep_time:6.1f}   "
+                  f"same characters: {same_characters}   (up to ties at the cut: {same_up_to_ties(new_stats['Appearances'], old_kept, new_kept)})")
+
+if __name__ == "__main__":
+    main()
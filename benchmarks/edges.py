@@ -0,0 +1,40 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, process_appearances
+import argparse
+
+"""
+build_edge_list + filter_edges vs the fused extract_edges, on the filtered characters (as in main.py) and on all of them.
+Checks that both keep the same (undirected) edges.
+
+    python -m benchmarks.edges --corpus claremont krakoa
+"""
+
+def old_path(corr_matrix, soft_floor, hard_floor, top_n):
+    return prepare_edges.filter_edges(prepare_edges.build_edge_list(corr_matrix), soft_floor, hard_floor, top_n)
+
+def undirected(edges) -> set:
+    return {frozenset(pair) for pair in zip(edges["source"], edges["target"])}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--thresholds", type=float, nargs=3, default=[0.5, 0.2, 3], metavar=("SOFT", "HARD", "TOP_N"))
+    args = parser.parse_args()
+    soft_floor, hard_floor, top_n = args.thresholds[0], args.thresholds[1], int(args.thresholds[2])
+    
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        stats = process_appearances.count_types_of_appearances(table)
+        filtered = process_appearances.filter_less_frequent_characters(table, key_df=stats, min_number_of_apperances=2,
+                                                                       top_n_characters=200, character_percentile=0.5)
+        for label, selection in [("top 200", filtered), ("all", table)]:
+            corr_matrix = prepare_edges.calculate_correlations(prepare_edges.build_weights_df(selection))
+            old_time, old_edges = timed(old_path, corr_matrix, soft_floor, hard_floor, top_n)
+            new_time, new_edges = timed(prepare_edges.extract_edges, corr_matrix, soft_floor, hard_floor, top_n)
+            same = undirected(old_edges) == undirected(new_edges.to_frame())
+            print(f"{corpus} ({label}, {corr_matrix.shape[0]} characters): "
+                  f"stack + filter: {old_time:7.3f}s ({len(old_edges)} rows)   "
+                  f"fused: {new_time:7.3f}s ({len(new_edges)} edges)   speedup x{old_time/new_time:6.1f}   same edges: {same}")
+
+if __name__ == "__main__":
+    main()
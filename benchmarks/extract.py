@@ -0,0 +1,48 @@
+from benchmarks.corpora import load_table
+from benchmarks.stub_server import pages_from_table, load_pages
+from utils import extract
+import numpy as np
+import argparse
+import time
+
+"""
+Per-page latency of the category extractors, against the full BeautifulSoup parse
+(their parity, on tricky markup and saved pages, is tested in tests/test_extract.py).
+
+    python -m benchmarks.extract --corpus krakoa
+    python -m benchmarks.extract --pages-dir saved_pages/   (pages saved with stub_server.save_pages)
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="krakoa")
+    parser.add_argument("--pages-dir", default=None, help="use pages saved with stub_server.save_pages instead")
+    parser.add_argument("--pages", type=int, default=100, help="number of pages to time")
+    args = parser.parse_args()
+    
+    extractors = extract.available_extractors()
+    
+    if args.pages_dir:
+        pages = list(load_pages(args.pages_dir).values())[:args.pages]
+    else:
+        table = load_table(args.corpus)
+        pages = list(pages_from_table(table[list(table.columns[:args.pages+1])]).values())
+    print(f"{len(pages)} pages, {np.mean([len(p) for p in pages])/1024:.0f}kB on average:")
+    
+    expected = [extract.extract_with_soup(page) for page in pages]
+    soup_latency = None
+    for name in extractors:
+        latencies = []
+        same = True
+        for page, titles in zip(pages, expected):
+            start = time.perf_counter()
+            result = extract.category_titles(page, name)
+            latencies.append(time.perf_counter() - start)
+            same = same and result == titles
+        latencies = np.array(latencies) * 1000
+        soup_latency = soup_latency or np.median(latencies)
+        print(f"  {name:>5}: median {np.median(latencies):8.3f}ms   p95 {np.percentile(latencies, 95):8.3f}ms   "
+              f"speedup x{soup_latency/np.median(latencies):7.1f}   same titles: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, process_appearances, visualization
+from pyvis.network import Network
+import argparse
+
+"""
+Time to build the graph and its vis.js nodes and edges: networkx + net.from_nx vs the arrays of GraphArrays,
+on the edges of every character (not only the top 200), with the same nodes, edges, sizes and groups.
+
+    python -m benchmarks.graph --corpus claremont krakoa
+"""
+
+def networkx_json(edges_to_graph, char_stats) -> tuple:
+    G = visualization.make_nx_graph(edges_to_graph)
+    visualization.partition_communities(G)
+    visualization.set_node_size(G, char_stats)
+    net = Network(font_color="white")
+    net.from_nx(G)
+    return net.nodes, net.edges
+
+def arrays_json(edges_to_graph, char_stats) -> tuple:
+    G = visualization.make_graph(edges_to_graph)
+    G.partition_communities()
+    G.set_node_size(char_stats)
+    return G.to_vis_json(font_color="white")
+
+def same_json(a:tuple, b:tuple) -> bool:
+    """Same node dicts (by id) and edge dicts (by unordered pair of ends): the order they're listed in doesn't matter to vis.js."""
+    def edge_key(edge):
+        return frozenset((edge["from"], edge["to"]))
+    def edge_values(edge):
+        return {key: value for key, value in edge.items() if key not in ("from", "to")}
+    nodes_a, nodes_b = {node["id"]: node for node in a[0]}, {node["id"]: node for node in b[0]}
+    edges_a, edges_b = {edge_key(e): edge_values(e) for e in a[1]}, {edge_key(e): edge_values(e) for e in b[1]}
+    return nodes_a == nodes_b and edges_a == edges_b and len(a[1]) == len(b[1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--thresholds", type=float, nargs=3, default=[0.5, 0.2, 3], metavar=("SOFT", "HARD", "TOP_N"))
+    args = parser.parse_args()
+    soft_floor, hard_floor, top_n = args.thresholds[0], args.thresholds[1], int(args.thresholds[2])
+
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        char_stats = process_appearances.count_types_of_appearances(table)
+        corr = prepare_edges.calculate_correlations(prepare_edges.build_weights_df(table))
+        edges_to_graph = prepare_edges.extract_edges(corr, soft_floor, hard_floor, top_n).to_frame()
+        networkx_time, expected = timed(networkx_json, edges_to_graph, char_stats)
+        arrays_time, result = timed(arrays_json, edges_to_graph, char_stats, repeat=3)
+        print(f"{corpus}: {len(expected[0])} nodes, {len(expected[1])} edges")
+        print(f"  networkx + from_nx: {networkx_time:7.3f}s")
+        print(f"  arrays:             {arrays_time:7.3f}s   speedup x{networkx_time / arrays_time:6.1f}   "
+              f"same nodes and edges: {same_json(expected, result)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, visualization, layout
+import networkx as nx
+import numpy as np
+import argparse
+import tempfile
+
+"""
+Time and quality of the layout computed before the html, on the graph of every character:
+    - error of the Barnes-Hut repulsion against the exact one (all the pairs)
+    - edge length / distance between random pairs of nodes (lower: neighbours are closer together), against
+      networkx's spring_layout (Fruchterman-Reingold)
+    - warm start: the layout of the graph without its last 10% issues, then of the whole graph starting from it;
+      how far the nodes that were already there moved (in median edge lengths), and the time of a cached layout
+
+    python -m benchmarks.layout --corpus claremont krakoa
+"""
+
+def graph_of(table) -> visualization.GraphArrays:
+    corr = prepare_edges.calculate_correlations(prepare_edges.build_weights_df(table))
+    return visualization.make_graph(prepare_edges.extract_edges(corr, 0.5, 0.2, 3))
+
+def edge_ratio(positions:np.ndarray, G:visualization.GraphArrays) -> float:
+    """Mean length of the edges over the mean distance between random pairs of nodes."""
+    edges = np.sqrt(((positions[G.source] - positions[G.target])**2).sum(axis=1)).mean()
+    first, second = np.random.default_rng(0).integers(0, len(positions), (2, 20000))
+    return edges / np.sqrt(((positions[first] - positions[second])**2).sum(axis=1)).mean()
+
+def spring_layout(G:visualization.GraphArrays) -> np.ndarray:
+    positions = nx.spring_layout(G.to_networkx(), seed=0)
+    return np.array([positions[name] for name in G.names.tolist()])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--iterations", type=int, default=layout.DEFAULT_ITERATIONS)
+    args = parser.parse_args()
+
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        G = graph_of(table)
+        print(f"{corpus}: {G.n_nodes} nodes, {len(G)} edges")
+        adjacency = G.adjacency()
+        spring_time, spring = timed(spring_layout, G)
+        print(f"  networkx spring_layout: {spring_time:7.2f}s   edge/random distance {edge_ratio(spring, G):.3f}")
+        cold_time, cold = timed(layout.force_layout, adjacency, iterations=args.iterations)
+        print(f"  force layout:           {cold_time:7.2f}s   edge/random distance {edge_ratio(cold, G):.3f}")
+        mass = np.diff(adjacency.indptr) + 1.0
+        error = np.sqrt(((layout.repulsion(cold, mass) - layout.exact_repulsion(cold, mass))**2).sum(axis=1))
+        error /= np.sqrt((layout.exact_repulsion(cold, mass)**2).sum(axis=1))
+        print(f"  repulsion error (Barnes-Hut vs exact): median {np.median(error):.2%}, 95th percentile {np.percentile(error, 95):.2%}")
+
+        earlier = graph_of(table.iloc[:, :1 + (table.shape[1] - 1) * 9 // 10])
+        with tempfile.TemporaryDirectory() as directory:
+            earlier_positions = layout.cached_layout(earlier.names, earlier.source, earlier.target, earlier.weight, directory,
+                                                     iterations=args.iterations)
+            warm_time, warm = timed(layout.cached_layout, G.names, G.source, G.target, G.weight, directory, iterations=args.iterations)
+            cached_time, cached = timed(layout.cached_layout, G.names, G.source, G.target, G.weight, directory, iterations=args.iterations)
+        before = dict(zip(earlier.names.tolist(), layout.pixel_positions(earlier_positions, earlier.source, earlier.target)))
+        kept = [k for k, name in enumerate(G.names.tolist()) if name in before]
+        def moved(positions):
+            after = layout.pixel_positions(positions, G.source, G.target)[kept]
+            return np.median(np.sqrt(((after - np.array([before[G.names[k]] for k in kept]))**2).sum(axis=1))) / layout.EDGE_LENGTH
+        print(f"  warm start after the last 10% issues: {warm_time:7.2f}s   edge/random distance {edge_ratio(warm, G):.3f}   "
+              f"the {len(kept)} nodes already there moved by a median {moved(warm):.2f} edges ({moved(cold):.2f} from scratch)")
+        print(f"  cached: {cached_time:7.3f}s   same positions: {np.array_equal(cached, warm)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+from benchmarks.stub_server import StubWiki, pages_from_table
+from utils import parse_issues, extract
+import pandas as pd
+import argparse
+import time
+
+"""
+Throughput of the parsing stage with 0 (in-process), 1, 2, 4 and 8 parser processes, the pages served by a local stub.
+With --latency 0 the network is out of the picture and the parsers are the bottleneck.
+
+    python -m benchmarks.parse_pool --issues 200 --extractor soup fast
+"""
+
+def time_build(issue_list:list, parse_workers:int, extractor:str, max_in_flight:int) -> tuple:
+    start = time.perf_counter()
+    table = parse_issues.build_full_table(issue_list, save_progress=False, max_in_flight=max_in_flight,
+                                          requests_per_second=None, parse_workers=parse_workers, extractor=extractor)
+    return time.perf_counter() - start, table
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table", default="results/Krakoa Era/data/table_of_appearances.csv")
+    parser.add_argument("--issues", type=int, default=200, help="number of issues to scrape")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stub waits before answering")
+    parser.add_argument("--in-flight", type=int, default=8, help="concurrent downloads")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    parser.add_argument("--extractor", nargs="+", default=["soup", extract.DEFAULT_EXTRACTOR])
+    args = parser.parse_args()
+
+    table = pd.read_csv(args.table)
+    issues = list(table.columns[1:args.issues+1])
+    pages = pages_from_table(table[["character name"] + issues])
+
+    with StubWiki(pages, latency=args.latency) as wiki:
+        issue_list = wiki.issue_list(issues)
+        for extractor in args.extractor:
+            print(f"extractor={extractor}")
+            baseline = None
+            for parse_workers in args.workers:
+                elapsed, result = time_build(issue_list, parse_workers, extractor, args.in_flight)
+                if baseline is None:
+                    baseline = (elapsed, result)
+                same = result.equals(baseline[1])
+                print(f"  parse_workers={parse_workers:>2}   {elapsed:7.2f}s   "
+                      f"{len(issues)/elapsed:7.1f} issues/s   speedup x{baseline[0]/elapsed:5.1f}   same table: {same}")
+
+if __name__ == "__main__":
+    main()
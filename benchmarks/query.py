@@ -0,0 +1,93 @@
+from utils import query
+from utils.incidence import Incidence
+import pandas as pd
+import numpy as np
+import argparse
+import shutil
+import tempfile
+import time
+import os
+
+"""
+Latency of the queries on the index of a saved run, against filtering its csvs with pandas (what we did by hand),
+for random characters of the graph. Checks that both give the same answers.
+
+    python -m benchmarks.query --runs "results/Krakoa Era" "results/Hickman's Fantastic Four"
+"""
+
+def latencies(function, arguments:list) -> tuple:
+    """Returns (median, 99th percentile) in microseconds, and the results."""
+    times, results = [], []
+    for args in arguments:
+        start = time.perf_counter()
+        results.append(function(*args))
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1e6
+    return np.median(times), np.percentile(times, 99), results
+
+class PandasQueries:
+    """The same questions, answered from the csvs loaded in pandas."""
+    def __init__(self, data_path:str, index:query.GraphIndex):
+        edges = pd.read_csv(os.path.join(data_path, "edges_filtered.csv"))
+        edges.columns = ["source", "target", "weight"]
+        both = pd.concat([edges, edges.rename(columns={"source": "target", "target": "source"})])
+        self.edges = both.drop_duplicates(["source", "target"])
+        table = pd.read_csv(os.path.join(data_path, "table_of_appearances.csv"))
+        self.table = table.set_index("character name")
+        self.index = index # only to compare the same characters (names of the index)
+
+    def top_k(self, name:str, k:int) -> list:
+        rows = self.edges[self.edges["source"] == name].sort_values(["weight", "target"], ascending=[False, True]).head(k)
+        return list(zip(rows["target"], rows["weight"]))
+
+    def issues_of(self, first:str, second:str) -> list:
+        rows = self.table.loc[self.table.index.isin([first, second])]
+        together = rows.notna().groupby(level=0).any().all(axis=0)
+        return list(together[together].index)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", nargs="+", default=["results/Krakoa Era", "results/Hickman's Fantastic Four"])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    for run in args.runs:
+        with tempfile.TemporaryDirectory() as directory:
+            # build the index in a copy, so the run's folder isn't touched
+            data_path = os.path.join(directory, "data")
+            shutil.copytree(os.path.join(run, "data"), data_path)
+            start = time.perf_counter()
+            index = query.open_index(data_path)
+            build_time = time.perf_counter() - start
+            start = time.perf_counter()
+            index = query.open_index(data_path)
+            load_time = time.perf_counter() - start
+
+        rng = np.random.default_rng(0)
+        in_graph = np.flatnonzero(np.diff(index.indptr) > 0)
+        pairs = in_graph[rng.integers(0, len(in_graph), (args.queries, 2))]
+        names = [(index.names[i], index.names[j]) for i, j in pairs.tolist()]
+        n_communities = len(index.community_indptr) - 1
+        print(f"{run}: {len(in_graph)} characters in the graph, {len(index.names)} in the issues, "
+              f"{n_communities} communities   index built in {build_time:.2f}s, loaded in {load_time * 1000:.1f}ms")
+        runs = {"top 20": (index.top_k, [(first, 20) for first, _ in names]),
+                "top 20, by prefix": (index.top_k, [(first.split(" (")[0].lower(), 20) for first, _ in names]),
+                "links": (index.links, names),
+                "path": (index.path, names),
+                "community": (index.members, [(int(c),) for c in rng.integers(0, n_communities, args.queries)]),
+                "shared issues": (index.issues_of, names)}
+        results = {}
+        for label, (function, arguments) in runs.items():
+            median, p99, results[label] = latencies(function, arguments)
+            print(f"  {label:>18}: median {median:7.1f}us   99th percentile {p99:7.1f}us")
+
+        pandas_queries = PandasQueries(os.path.join(run, "data"), index)
+        sample = names[:100]
+        median, _, expected = latencies(pandas_queries.top_k, [(first, 20) for first, _ in sample])
+        same = all([(n, round(w, 12)) for n, w in a] == [(n, round(w, 12)) for n, w in b] for a, b in zip(expected, results["top 20"]))
+        print(f"  {'pandas top 20':>18}: median {median:7.1f}us   same answers: {same}")
+        median, _, expected = latencies(pandas_queries.issues_of, sample)
+        print(f"  {'pandas shared':>18}: median {median:7.1f}us   same answers: {expected == results['shared issues'][:len(sample)]}")
+
+if __name__ == "__main__":
+    main()
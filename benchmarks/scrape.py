@@ -0,0 +1,44 @@
+from benchmarks.stub_server import StubWiki, pages_from_table
+from utils import parse_issues
+import pandas as pd
+import argparse
+import time
+
+"""
+Sequential vs concurrent scraping of a saved run, served by a local stub of the wiki.
+
+    python -m benchmarks.scrape --table "results/Krakoa Era/data/table_of_appearances.csv" --issues 100
+"""
+
+def time_build(issue_list:list, max_in_flight:int, requests_per_second:float) -> tuple:
+    start = time.perf_counter()
+    table = parse_issues.build_full_table(issue_list, save_progress=False, max_in_flight=max_in_flight,
+                                          requests_per_second=requests_per_second)
+    return time.perf_counter() - start, table
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table", default="results/Krakoa Era/data/table_of_appearances.csv")
+    parser.add_argument("--issues", type=int, default=100, help="number of issues to scrape")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stub waits before answering")
+    parser.add_argument("--requests-per-second", type=float, default=None, help="rate limit (default: none)")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+    
+    table = pd.read_csv(args.table)
+    issues = list(table.columns[1:args.issues+1])
+    pages = pages_from_table(table[["character name"] + issues])
+    
+    with StubWiki(pages, latency=args.latency) as wiki:
+        issue_list = wiki.issue_list(issues)
+        baseline = None
+        for max_in_flight in args.in_flight:
+            elapsed, result = time_build(issue_list, max_in_flight, args.requests_per_second)
+            if baseline is None:
+                baseline = (elapsed, result)
+            same = result.equals(baseline[1])
+            print(f"max_in_flight={max_in_flight:>3}   {elapsed:7.2f}s   "
+                  f"{len(issues)/elapsed:7.1f} issues/s   speedup x{baseline[0]/elapsed:5.1f}   same table: {same}")
+
+if __name__ == "__main__":
+    main()
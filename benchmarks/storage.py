@@ -0,0 +1,40 @@
+from benchmarks.corpora import load_table, timed
+from utils import storage
+from utils.incidence import Incidence
+import pandas as pd
+import argparse
+import tempfile
+import os
+
+"""
+Size on disk and load time of the wide csv vs the binary store.
+
+    python -m benchmarks.storage --corpus claremont krakoa
+"""
+
+def folder_size(directory:str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    args = parser.parse_args()
+    
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "table_of_appearances.csv")
+            table.to_csv(csv_path, index=False)
+            store = storage.AppearanceStore.from_incidence(Incidence.from_table(table), os.path.join(directory, "appearances"))
+            
+            csv_time, from_csv = timed(pd.read_csv, csv_path, repeat=3)
+            open_time, store = timed(storage.AppearanceStore, store.directory, repeat=3)
+            incidence_time, _ = timed(store.to_incidence, repeat=3)
+            table_time, from_store = timed(store.to_table, repeat=3)
+            same = from_csv.astype(str).equals(from_store.astype(str))
+            print(f"{corpus}: csv {os.path.getsize(csv_path)/1024:8.0f}kB   store {folder_size(store.directory)/1024:8.0f}kB")
+            print(f"  read_csv: {csv_time:6.3f}s   open store: {open_time:6.3f}s   to_incidence: {incidence_time:6.3f}s   "
+                  f"to_table: {table_time:6.3f}s   same table: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from benchmarks.corpora import load_table
+from utils import prepare_edges, process_appearances, storage, streaming, instrumentation
+from utils.incidence import Incidence
+import argparse
+import tempfile
+import os
+
+"""
+Time and peak memory of every stage: the wide table path (the stages of make_graph_from_zero, from the table
+read back from a store) vs the streaming path (make_graph_streaming: issue by issue from the store into the statistics,
+edges from the pairs that met), and whether they give the same edges. Ties (characters with the same appearances have
+equal correlations) are ordered by the last bits of their correlations, so the edges are compared on the correlations
+rounded to 12 decimals.
+
+    python -m benchmarks.streaming --corpus claremont krakoa
+"""
+
+THRESHOLDS = (0.5, 0.2, 3)
+FILTERS = {"top 200": {"top_n_characters": 200, "character_percentile": 0.5, "min_number_of_apperances": 2},
+           "all": {}}
+
+def table_path(store:storage.AppearanceStore, tracker:instrumentation.StageTracker, filter_params:dict) -> tuple:
+    """Returns the edges, and the edges of the rounded correlations."""
+    with tracker.stage("table"):
+        # like make_graph_from_zero reading the shared store (the characters without an appearance are dropped)
+        table = store.select(list(store.issues.names)).to_table()
+    with tracker.stage("stats"):
+        char_stats = process_appearances.count_types_of_appearances(table)
+        table = process_appearances.filter_less_frequent_characters(table, char_stats, **filter_params)
+    with tracker.stage("corr"):
+        corr_matrix = prepare_edges.calculate_correlations(prepare_edges.build_weights_df(table))
+    with tracker.stage("edges"):
+        edges = prepare_edges.extract_edges(corr_matrix, *THRESHOLDS)
+    return edges, prepare_edges.extract_edges(corr_matrix.round(12), *THRESHOLDS)
+
+def streaming_path(store:storage.AppearanceStore, tracker:instrumentation.StageTracker, filter_params:dict) -> tuple:
+    """Returns the edges, and the edges of the rounded correlations."""
+    issues = [{"title": issue_id, "url": "https://marvel.fandom.com/wiki/" + issue_id.replace(" ", "_")}
+              for issue_id in store.issues.names]
+    with tracker.stage("stream"):
+        stats, _ = streaming.accumulate(streaming.iter_issues(issues, store, scrape_missing=False),
+                                        prepare_edges.weights_lookup(), n_characters=len(store.characters))
+    with tracker.stage("stats"):
+        char_stats, characters = streaming.select_characters(stats, store.characters.names, **filter_params)
+    with tracker.stage("edges"):
+        edges = streaming.stream_edges(stats, char_stats, characters, *THRESHOLDS)
+    rows, cols, correlations = stats.pair_correlations(characters.to_numpy())
+    return edges, prepare_edges.extract_edges_from_pairs(edges.names, rows, cols, correlations.round(12), *THRESHOLDS)
+
+def edge_set(edges:prepare_edges.EdgeArrays) -> set:
+    return {tuple(sorted(pair)) for pair in zip(edges.names[edges.source].tolist(), edges.names[edges.target].tolist())}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    args = parser.parse_args()
+    
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        with tempfile.TemporaryDirectory() as directory:
+            store = storage.AppearanceStore.from_incidence(Incidence.from_table(table), os.path.join(directory, "appearances"))
+            for label, filter_params in FILTERS.items():
+                print(f"{corpus} ({label}): {len(store.characters)} characters, {len(store.issues)} issues")
+                results = {}
+                for name, path in [("table", table_path), ("streaming", streaming_path)]:
+                    tracker = instrumentation.StageTracker(track_memory=True)
+                    results[name] = path(store, tracker, filter_params)
+                    report = tracker.report_frame()
+                    stages = "   ".join(f"{row.stage} {row.seconds:.2f}s/{row.peak_mb:.1f}MB" for row in report.itertuples())
+                    print(f"  {name:>9}: {report['seconds'].sum():6.2f}s   peak {report['peak_mb'].max():7.1f}MB   ({stages})")
+                (expected, expected_rounded), (result, result_rounded) = results["table"], results["streaming"]
+                print(f"  {len(expected)} / {len(result)} edges, same edges: {edge_set(expected_rounded) == edge_set(result_rounded)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from utils import aliases
+from utils.ComicSeries import format_to_url
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+import pandas as pd
+import hashlib
+import html
+import threading
+import time
+import os
+
+"""
+A local stand-in for marvel.fandom.com, used by the benchmarks.
+
+The pages are rebuilt from the table_of_appearances.csv files saved under results/,
+with the same "ul.categories" markup as the wiki, padded with filler text before it.
+Pages saved to disk (see save_pages) can be served instead.
+"""
+
+MARVEL_WIKI_URL = "https://marvel.fandom.com/wiki/"
+FILLER_PARAGRAPHS = 400 # ~40kB of synopsis around the categories
+
+REVERSE_ALIASES = {alias: name for name, alias in aliases.ALIASES.items()}
+
+def category_titles_of_issue(table:pd.DataFrame, issue:str) -> list[str]:
+    """Rebuilds the wiki category titles ("Category:Scott Summers (Earth-616)/Appearances") of an issue column."""
+    column = table[issue].dropna()
+    titles = []
+    for name, type_of_appearance in zip(table.loc[column.index, "character name"], column):
+        name = REVERSE_ALIASES.get(name, name)
+        if "(Earth-" not in name:
+            name = f"{name} (Earth-616)"
+        titles.append(f"Category:{name}/{type_of_appearance}")
+    # non-character categories, which the parser has to skip
+    titles += ["Category:Comics", f"Category:{issue.split(' Vol ')[0]} Vol 1"]
+    return titles
+
+def fake_issue_page(table:pd.DataFrame, issue:str, filler_paragraphs:int=FILLER_PARAGRAPHS) -> bytes:
+    """Returns the html of a page that looks like the wiki page of the issue, as far as the parser is concerned."""
+    filler = "".join(f"<p>Paragraph {i} of <a href=\"/wiki/Synopsis\">the synopsis</a> &amp; some <b>notes</b>.</p>\n"
+                     for i in range(filler_paragraphs))
+    categories = "".join(f'<li><span class="name"><a href="/wiki/{html.escape(t)}" title="{html.escape(t)}">'
+                         f'{html.escape(t.split(":", 1)[-1])}</a></span></li>\n'
+                         for t in category_titles_of_issue(table, issue))
+    page = f"""<!DOCTYPE html><html><head><title>{html.escape(issue)}</title></head><body>
+<div class="page-content">{filler}</div>
+<div class="page-footer"><ul class="categories">
+{categories}</ul></div>
+</body></html>"""
+    return page.encode("utf-8")
+
+def relative_url_of_issue(issue:str) -> str:
+    return format_to_url(issue)[len(MARVEL_WIKI_URL):]
+
+def page_key(relative_url:str) -> str:
+    """The pages are looked up by the unquoted relative url, whatever the client escaped."""
+    return unquote(relative_url)
+
+def pages_from_table(table:pd.DataFrame, filler_paragraphs:int=FILLER_PARAGRAPHS) -> dict:
+    """Returns {relative url: html} for every issue column of a table of appearances."""
+    return {page_key(relative_url_of_issue(issue)): fake_issue_page(table, issue, filler_paragraphs) for issue in table.columns[1:]}
+
+def save_pages(pages:dict, directory:str) -> None:
+    """Saves the pages to a directory, one file per page, so they can be served with load_pages."""
+    os.makedirs(directory, exist_ok=True)
+    for relative_url, page in pages.items():
+        with open(os.path.join(directory, relative_url.replace("/", "%2F") + ".html"), "wb") as f:
+            f.write(page)
+
+def load_pages(directory:str) -> dict:
+    """Loads pages saved with save_pages."""
+    pages = {}
+    for file_name in os.listdir(directory):
+        if file_name.endswith(".html"):
+            with open(os.path.join(directory, file_name), "rb") as f:
+                pages[file_name[:-len(".html")].replace("%2F", "/")] = f.read()
+    return pages
+
+class StubWiki:
+    """
+    Serves the pages on localhost in a background thread, waiting `latency` seconds before every answer
+    to imitate the round trip to the real wiki.
+    
+    Usage:
+        with StubWiki(pages, latency=0.05) as wiki:
+            wiki.url_of(issue)
+    """
+    def __init__(self, pages:dict, latency:float=0.05):
+        self.pages = pages
+        self.latency = latency
+        self.requests_served = 0
+        self.not_modified_served = 0
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, so pooled sessions can reuse connections
+            
+            def do_GET(self):
+                time.sleep(stub.latency)
+                stub.requests_served += 1
+                page = stub.pages.get(page_key(self.path[len("/wiki/"):]))
+                if page is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = '"' + hashlib.sha1(page).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    stub.not_modified_served += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+            
+            def log_message(self, format, *args):
+                pass # keep the benchmark output clean
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/wiki/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    def url_of(self, issue:str) -> str:
+        return self.base_url + relative_url_of_issue(issue)
+    
+    def issue_list(self, issues:list[str]) -> list[dict]:
+        """Same format as scrape.build_full_list_of_issues, pointing at the stub."""
+        return [{"title": issue, "url": self.url_of(issue)} for issue in issues]
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,48 @@
+from benchmarks.corpora import load_table, issue_tables, timed
+from utils import parse_issues
+from utils.incidence import IncidenceBuilder
+import pandas as pd
+import argparse
+
+"""
+Scaling of the table build: one outer merge per issue (the old build_full_table) vs the sparse IncidenceBuilder.
+
+    python -m benchmarks.table_build --corpus claremont krakoa
+"""
+
+def build_by_merging(tables:list[pd.DataFrame]) -> pd.DataFrame:
+    main_table = pd.DataFrame({'character name': pd.Series(dtype='str')})
+    for issue_table in tables:
+        main_table = parse_issues.append_issue_column_to_main_table(main_table, issue_table)
+    return parse_issues.replace_aliases(parse_issues.remove_duplicates(main_table))
+
+def build_with_builder(tables:list[pd.DataFrame]) -> pd.DataFrame:
+    builder = IncidenceBuilder()
+    for issue_table in tables:
+        builder.add_issue_table(issue_table)
+    return builder.to_table()
+
+def same_contents(a:pd.DataFrame, b:pd.DataFrame) -> bool:
+    """Same rows (in any order) and columns, compared as they'd be written to csv."""
+    a = a.astype(str).sort_values("character name").reset_index(drop=True)
+    b = b.astype(str).sort_values("character name").reset_index(drop=True)
+    return a.equals(b)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--steps", type=int, default=5, help="number of points on the scaling curve")
+    args = parser.parse_args()
+    
+    for corpus in args.corpus:
+        tables = issue_tables(load_table(corpus))
+        print(f"{corpus}: {len(tables)} issues")
+        for step in range(1, args.steps+1):
+            n = len(tables) * step // args.steps
+            merge_time, merged = timed(build_by_merging, tables[:n])
+            builder_time, built = timed(build_with_builder, tables[:n])
+            print(f"  issues={n:>4}   merge: {merge_time:7.3f}s   builder: {builder_time:7.3f}s   "
+                  f"speedup x{merge_time/builder_time:6.1f}   same table: {same_contents(merged, built)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, process_appearances, temporal
+from utils.incidence import Incidence
+import numpy as np
+import argparse
+
+"""
+Sliding windows over a run: the edges of every window from the incrementally updated statistics vs
+calculate_correlations on the table of every window, with the same characters and thresholds.
+Ties (characters with the same appearances have equal correlations) are ordered by the last bits of their
+correlations, so the edges are compared on both matrices rounded to 12 decimals.
+Also times the whole temporal.window_graphs (communities and layout included).
+
+    python -m benchmarks.temporal --corpus claremont krakoa --window 50 --stride 10
+"""
+
+FILTER = {"top_n_characters": 200, "character_percentile": 0.5, "min_number_of_apperances": 2}
+THRESHOLDS = (0.5, 0.2, 3)
+
+def recomputed_correlations(incidence:Incidence, window:int, stride:int) -> list:
+    """The correlation matrix of every window, from its own table."""
+    matrices = []
+    for start, end in temporal.windows(incidence.shape[1], window, stride):
+        table = incidence.select_issues(incidence.issues[start:end]).to_table()
+        stats = process_appearances.count_types_of_appearances(table)
+        table = process_appearances.filter_less_frequent_characters(table, stats, **FILTER)
+        matrices.append(prepare_edges.calculate_correlations(prepare_edges.build_weights_df(table)))
+    return matrices
+
+def incremental_correlations(incidence:Incidence, window:int, stride:int) -> list:
+    """The correlation matrix of every window, from the sliding statistics (like window_graphs)."""
+    weights_lookup = prepare_edges.weights_lookup()
+    names = incidence.characters
+    return [temporal.window_correlations(stats, names, **FILTER)[1]
+            for start, end, stats in temporal.sliding_stats(incidence, weights_lookup, window, stride)]
+
+def edge_set(corr_matrix) -> set:
+    edges = prepare_edges.extract_edges(corr_matrix.round(12), *THRESHOLDS)
+    return {tuple(sorted(pair)) for pair in zip(edges.names[edges.source].tolist(), edges.names[edges.target].tolist())}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--window", type=int, default=50)
+    parser.add_argument("--stride", type=int, nargs="+", default=[10, 1])
+    args = parser.parse_args()
+
+    for corpus in args.corpus:
+        incidence = Incidence.from_table(load_table(corpus))
+        for stride in args.stride:
+            n_windows = len(temporal.windows(incidence.shape[1], args.window, stride))
+            print(f"{corpus}: {incidence.shape[1]} issues, {n_windows} windows of {args.window} issues every {stride}")
+            recompute_time, expected = timed(recomputed_correlations, incidence, args.window, stride)
+            incremental_time, result = timed(incremental_correlations, incidence, args.window, stride)
+            same_characters = all(list(a.columns) == list(b.columns) for a, b in zip(expected, result))
+            error = max(np.nanmax(np.abs(a.to_numpy() - b.to_numpy()), initial=0) for a, b in zip(expected, result))
+            same_edges = sum(edge_set(a) == edge_set(b) for a, b in zip(expected, result))
+            print(f"  recomputed per window: {recompute_time:7.2f}s")
+            print(f"  sliding statistics:    {incremental_time:7.2f}s   speedup x{recompute_time / incremental_time:5.1f}   "
+                  f"same characters: {same_characters}, largest difference {error:.1e}, "
+                  f"same edges in {same_edges}/{n_windows} windows")
+            graphs_time, frames = timed(lambda: list(temporal.window_graphs(incidence, args.window, stride, **FILTER)))
+            print(f"  window_graphs (communities and layout included): {graphs_time:7.2f}s\n"
+                  f"{temporal.summary(frames).iloc[::max(1, n_windows // 5)].to_string(index=False)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges, process_appearances, thresholds
+import numpy as np
+import argparse
+
+"""
+The number of edges and characters for a grid of thresholds: read from the sweep vs extract_edges for every point,
+and the thresholds chosen for some target average degrees.
+
+    python -m benchmarks.thresholds --corpus claremont krakoa
+"""
+
+def extracted_counts(corr, grid:list) -> list:
+    counts = []
+    for soft_floor, hard_floor, top_n in grid:
+        edges = prepare_edges.extract_edges(corr, soft_floor, hard_floor, top_n)
+        counts.append((len(edges), len(np.unique(np.concatenate([edges.source, edges.target])))))
+    return counts
+
+def swept_counts(sweep:thresholds.ThresholdSweep, grid:list) -> list:
+    return [(int(sweep.n_edges(soft_floor, hard_floor, top_n)), int(sweep.n_nodes(soft_floor, hard_floor, top_n)))
+            for soft_floor, hard_floor, top_n in grid]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--targets", type=float, nargs="+", default=[2, 3, 5, 10])
+    args = parser.parse_args()
+
+    grid = [(soft_floor, hard_floor, top_n) for soft_floor in np.linspace(0.2, 0.9, 8) for hard_floor in (0.1, 0.2, 0.3)
+            for top_n in (0, 1, 3, 5)]
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        stats = process_appearances.count_types_of_appearances(table)
+        top = process_appearances.filter_less_frequent_characters(table, stats, top_n_characters=200,
+                                                                  character_percentile=0.5, min_number_of_apperances=2)
+        for label, subset in (("top 200", top), ("all", table)):
+            corr = prepare_edges.calculate_correlations(prepare_edges.build_weights_df(subset))
+            build_time, sweep = timed(thresholds.ThresholdSweep.from_correlations, corr)
+            extract_time, expected = timed(extracted_counts, corr, grid)
+            sweep_time, counts = timed(swept_counts, sweep, grid, repeat=3)
+            print(f"{corpus} ({label}, {len(corr)} characters): {len(grid)} thresholds")
+            print(f"  extract_edges:  {extract_time:8.3f}s")
+            print(f"  sweep:          {sweep_time:8.4f}s  (+{build_time:.3f}s to build it)   same counts: {counts == expected}")
+            for target in args.targets:
+                soft_floor, hard_floor, top_n = thresholds.choose_thresholds(sweep, target, 0.2, 3)
+                print(f"  target {target:5.1f} edges per character: soft floor {soft_floor:.3f}, top {top_n}   "
+                      f"-> {float(sweep.average_degree(soft_floor, hard_floor, top_n)):.2f}")
+
+if __name__ == "__main__":
+    main()
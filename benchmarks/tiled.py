@@ -0,0 +1,72 @@
+from benchmarks.corpora import load_table
+from benchmarks.approximate import synthetic_matrix
+from utils import prepare_edges, correlation
+import numpy as np
+import tracemalloc
+import argparse
+import tempfile
+import time
+import os
+
+"""
+Peak memory and time of the edges: the full correlation matrix in memory vs tiles of it, streamed from a
+memory-mapped weights matrix, with the pairs above the hard floor written to disk.
+
+    python -m benchmarks.tiled --corpus claremont krakoa --budget-mb 4 64
+    python -m benchmarks.tiled --synthetic 20000 30000 --budget-mb 64 256   (out-of-core only)
+"""
+
+def measured(function, *args, **kwargs) -> tuple:
+    """Returns (seconds, peak MB allocated by python and numpy, result)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024**2, result
+
+def in_memory_edges(weights_df, soft_floor, hard_floor, top_n) -> prepare_edges.EdgeArrays:
+    return prepare_edges.extract_edges(prepare_edges.calculate_correlations(weights_df), soft_floor, hard_floor, top_n)
+
+def same_edges(a:prepare_edges.EdgeArrays, b:prepare_edges.EdgeArrays) -> bool:
+    return len(a) == len(b) and np.array_equal(a.source, b.source) and np.array_equal(a.target, b.target)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    parser.add_argument("--thresholds", type=float, nargs=3, default=[0.5, 0.2, 3], metavar=("SOFT", "HARD", "TOP_N"))
+    parser.add_argument("--budget-mb", type=float, nargs="+", default=[4, 64])
+    parser.add_argument("--dense", action="store_true", help="multiply dense tiles with BLAS")
+    parser.add_argument("--synthetic", type=int, nargs=2, default=None, metavar=("CHARACTERS", "ISSUES"))
+    args = parser.parse_args()
+    soft_floor, hard_floor, top_n = args.thresholds[0], args.thresholds[1], int(args.thresholds[2])
+
+    if args.synthetic:
+        corpora = {"synthetic": (synthetic_matrix(*args.synthetic), None)}
+    else:
+        corpora = {}
+        for corpus in args.corpus:
+            weights_df = prepare_edges.build_weights_df(load_table(corpus))
+            corpora[corpus] = (correlation.to_sparse_weights(weights_df), weights_df)
+
+    for corpus, (matrix, weights_df) in corpora.items():
+        names = np.arange(matrix.shape[0]).astype(str) if weights_df is None else np.asarray(weights_df.iloc[:, 0])
+        print(f"{corpus}: {matrix.shape[0]} characters x {matrix.shape[1]} issues")
+        expected = None
+        if weights_df is not None:
+            elapsed, peak, expected = measured(in_memory_edges, weights_df, soft_floor, hard_floor, top_n)
+            print(f"  in memory:          {elapsed:7.2f}s   peak {peak:8.1f}MB   {len(expected)} edges")
+        with tempfile.TemporaryDirectory() as directory:
+            correlation.write_csr(matrix, os.path.join(directory, "weights"))
+            weights = correlation.open_csr(os.path.join(directory, "weights"))
+            for budget in args.budget_mb:
+                elapsed, peak, edges = measured(prepare_edges.out_of_core_edges, weights, names, soft_floor, hard_floor, top_n,
+                                                os.path.join(directory, "pairs"), memory_budget=int(budget * 1024**2), dense=args.dense)
+                tile = correlation.tile_size(matrix.shape[1], int(budget * 1024**2), dense=args.dense)
+                same = "" if expected is None else f"   same edges: {same_edges(expected, edges)}"
+                print(f"  budget {budget:6.0f}MB:    {elapsed:7.2f}s   peak {peak:8.1f}MB   {len(edges)} edges   "
+                      f"(tiles of {tile} characters){same}")
+
+if __name__ == "__main__":
+    main()
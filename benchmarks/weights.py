@@ -0,0 +1,52 @@
+from benchmarks.corpora import load_table, timed
+from utils import prepare_edges
+from utils.incidence import TYPE_OF_APPEARANCE
+import pandas as pd
+import numpy as np
+import argparse
+import tracemalloc
+
+"""
+Time and peak memory of build_weights_df: the old string replace path vs the int8 levels + lookup gather.
+Runs both on the table as loaded from csv (strings) and as built by build_full_table (categoricals).
+
+    python -m benchmarks.weights --corpus claremont krakoa
+"""
+
+def build_weights_df_with_strings(table:pd.DataFrame, weights_dict:dict=prepare_edges.WEIGHTS_OF_APPEARANCES) -> pd.DataFrame:
+    """The old build_weights_df."""
+    weights = table.copy()
+    weights.iloc[:,1:] = weights.iloc[:,1:].astype('str').replace(weights_dict).astype(np.float64)
+    weights = weights.fillna(0)
+    weights.iloc[:,1:] = weights.iloc[:,1:].astype(np.float64)
+    return weights
+
+def peak_memory(function, *args) -> int:
+    """Peak memory (bytes) allocated while running function(*args)."""
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", nargs="+", default=["claremont", "krakoa"])
+    args = parser.parse_args()
+    
+    for corpus in args.corpus:
+        table = load_table(corpus)
+        categorical = table.astype({issue: TYPE_OF_APPEARANCE for issue in table.columns[1:]})
+        strings = table.astype({issue: object for issue in table.columns[1:]})
+        for label, table in [("strings", strings), ("categoricals", categorical)]:
+            old_time, old = timed(build_weights_df_with_strings, table)
+            new_time, new = timed(prepare_edges.build_weights_df, table)
+            same = np.allclose(old.iloc[:, 1:].to_numpy(dtype=np.float64), new.iloc[:, 1:].to_numpy(dtype=np.float64), atol=1e-7)
+            old_peak = peak_memory(build_weights_df_with_strings, table) / 1024**2
+            new_peak = peak_memory(prepare_edges.build_weights_df, table) / 1024**2
+            print(f"{corpus} ({label}, {table.shape[0]} x {table.shape[1]-1}): "
+                  f"old: {old_time:6.3f}s {old_peak:7.1f}MB   new: {new_time:6.3f}s {new_peak:7.1f}MB   "
+                  f"speedup x{old_time/new_time:6.1f}   same weights: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,367 @@
 from inspect import CO_OPTIMIZED
-from utils import scrape, parse_issues, prepare_edges, process_appearances, visualization
+from utils import scrape, parse_issues, prepare_edges, process_appearances, visualization, storage, incremental, thresholds, temporal, streaming, instrumentation
 from utils.ComicSeries import ComicSeries
+from utils.pipeline import Pipeline
 import os
+import json
 import pandas as pd
 from dataclasses import dataclass
 
-def make_graph_from_zero(series_to_scrape:list[ComicSeries], path:str="results", title:str="", scrape_from_wiki=True) -> None:
+def make_graph_from_zero(series_to_scrape:list[ComicSeries], path:str="results", title:str="", scrape_from_wiki=True,
+                         cache_dir:str=scrape.DEFAULT_CACHE_DIR, save_edge_list:bool=False, settings:"SettingsToTweak"=None,
+                         store_dir:str=storage.SHARED_STORE_DIR, profile:dict=None, refresh:bool=False) -> None:
     """
     Runs the whole process from scratch.
+    
+    The process is split in stages (scrape, stats, filter, weights, corr, edges, graph, layout, render), whose results
+    are cached in data/stages: running it again with other settings only recomputes the stages after the first one that changed.
+    The pages downloaded from the wiki are kept in cache_dir, so the next runs only revalidate them.
+    Pass cache_dir=None to download everything again.
+    The appearances of every issue scraped, for any series, are kept in the shared store in store_dir:
+    the issues that are already there (e.g. X-Men Vol 1, which is in several reading orders) aren't scraped again.
+    The issues of this run are copied from it to data/appearances, for update_graph, make_timeline and the query index.
+    With refresh, the issues already in the shared store are fetched again too (revalidated through the page cache),
+    and the ones that changed on the wiki are rewritten (see parse_issues.build_full_table).
+    The full (unfiltered) edge list is only saved to edge_list.csv if save_edge_list is True.
+    The thresholds and the weights of the types of appearances come from settings (default: SettingsToTweak()).
+    
+    The time and memory of every stage, the requests sent to the wiki and the hit rate of the page cache
+    go to a run report in data/reports (see the instrumentation module), which is compared with the one of the last run.
+    profile: the stages to profile, e.g. {"scrape": "cprofile", "corr": "tracemalloc"} (written to data/reports too).
     """
+    if settings is None:
+        settings = SettingsToTweak()
     if title == "": 
         title = f"{series_to_scrape[0].title} Vol {series_to_scrape[0].volume}" #default to title of first series in list
         assert len(title) > 0, "Title is empty." #shouldn't happen unless something really wrong happens    
+    scrape.FETCH_STATS.reset()
     
     parent_path = os.path.join(path, title)
     data_path = os.path.join(parent_path, "data")
     output_path = os.path.join(parent_path, "output")
     
     # folder structure:
+        # store_dir (binary store shared by every series, see utils.storage)
         # path/title
         #       - /data
         #       - /output
     
-    if not scrape_from_wiki:
-        # load from the csv instead of scraping the wiki
-        appearances_per_issue = pd.read_csv(os.path.join(data_path, "table_of_appearances.csv"))
-    else:    
-        # make folder to save data and graphs, if it doesn't exist already
-        create_directory_if_it_doesnt_exist(parent_path)
-        create_directory_if_it_doesnt_exist(data_path)
-        create_directory_if_it_doesnt_exist(output_path)
-        
+    create_directory_if_it_doesnt_exist(data_path)
+    create_directory_if_it_doesnt_exist(output_path)
+    
+    def load_appearances(series_to_scrape:list[ComicSeries]) -> pd.DataFrame:
+        # load the saved data instead of scraping the wiki: the issues of the series from the shared store if they're all there,
+        # otherwise the store or the csv of this title (python -m utils.storage converts the csvs of older runs)
+        issue_list = scrape.build_full_list_of_issues(series_to_scrape)
+        issue_ids = [storage.canonical_issue_id(issue) for issue in issue_list]
+        if storage.has_store(store_dir):
+            shared = storage.AppearanceStore(store_dir)
+            if all(issue_id in shared for issue_id in issue_ids):
+                save_run_issues(shared, data_path, issue_ids)
+                return shared.select(issue_ids, [issue["title"] for issue in issue_list]).to_table()
+        if storage.has_store(os.path.join(data_path, "appearances")):
+            return storage.AppearanceStore(os.path.join(data_path, "appearances")).to_table()
+        return pd.read_csv(os.path.join(data_path, "table_of_appearances.csv"))
+    
+    def scrape_appearances(series_to_scrape:list[ComicSeries]) -> pd.DataFrame:
         # unpack issues from series
         issue_list = scrape.build_full_list_of_issues(series_to_scrape)
-        
-        # scrape each issue page and build table
-        print("Scraping...")
-        appearances_per_issue = parse_issues.build_full_table(issue_list, path=os.path.join(data_path, "table_of_appearances.csv"))
-        # save table to csv
-        appearances_per_issue.to_csv(os.path.join(data_path, "table_of_appearances.csv"), index=False)
-    
-    # get a quick summary of the table by characters:
-    print("Counting appearances...")
-    char_stats = process_appearances.count_types_of_appearances(appearances_per_issue)
-    char_stats.to_csv(os.path.join(data_path, "character_stats.csv"), index=False)
-    
-    # drop the characters with too few appearances
-    # filter:
+        # scrape each issue page and build table (also saved to csv)
+        if cache_dir is not None:
+            cache = scrape.enable_cache(cache_dir)
+        appearances_per_issue = parse_issues.build_full_table(issue_list, path=os.path.join(data_path, "table_of_appearances.csv"),
+                                                              journal_path=store_dir, refresh=refresh)
+        save_run_issues(storage.AppearanceStore(store_dir), data_path, [storage.canonical_issue_id(issue) for issue in issue_list],
+                        rewrite=refresh)
+        if cache_dir is not None:
+            print(f"Page cache: {cache.stats()}")
+        return appearances_per_issue
+    
+    def filter_characters(appearances_per_issue:pd.DataFrame, char_stats:pd.DataFrame, **params) -> pd.DataFrame:
+        # drop the characters with too few appearances
+        return process_appearances.filter_less_frequent_characters(appearances_per_issue, key_df=char_stats, **params)
+    
+    def select_edges(corr_matrix:pd.DataFrame, soft_floor:float, hard_floor:float, top_n:int,
+                     target_average_degree:float=None) -> pd.DataFrame:
+        # select/prune some edges/nodes, straight from the correlation matrix
+        if target_average_degree is not None:
+            soft_floor, hard_floor, top_n = choose_thresholds(corr_matrix, target_average_degree, hard_floor, top_n)
+        return prepare_edges.extract_edges(corr_matrix, soft_floor, hard_floor, top_n).to_frame()
+    
+    def build_graph(edges_to_graph:pd.DataFrame, char_stats:pd.DataFrame) -> visualization.GraphArrays:
+        # arrays of nodes and edges (G.to_networkx() converts it to a networkx graph)
+        G = visualization.make_graph(edges_to_graph)
+        G.partition_communities() # partition into communities
+        G.set_node_size(char_stats) # set node size
+        return G
+    
+    def set_layout(G:visualization.GraphArrays, min_nodes:int) -> visualization.GraphArrays:
+        # big graphs get their positions now (cached in data/layouts), instead of from the physics in the browser
+        if G.n_nodes >= min_nodes:
+            G.set_layout(os.path.join(data_path, "layouts"))
+        return G
+    
+    def render(G) -> str:
+        # visualize graph with pyvis
+        return visualization.show_graph(G, save_path=output_path, title=title)
+    
+    # Every stage is cached in data/stages, keyed by its parameters and inputs,
+    # so running again with other thresholds only recomputes what comes after them.
+    tracker = instrumentation.StageTracker(profile=profile, profile_dir=os.path.join(data_path, "reports"))
+    pipeline = Pipeline(os.path.join(data_path, "stages"), tracker=tracker)
+    if scrape_from_wiki:
+        pipeline.add_stage("scrape", scrape_appearances, params={"series_to_scrape": series_to_scrape}, cache=False)
+    else:
+        pipeline.add_stage("scrape", load_appearances, params={"series_to_scrape": series_to_scrape}, cache=False)
+    pipeline.add_stage("stats", process_appearances.count_types_of_appearances, inputs=["scrape"])
+    pipeline.add_stage("filter", filter_characters, inputs=["scrape", "stats"],
+                       params={"min_number_of_apperances": settings.characters_to_keep_min_appearances,
+                               "top_n_characters": settings.characters_to_keep_top_n,
+                               "character_percentile": settings.characters_to_keep_top_perc})
+    pipeline.add_stage("weights", prepare_edges.build_weights_df, inputs=["filter"],
+                       params={"weights_dict": settings.weights_for_types_of_appearances()})
+    pipeline.add_stage("corr", prepare_edges.calculate_correlations, inputs=["weights"])
+    pipeline.add_stage("edges", select_edges, inputs=["corr"],
+                       params={"soft_floor": settings.correlation_threshhold,
+                               "hard_floor": settings.correlation_hard_floor,
+                               "top_n": settings.edges_per_character,
+                               "target_average_degree": settings.target_average_degree()})
+    pipeline.add_stage("graph", build_graph, inputs=["edges", "stats"])
+    pipeline.add_stage("layout", set_layout, inputs=["graph"], params={"min_nodes": settings.static_layout_min_nodes}, cache=False)
+    pipeline.add_stage("render", render, inputs=["layout"], cache=False)
+    
+    print("Running the pipeline...")
+    pipeline.run("render")
+    pipeline.print_report()
+    write_run_report(pipeline.report_frame(), data_path, title=title, n_issues=pipeline.run("scrape").shape[1] - 1)
+    
+    pipeline.run("stats").to_csv(os.path.join(data_path, "character_stats.csv"), index=False)
+    pipeline.run("edges").to_csv(os.path.join(data_path, "edges_filtered.csv"), index=False)
+    if save_edge_list:
+        prepare_edges.build_edge_list(pipeline.run("corr")).to_csv(os.path.join(data_path, "edge_list.csv"), index=False)
+
+def make_graph_streaming(series_to_scrape:list[ComicSeries], path:str="results", title:str="", scrape_from_wiki=True,
+                         cache_dir:str=scrape.DEFAULT_CACHE_DIR, settings:"SettingsToTweak"=None,
+                         store_dir:str=storage.SHARED_STORE_DIR, export_table:bool=False, track_memory:bool=True,
+                         profile:dict=None) -> pd.DataFrame:
+    """
+    Same graph as make_graph_from_zero, without the wide table of appearances (see the streaming module):
+    every issue is read from the shared store in store_dir, or scraped into it if it isn't there yet
+    (with scrape_from_wiki=False, every issue must already be in the store), and goes straight into the
+    running statistics of the correlations. The edges come from the pairs of characters that met.
+    
+    The table_of_appearances.csv is only written with export_table.
+    Returns the time and peak memory of every stage (also printed, and saved to the run report in data/reports,
+    like make_graph_from_zero, which also takes the stages to profile).
+    """
+    if settings is None:
+        settings = SettingsToTweak()
+    if title == "":
+        title = f"{series_to_scrape[0].title} Vol {series_to_scrape[0].volume}" #default to title of first series in list
+    data_path = os.path.join(path, title, "data")
+    output_path = os.path.join(path, title, "output")
+    create_directory_if_it_doesnt_exist(data_path)
+    create_directory_if_it_doesnt_exist(output_path)
+    if cache_dir is not None and scrape_from_wiki:
+        scrape.enable_cache(cache_dir)
+    scrape.FETCH_STATS.reset()
+    tracker = instrumentation.StageTracker(track_memory=track_memory, profile=profile, profile_dir=os.path.join(data_path, "reports"))
+    
+    print("Streaming the issues into the statistics...")
+    with tracker.stage("stream"):
+        issue_list = scrape.build_full_list_of_issues(series_to_scrape)
+        shared = storage.AppearanceStore(store_dir)
+        weights_lookup = prepare_edges.weights_lookup(settings.weights_for_types_of_appearances())
+        stats, issue_ids = streaming.accumulate(streaming.iter_issues(issue_list, shared, scrape_missing=scrape_from_wiki),
+                                                weights_lookup, n_characters=len(shared.characters))
+        save_run_issues(shared, data_path, issue_ids)
+    
+    with tracker.stage("stats"):
+        char_stats, characters = streaming.select_characters(stats, shared.characters.names,
+                                                             top_n_characters=settings.characters_to_keep_top_n,
+                                                             character_percentile=settings.characters_to_keep_top_perc,
+                                                             min_number_of_apperances=settings.characters_to_keep_min_appearances)
+        char_stats.to_csv(os.path.join(data_path, "character_stats.csv"), index=False)
+    
+    print("Selecting edges...")
+    with tracker.stage("edges"):
+        if settings.automatic_thresholds:
+            # the sweep of the thresholds needs the correlations of every pair of the characters kept
+            names = char_stats.loc[characters, "character name"]
+            corr_matrix = pd.DataFrame(stats.correlations(characters.to_numpy()),
+                                       index=pd.Index(names, name=""), columns=pd.Index(names, name="character name"))
+            soft_floor, hard_floor, top_n = choose_thresholds(corr_matrix, settings.desired_avg_edges_per_node,
+                                                              settings.correlation_hard_floor, settings.edges_per_character)
+        else:
+            soft_floor, hard_floor, top_n = settings.correlation_threshhold, settings.correlation_hard_floor, settings.edges_per_character
+        edges_to_graph = streaming.stream_edges(stats, char_stats, characters, soft_floor, hard_floor, top_n).to_frame()
+    
+    with tracker.stage("graph"):
+        graph_from_edges(edges_to_graph, char_stats, data_path, output_path, title, settings)
+    
+    if export_table:
+        with tracker.stage("export"):
+            titles = {storage.canonical_issue_id(issue): issue["title"] for issue in issue_list}
+            shared.select(issue_ids, [titles[issue_id] for issue_id in issue_ids]).to_table().to_csv(
+                os.path.join(data_path, "table_of_appearances.csv"), index=False)
+    
+    tracker.print_report()
+    report = tracker.report_frame()
+    write_run_report(report, data_path, title=title, n_issues=len(issue_ids))
+    return report
+
+def update_graph(series_to_add:list[ComicSeries], path:str="results", title:str="",
+                 cache_dir:str=scrape.DEFAULT_CACHE_DIR, save_edge_list:bool=False, settings:"SettingsToTweak"=None,
+                 store_dir:str=storage.SHARED_STORE_DIR) -> None:
+    """
+    Adds new issues (e.g. the latest issues of an ongoing series) to the graph saved in path/title,
+    without running the whole process again.
+    
+    Only the issues that aren't in the shared store (store_dir) yet are scraped. The issues that aren't in data/appearances
+    (the issues of this graph, saved there by make_graph_from_zero, or read from the table_of_appearances.csv of
+    older runs) are copied there from the shared store, and added to the
+    sufficient statistics of the correlations (data/cooccurrence.npz: per character sums, sums of squares,
+    counts of each type of appearance, and co-appearance products), which costs O(k^2) per issue of k characters.
+    The counts, the selection of characters and their correlations are then read from the statistics,
+    without going back to the table of appearances.
+    """
+    if settings is None:
+        settings = SettingsToTweak()
+    if title == "":
+        title = f"{series_to_add[0].title} Vol {series_to_add[0].volume}" #default to title of first series in list
+    
+    data_path = os.path.join(path, title, "data")
+    output_path = os.path.join(path, title, "output")
+    create_directory_if_it_doesnt_exist(data_path)
+    create_directory_if_it_doesnt_exist(output_path)
+    store_path = os.path.join(data_path, "appearances")
+    csv_path = os.path.join(data_path, "table_of_appearances.csv")
+    if not storage.has_store(store_path) and os.path.exists(csv_path):
+        # a run made before the runs kept their issues in data/appearances
+        storage.migrate_csv(csv_path, store_path)
+    store = storage.AppearanceStore(store_path)
+    if len(store.issues) == 0:
+        print(f"No issues saved in {store_path}: the graph will only have the new issues.")
+    
+    print("Scraping new issues...")
+    if cache_dir is not None:
+        scrape.enable_cache(cache_dir)
+    issue_list = scrape.build_full_list_of_issues(series_to_add)
+    shared = storage.AppearanceStore(store_dir)
+    parse_issues.scrape_into_journal(issue_list, shared)
+    new_issues = storage.copy_issues(shared, store, [storage.canonical_issue_id(issue) for issue in issue_list])
+    print(f"{len(new_issues)} new issues.")
+    
+    print("Updating statistics...")
+    stats_path = os.path.join(data_path, "cooccurrence.npz")
+    weights_lookup = prepare_edges.weights_lookup(settings.weights_for_types_of_appearances())
+    stats = incremental.load_or_build(stats_path, store, weights_lookup)
+    affected = stats.pop_affected()
+    stats.save(stats_path)
+    
+    char_stats = stats.character_stats(store.characters.names, sort=False)
+    char_stats.sort_values(by="Appearances", ascending=False).to_csv(os.path.join(data_path, "character_stats.csv"), index=False)
+    
     print("Dropping characters with too few appearances...")
-    appearances_per_issue = process_appearances.filter_less_frequent_characters(appearances_per_issue,
-                                                                                key_df = char_stats,
-                                                                                min_number_of_apperances=2,
-                                                                                top_n_characters=200,
-                                                                                character_percentile=0.5)
+    characters = process_appearances.characters_to_keep(char_stats, number_of_issues=stats.n_issues,
+                                                        min_number_of_apperances=settings.characters_to_keep_min_appearances,
+                                                        top_n_characters=settings.characters_to_keep_top_n,
+                                                        character_percentile=settings.characters_to_keep_top_perc)
+    print(f"{len(affected.intersection(characters))} of the {len(characters)} characters kept appear in the new issues.")
     
-    # calculate correlation matrix: 
     print("Calculating correlations...")
-    weights = prepare_edges.build_weights_df(appearances_per_issue) # convert to numbers
-    corr_matrix = prepare_edges.calculate_correlations(weights)
+    names = char_stats.loc[characters, "character name"]
+    corr_matrix = pd.DataFrame(stats.correlations(characters.to_numpy()),
+                               index=pd.Index(names, name=""), columns=pd.Index(names, name="character name"))
     
-    # convert from matrix to edge list
-    print("Listing edges...")
-    edge_list = prepare_edges.build_edge_list(corr_matrix)
-    edge_list.to_csv(os.path.join(data_path, "edge_list.csv"), index=False)
+    graph_from_correlations(corr_matrix, char_stats, data_path, output_path, title, settings, save_edge_list=save_edge_list)
+
+def make_timeline(path:str="results", title:str="", settings:"SettingsToTweak"=None) -> pd.DataFrame:
+    """
+    The graph of every window of settings.timeline_window issues, every settings.timeline_stride issues, of a saved run
+    (see the temporal module): the frames, with their communities and layout, go to output/timeline.json, and a summary
+    of every window (nodes, edges, communities, modularity) to data/timeline.csv. Returns the summary.
+    """
+    if settings is None:
+        settings = SettingsToTweak()
+    data_path = os.path.join(path, title, "data")
+    output_path = os.path.join(path, title, "output")
+    create_directory_if_it_doesnt_exist(output_path)
     
-    # select/prune some edges/nodes
-    print("Filtering edges...")
-    edges_to_graph = prepare_edges.filter_edges(edge_list, 0.5, 0.2, 3)
+    incidence = storage.load_run_appearances(data_path)
+    print(f"Building the graphs of {len(temporal.windows(incidence.shape[1], settings.timeline_window, settings.timeline_stride))} windows...")
+    frames = list(temporal.window_graphs(incidence, settings.timeline_window, settings.timeline_stride,
+                                         weights_dict=settings.weights_for_types_of_appearances(),
+                                         top_n_characters=settings.characters_to_keep_top_n,
+                                         character_percentile=settings.characters_to_keep_top_perc,
+                                         min_number_of_apperances=settings.characters_to_keep_min_appearances,
+                                         soft_floor=settings.correlation_threshhold, hard_floor=settings.correlation_hard_floor,
+                                         top_n=settings.edges_per_character))
+    temporal.write_timeline(frames, os.path.join(output_path, "timeline.json"))
+    timeline = temporal.summary(frames)
+    timeline.to_csv(os.path.join(data_path, "timeline.csv"), index=False)
+    return timeline
+
+def graph_from_correlations(corr_matrix:pd.DataFrame, char_stats:pd.DataFrame, data_path:str, output_path:str, title:str,
+                            settings:"SettingsToTweak", save_edge_list:bool=False) -> None:
+    """The end of the process: from the correlation matrix to the html of the graph."""
+    # select/prune some edges/nodes, straight from the correlation matrix
+    print("Listing and filtering edges...")
+    edge_list_path = os.path.join(data_path, "edge_list.csv") if save_edge_list else None
+    soft_floor, hard_floor, top_n = settings.correlation_threshhold, settings.correlation_hard_floor, settings.edges_per_character
+    if settings.automatic_thresholds:
+        soft_floor, hard_floor, top_n = choose_thresholds(corr_matrix, settings.desired_avg_edges_per_node, hard_floor, top_n)
+    edges_to_graph = prepare_edges.extract_edges(corr_matrix, soft_floor, hard_floor, top_n, edge_list_path=edge_list_path).to_frame()
+    graph_from_edges(edges_to_graph, char_stats, data_path, output_path, title, settings)
+
+def graph_from_edges(edges_to_graph:pd.DataFrame, char_stats:pd.DataFrame, data_path:str, output_path:str, title:str,
+                     settings:"SettingsToTweak") -> None:
+    """From the selected edges to the html of the graph (the edges are saved to edges_filtered.csv)."""
     edges_to_graph.to_csv(os.path.join(data_path, "edges_filtered.csv"), index=False)
     
-    # convert to networkx graph object
-    G = visualization.make_nx_graph(edges_to_graph)
+    # arrays of nodes and edges (G.to_networkx() converts it to a networkx graph)
+    G = visualization.make_graph(edges_to_graph)
     print("Partitionining graph into communities...")
-    visualization.partition_communities(G) # partition into communities
-    visualization.set_node_size(G, char_stats) # set node size
+    # start from the communities of the last run, so that they only change where the new issues changed the graph
+    communities_path = os.path.join(data_path, "communities.json")
+    previous = None
+    if os.path.exists(communities_path):
+        with open(communities_path, encoding="utf-8") as f:
+            previous = json.load(f)
+    partition = G.partition_communities(previous=previous) # partition into communities
+    with open(communities_path, "w", encoding="utf-8") as f:
+        json.dump(partition, f)
+    G.set_node_size(char_stats) # set node size
+    if G.n_nodes >= settings.static_layout_min_nodes:
+        # start from the positions of the last run, so that the nodes that were there stay in place
+        print("Computing the layout...")
+        G.set_layout(os.path.join(data_path, "layouts"))
     
     # visualize graph with pyvis
     print("Building graph visualization...")
     visualization.show_graph(G, save_path=output_path, title=title)
 
+def choose_thresholds(corr_matrix:pd.DataFrame, target_average_degree:float, hard_floor:float, max_top_n:int) -> tuple:
+    """The soft floor and top n (up to max_top_n) that give the target average number of edges per character."""
+    soft_floor, hard_floor, top_n = thresholds.automatic_thresholds(corr_matrix, target_average_degree, hard_floor, max_top_n)
+    print(f"Thresholds for {target_average_degree} edges per character: soft floor {soft_floor:.3f}, hard floor {hard_floor}, top {top_n}.")
+    return soft_floor, hard_floor, top_n
+
+def save_run_issues(shared:storage.AppearanceStore, data_path:str, issue_ids:list[str], rewrite:bool=False) -> None:
+    """Copies the issues of the run to data/appearances (see storage.save_run_issues)."""
+    _, rewritten = storage.save_run_issues(shared, os.path.join(data_path, "appearances"), issue_ids, rewrite=rewrite)
+    stats_path = os.path.join(data_path, "cooccurrence.npz")
+    if rewritten and os.path.exists(stats_path):
+        os.remove(stats_path) # the statistics of the issues that were there before
+
+def write_run_report(stages:pd.DataFrame, data_path:str, **metadata) -> dict:
+    """Writes the report of the run to data/reports, and prints what got slower or bigger since the last one."""
+    reports_path = os.path.join(data_path, "reports")
+    report = instrumentation.run_report(stages, fetches=scrape.FETCH_STATS, cache=scrape.CACHE, **metadata)
+    print(f"Run report: {instrumentation.write_run_report(report, reports_path)}")
+    instrumentation.report_regressions(reports_path, report)
+    return report
+
 def create_directory_if_it_doesnt_exist(path:str):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -86,11 +369,17 @@ def create_directory_if_it_doesnt_exist(path:str):
 @dataclass
 class SettingsToTweak:
     """This class is used to store settings for the program."""
-    """Not currently used."""
-    correlation_threshhold:float = 0.5
+    correlation_threshhold:float = 0.5 # edges above this are always kept (soft floor)
+    correlation_hard_floor:float = 0.2 # edges under this are never kept
+    edges_per_character:int = 3        # the strongest edges of each character are kept, if above the hard floor
+    automatic_thresholds:bool = False  # pick the soft floor and top n (up to edges_per_character) from desired_avg_edges_per_node
     desired_avg_edges_per_node:float = 3.0
-    characters_to_keep_top_perc = 0.1
-    characters_to_keep_min_appearances = 5
+    static_layout_min_nodes:int = 300  # graphs with this many nodes are laid out before the html, with the physics off
+    characters_to_keep_top_n:int = 200
+    characters_to_keep_top_perc:float = 0.5
+    characters_to_keep_min_appearances:int = 2
+    timeline_window:int = 50           # issues in every window of make_timeline
+    timeline_stride:int = 10           # issues between the starts of two windows
     
     scrape_from_wiki = True # if true, scrape from wiki, otherwise use existing data
         
@@ -100,12 +389,15 @@ class SettingsToTweak:
     weight_for_minor_appearances: float = 0.5
     weight_for_mentions         : float = 0.1
     weight_for_invocations      : float = 0
+    def target_average_degree(self):
+        return self.desired_avg_edges_per_node if self.automatic_thresholds else None
+    
     def weights_for_types_of_appearances(self):
         return {
             "Appearances"      : self.weight_for_major_appearances,
             "Minor Appearances": self.weight_for_minor_appearances,
             "Mentions"         : self.weight_for_mentions,
-            "invocations"      : self.weight_for_invocations
+            "Invocations"      : self.weight_for_invocations
         }
     
 @dataclass
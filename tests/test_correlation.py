@@ -0,0 +1,84 @@
+from utils import prepare_edges, correlation
+from benchmarks.corpora import load_table
+import pandas as pd
+import numpy as np
+import pytest
+
+"""
+The sparse correlation backend against DataFrame.corr() (the "pandas" backend), and its top-k mode
+against the top k of the dense matrix.
+"""
+
+def small_weights() -> pd.DataFrame:
+    """A few characters over 6 issues, with rows of zero variance and exact ties."""
+    weights = {"Scott Summers":    [1, 0.5, 0, 1, 0, 0.1],
+               "Jean Grey":        [1, 0.5, 0, 1, 0, 0.1], # same as Scott: correlation of exactly 1
+               "Ororo Munroe":     [0, 0.5, 1, 0, 1, 0.1],
+               "Logan":            [0, 0.5, 1, 0, 1, 0.1], # same as Ororo
+               "Kurt Wagner":      [1, 0, 1, 0, 1, 0],
+               "Moira MacTaggert": [0, 0, 0, 0, 0, 0],     # never appears: zero variance
+               "Charles Xavier":   [1, 1, 1, 1, 1, 1],     # in every issue: zero variance
+               "Lockheed":         [0.7] * 6,              # constant weights other than 0 and 1, whose variance
+               "Cerebro":          [0.9] * 6}              # only rounds to about zero
+    issues = [f"X-Men Vol 1 {number}" for number in range(94, 100)]
+    table = pd.DataFrame(list(weights.values()), columns=issues, dtype=np.float32)
+    table.insert(0, "character name", list(weights))
+    return table
+
+def constant_weights(value:float, n_issues:int) -> pd.DataFrame:
+    """A character with the same weight in every issue, next to two that vary."""
+    table = pd.DataFrame([[value] * n_issues, [1, 0] * (n_issues // 2), [0, 1] * (n_issues // 2)], dtype=np.float32)
+    table.insert(0, "character name", ["Constant", "Even", "Odd"])
+    return table
+
+@pytest.mark.parametrize("value, n_issues", [(0.9, 14), (0.7, 1000), (0.1, 100)])
+def test_constant_rows_are_nan_at_any_length(value, n_issues):
+    weights = constant_weights(value, n_issues)
+    assert prepare_edges.calculate_correlations(weights, backend="sparse")["Constant"].isna().all()
+    rows, cols, _ = correlation.top_k_correlations(correlation.to_sparse_weights(weights), 2)
+    assert 0 not in rows and 0 not in cols
+
+def top_k_from_dense(corr:np.ndarray, k:int) -> np.ndarray:
+    """The k highest correlations of each row of a dense matrix (without itself and the NaNs), in decreasing order."""
+    corr = corr.copy()
+    np.fill_diagonal(corr, -np.inf)
+    corr[np.isnan(corr)] = -np.inf
+    return -np.sort(-corr, axis=1)[:, :k]
+
+def weights_cases() -> list:
+    cases = [pytest.param(small_weights(), id="small")]
+    for corpus in ["krakoa"]:
+        try:
+            cases.append(pytest.param(prepare_edges.build_weights_df(load_table(corpus)), id=corpus))
+        except FileNotFoundError:
+            pass
+    return cases
+
+@pytest.mark.parametrize("weights", weights_cases())
+def test_sparse_backend_matches_pandas(weights):
+    expected = prepare_edges.calculate_correlations(weights, backend="pandas")
+    result = prepare_edges.calculate_correlations(weights, backend="sparse")
+    assert np.allclose(result.to_numpy(), expected.to_numpy(dtype=np.float64), equal_nan=True)
+    assert list(result.columns) == list(expected.columns)
+
+@pytest.mark.parametrize("weights", weights_cases())
+@pytest.mark.parametrize("k", [1, 3])
+def test_top_k_matches_dense(weights, k):
+    dense = prepare_edges.calculate_correlations(weights, backend="pandas").to_numpy(dtype=np.float64)
+    rows, cols, values = correlation.top_k_correlations(correlation.to_sparse_weights(weights), k, block_size=4)
+    expected = top_k_from_dense(dense, k)
+    found = np.full(expected.shape, -np.inf)
+    for row in range(len(expected)):
+        row_values = np.sort(values[rows == row])[::-1]
+        found[row, :len(row_values)] = row_values
+    assert (np.isfinite(found) == np.isfinite(expected)).all()
+    assert np.allclose(found[np.isfinite(found)], expected[np.isfinite(expected)], atol=1e-6)
+    # with ties, other columns can be picked, but they must have the same correlations
+    assert (rows != cols).all()
+    assert np.allclose(values, dense[rows, cols], atol=1e-6)
+
+def test_zero_variance_rows_are_nan():
+    corr = prepare_edges.calculate_correlations(small_weights(), backend="sparse")
+    for name in ["Moira MacTaggert", "Charles Xavier", "Lockheed", "Cerebro"]:
+        assert corr[name].isna().all()
+    assert corr.loc["Scott Summers", "Jean Grey"] == pytest.approx(1)
@@ -0,0 +1,76 @@
+from benchmarks.corpora import load_table
+from benchmarks.stub_server import pages_from_table, load_pages
+from utils import extract, cache
+import pytest
+import glob
+import zlib
+import os
+
+"""
+The category extractors ("fast" and "lxml") must give the same titles as the full BeautifulSoup parse ("soup"),
+on markup the wiki could throw at them and on saved pages:
+    - the pages of the saved runs (rebuilt from their tables, like the stub wiki serves them)
+    - the real pages in the page cache (cache.DEFAULT_CACHE_DIR), if a run filled it
+    - the pages saved with stub_server.save_pages in $EXTRACT_PAGES_DIR, if it's set
+"""
+
+SAVED_PAGES = 50 # pages of each source
+
+TRICKY_PAGES = {
+    "entities": b'<ul class="categories"><li><span class="name"><a href="/wiki/x" title="Category:Ren&#233;e Majcomb (Earth-616)/Appearances">R</a></span></li>'
+                b'<li><span class="name"><a title="Category:Lockheed &amp; Friends (Earth-616)/Mentions" href="/wiki/y">L</a></span></li></ul>',
+    "more classes, single quotes": b"<div><ul class='categories list'><li><span class='name big'><a href='/wiki/x' title='Category:Ororo Munroe (Earth-616)/Appearances'>S</a></span></li></ul></div>",
+    "two links in a span": b'<ul class="categories"><li><span class="name"><a title="Category:Scott Summers (Earth-616)/Appearances">S</a>'
+                           b'<a title="Category:Ignored (Earth-616)/Mentions">I</a></span></li></ul>',
+    "spans outside the block": b'<span class="name"><a title="Category:Outside (Earth-616)/Appearances">O</a></span>'
+                               b'<ul class="categories"><li><span class="name"><a title="Category:Inside (Earth-616)/Appearances">I</a></span></li></ul>'
+                               b'<ul class="categories"><li><span class="name"><a title="Category:Second block (Earth-616)/Appearances">I</a></span></li></ul>',
+    "link without title": b'<ul class="categories"><li><span class="name"><a href="/wiki/x">X</a></span></li>'
+                          b'<li><span class="name"><a title="Category:Logan (Earth-616)/Appearances">L</a></span></li></ul>',
+    "class that only contains the word": b'<ul class="categories-list"><li><span class="name"><a title="Category:Decoy (Earth-616)/Appearances">D</a></span></li></ul>'
+                                         b'<ul class="page categories"><li><span class="name"><a title="Category:Kitty Pryde (Earth-616)/Appearances">K</a></span></li></ul>',
+    "unquoted class, other attributes": b'<UL data-class="categories" id=cats CLASS=categories><li><span class="name"><a title="Category:Illyana Rasputina (Earth-616)/Mentions">I</a></span></li></ul>',
+    "utf-8": '<ul class="categories"><li><span class="name"><a title="Category:Jean-Paul Beaubier — Northstar (Earth-616)/Appearances">N</a></span></li></ul>'.encode("utf-8"),
+}
+
+def saved_pages() -> dict:
+    """{name: html} of the saved pages that can be found here."""
+    pages = {}
+    for corpus in ["krakoa", "hickman"]:
+        try:
+            table = load_table(corpus)
+        except FileNotFoundError:
+            continue
+        for url, page in list(pages_from_table(table[list(table.columns[:SAVED_PAGES+1])]).items()):
+            pages[f"{corpus}: {url}"] = page
+    for path in sorted(glob.glob(os.path.join(cache.DEFAULT_CACHE_DIR, "*", "*.html.z")))[:SAVED_PAGES]:
+        with open(path, "rb") as f:
+            page = zlib.decompress(f.read())
+        if extract.CATEGORIES_START.search(page):
+            pages[f"cache: {os.path.basename(path)}"] = page
+    if os.environ.get("EXTRACT_PAGES_DIR"):
+        for url, page in list(load_pages(os.environ["EXTRACT_PAGES_DIR"]).items())[:SAVED_PAGES]:
+            pages[f"saved: {url}"] = page
+    return pages
+
+@pytest.fixture(scope="module")
+def soup_titles() -> dict:
+    """{name: (html, titles found by the full BeautifulSoup parse)} of the saved pages."""
+    return {name: (page, extract.extract_with_soup(page)) for name, page in saved_pages().items()}
+
+@pytest.fixture(params=["fast", "lxml"])
+def extractor(request):
+    if request.param == "lxml":
+        pytest.importorskip("lxml.html")
+    return request.param
+
+@pytest.mark.parametrize("case", list(TRICKY_PAGES))
+def test_tricky_markup(extractor, case):
+    page = TRICKY_PAGES[case]
+    assert extract.category_titles(page, extractor) == extract.extract_with_soup(page)
+
+def test_saved_pages(extractor, soup_titles):
+    if not soup_titles:
+        pytest.skip("no saved pages here")
+    different = [name for name, (page, titles) in soup_titles.items() if extract.category_titles(page, extractor) != titles]
+    assert different == []
@@ -0,0 +1,57 @@
+from benchmarks.stub_server import StubWiki, pages_from_table
+from utils import storage, parse_issues
+from utils.incidence import Incidence
+from utils.names import NameTable
+import pandas as pd
+
+"""
+The shared store gets issues from saved tables (already aliased) and from the scraper (raw names):
+a character must end up on one row either way.
+"""
+
+def test_migrated_and_scraped_issues_share_characters(tmp_path):
+    saved = pd.DataFrame({"character name": ["Storm (Ororo Munroe)", "Cyclops (Scott Summers)", "Moira MacTaggert"],
+                          "X-Men Vol 1 94": ["Appearances", "Minor Appearances", "Mentions"]})
+    migrated = storage.AppearanceStore.from_incidence(Incidence.from_table(saved), str(tmp_path / "run"))
+    shared = storage.AppearanceStore(str(tmp_path / "shared"))
+    storage.copy_issues(migrated, shared)
+    
+    names = NameTable()
+    ids, levels = names.parse_titles(["Category:Ororo Munroe (Earth-616)/Appearances",
+                                      "Category:Scott Summers (Earth-616)/Appearances",
+                                      "Category:Moira MacTaggert (Earth-616)/Mentions"])
+    shared.append_issue_ids("X-Men Vol 1 95", ids, levels, names.characters.names)
+    
+    table = shared.select(["X-Men Vol 1 94", "X-Men Vol 1 95"]).to_table()
+    assert table["character name"].is_unique
+    assert sorted(table["character name"]) == sorted(saved["character name"])
+    storm = table.set_index("character name").loc["Storm (Ororo Munroe)"]
+    assert list(storm.astype(str)) == ["Appearances", "Appearances"]
+
+def test_append_issue_resolves_aliases(tmp_path):
+    store = storage.AppearanceStore(str(tmp_path / "store"))
+    store.append_issue("X-Men Vol 1 94", ["Ororo Munroe", "Storm (Ororo Munroe)"], ["Mentions", "Appearances"])
+    table = store.to_table()
+    assert list(table["character name"]) == ["Storm (Ororo Munroe)"]
+    assert table.iloc[0, 1] == "Appearances"
+
+def test_refresh_rewrites_the_issues_that_changed(tmp_path):
+    table = pd.DataFrame({"character name": ["Storm (Ororo Munroe)", "Logan", "Lockheed"],
+                          "X-Men Vol 1 94": ["Appearances", "Mentions", None],
+                          "X-Men Vol 1 95": ["Appearances", None, "Appearances"]})
+    journal = storage.AppearanceStore(str(tmp_path / "journal"))
+    with StubWiki(pages_from_table(table, filler_paragraphs=0), latency=0) as wiki:
+        issue_list = wiki.issue_list(list(table.columns[1:]))
+        parse_issues.scrape_into_journal(issue_list, journal, names=NameTable())
+        assert parse_issues.scrape_into_journal(issue_list, journal, names=NameTable(), refresh=True) == []
+        
+        # the page of the first issue is corrected on the wiki
+        table.loc[1, "X-Men Vol 1 94"] = "Appearances"
+        wiki.pages.update(pages_from_table(table[["character name", "X-Men Vol 1 94"]], filler_paragraphs=0))
+        assert parse_issues.scrape_into_journal(issue_list, journal, names=NameTable()) == []
+        assert parse_issues.scrape_into_journal(issue_list, journal, names=NameTable(), refresh=True) == ["X-Men Vol 1 94"]
+    
+    stored = storage.AppearanceStore(journal.directory).to_table().set_index("character name").astype(str)
+    assert stored.loc["Logan", "X-Men Vol 1 94"] == "Appearances"
+    assert list(stored.loc["Lockheed"]) == ["nan", "Appearances"]
+    assert list(storage.AppearanceStore(journal.directory).issues.names) == ["X-Men Vol 1 94", "X-Men Vol 1 95"]
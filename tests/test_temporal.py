@@ -0,0 +1,42 @@
+from utils import temporal, incremental, prepare_edges
+from utils.incidence import IncidenceBuilder
+import numpy as np
+import pytest
+
+"""
+The windows of the timeline, and the sliding statistics against statistics built from each window's issues.
+"""
+
+@pytest.mark.parametrize("n_issues, window, stride", [(100, 50, 10), (103, 50, 10), (57, 20, 7), (10, 3, 4)])
+def test_windows_reach_the_last_issue(n_issues, window, stride):
+    windows = temporal.windows(n_issues, window, stride)
+    assert windows[0] == (0, window)
+    assert windows[-1] == (n_issues - window, n_issues)
+    assert all(end - start == window for start, end in windows)
+    starts = [start for start, _ in windows]
+    assert starts == sorted(set(starts))
+    assert all(0 < b - a <= stride for a, b in zip(starts, starts[1:]))
+
+def test_windows_of_a_short_run():
+    assert temporal.windows(30, 50, 10) == [(0, 30)]
+
+def test_sliding_stats_match_each_window():
+    rng = np.random.default_rng(0)
+    builder = IncidenceBuilder()
+    for issue in range(23):
+        characters = rng.choice(12, size=5, replace=False)
+        builder.add_issue(f"Issue {issue}", [f"Character {c}" for c in characters],
+                          rng.choice(["Appearances", "Minor Appearances", "Mentions"], size=5))
+    incidence = builder.to_incidence()
+    weights_lookup = prepare_edges.weights_lookup()
+    seen = []
+    for start, end, stats in temporal.sliding_stats(incidence, weights_lookup, window=10, stride=4):
+        expected = incremental.CooccurrenceStats(weights_lookup, incidence.shape[0])
+        by_issue = incidence.matrix.tocsc()
+        for j in range(start, end):
+            column = slice(by_issue.indptr[j], by_issue.indptr[j+1])
+            expected.add_issue(by_issue.indices[column], by_issue.data[column])
+        assert stats.n_issues == end - start
+        assert np.array_equal(stats.type_counts, expected.type_counts)
+        seen.append((start, end))
+    assert seen[-1] == (13, 23)
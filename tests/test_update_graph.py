@@ -0,0 +1,49 @@
+from benchmarks.corpora import load_table
+from benchmarks.stub_server import StubWiki, pages_from_table
+from utils import scrape, storage, incremental, prepare_edges
+from utils.ComicSeries import ComicSeries
+import main
+import pytest
+import os
+
+"""
+make_graph_from_zero then update_graph, on issues of a saved run served by the stub wiki:
+the updated statistics must cover the issues of the first run and the new ones.
+"""
+
+FIRST_ISSUES = 20
+NEW_ISSUES = 5
+
+@pytest.fixture
+def wiki():
+    try:
+        table = load_table("krakoa")
+    except FileNotFoundError:
+        pytest.skip("no saved run here")
+    table = table[list(table.columns[:FIRST_ISSUES + NEW_ISSUES + 1])]
+    with StubWiki(pages_from_table(table, filler_paragraphs=0), latency=0) as wiki:
+        wiki.issues = list(table.columns[1:])
+        yield wiki
+
+def test_update_graph_keeps_the_issues_of_the_first_run(wiki, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # the name table, the logs and the rendered html go there
+    first_run, update = ComicSeries("First run", 1, 1, 1), ComicSeries("Update", 1, 1, 1)
+    issues = {"First run": wiki.issues[:FIRST_ISSUES], "Update": wiki.issues[FIRST_ISSUES:]}
+    monkeypatch.setattr(scrape, "build_full_list_of_issues", lambda series: wiki.issue_list(issues[series[0].title]))
+    store_dir = str(tmp_path / "shared")
+    settings = main.SettingsToTweak()
+    
+    main.make_graph_from_zero([first_run], path="results", title="Test", cache_dir=None, settings=settings, store_dir=store_dir)
+    data_path = os.path.join("results", "Test", "data")
+    assert len(storage.AppearanceStore(os.path.join(data_path, "appearances")).issues) == FIRST_ISSUES
+    
+    main.update_graph([update], path="results", title="Test", cache_dir=None, settings=settings, store_dir=store_dir)
+    stats = incremental.CooccurrenceStats.load(os.path.join(data_path, "cooccurrence.npz"))
+    assert stats.n_issues == FIRST_ISSUES + NEW_ISSUES
+    
+    # same counts as the statistics of every issue, built from scratch
+    shared = storage.AppearanceStore(store_dir)
+    expected = incremental.CooccurrenceStats(prepare_edges.weights_lookup(settings.weights_for_types_of_appearances()))
+    expected.add_from_store(shared)
+    assert expected.n_issues == stats.n_issues
+    assert stats.type_counts.sum() == expected.type_counts.sum()
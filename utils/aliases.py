@@ -114,4 +114,8 @@ ALIASES = {"Ororo Munroe": "Storm (Ororo Munroe)",
            "Stephen Strange": "Doctor Strange",
            "James Braddock Jr.": "Monarch (James Braddock Jr.)",
            "Wanda Maximoff": "Scarlet Witch (Wanda Maximoff)",
-           "Pietro Maximoff": "Quicksilver (Pietro Maximoff)"}
\ No newline at end of file
+           "Pietro Maximoff": "Quicksilver (Pietro Maximoff)"}
+
+def canonical_name(name:str) -> str:
+    """The name a character is shown as: its hero name if it has one, otherwise the name itself."""
+    return ALIASES.get(name, name)
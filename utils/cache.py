@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+"""
+On-disk cache for the pages downloaded from the wiki.
+
+Each page is stored zlib-compressed under the sha256 of its url, next to a small json file with
+its url, ETag, Last-Modified and the time it was downloaded:
+    cache_dir/ab/ab12...ef.html.z
+    cache_dir/ab/ab12...ef.json
+
+- Entries younger than `ttl` seconds are served straight from disk.
+- Older entries are revalidated with a conditional request (If-None-Match / If-Modified-Since),
+  which the wiki answers with an empty 304 if the page didn't change.
+- When the cache grows over `max_size` bytes, the least recently used pages are evicted.
+"""
+
+DEFAULT_CACHE_DIR = "cache/pages"
+DEFAULT_TTL = 7 * 24 * 60 * 60 # one week, in seconds
+DEFAULT_MAX_SIZE = 1024**3     # 1 GB of compressed html
+
+class CacheEntry:
+    """A cached page: the raw html and the headers needed to revalidate it."""
+    def __init__(self, url:str, content:bytes, etag:str=None, last_modified:str=None, fetched_at:float=None):
+        self.url = url
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+    
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+    
+    def conditional_headers(self) -> dict:
+        """Headers that turn a request for this page into a cheap revalidation."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class PageCache:
+    """
+    Compressed html pages on disk, keyed by url. Thread-safe.
+    
+    Usage:
+        cache = PageCache("cache/pages", ttl=24*60*60, max_size=500*1024**2)
+        entry = cache.get(url)
+        if entry is None or cache.is_stale(entry): ...download...
+        cache.put(url, content, etag, last_modified)
+    """
+    def __init__(self, directory:str=DEFAULT_CACHE_DIR, ttl:float=DEFAULT_TTL, max_size:int=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0         # served from disk without a request
+        self.revalidated = 0  # stale, but the server answered 304
+        self.misses = 0       # not in the cache, or changed on the server
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path, _ in self._data_files())
+    
+    def _paths(self, url:str) -> tuple:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        folder = os.path.join(self.directory, key[:2])
+        return os.path.join(folder, key + ".html.z"), os.path.join(folder, key + ".json")
+    
+    def _data_files(self):
+        """Yields (path, last used time) for every page in the cache."""
+        for folder in os.scandir(self.directory):
+            if folder.is_dir():
+                for f in os.scandir(folder.path):
+                    if f.name.endswith(".html.z"):
+                        yield f.path, f.stat().st_mtime
+    
+    def get(self, url:str) -> CacheEntry:
+        """Returns the cached page, or None if it isn't cached. Doesn't count as a hit or miss by itself."""
+        data_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(data_path, "rb") as f:
+                content = zlib.decompress(f.read())
+        except (FileNotFoundError, json.JSONDecodeError, zlib.error):
+            return None # not cached, or half written by a run that crashed
+        os.utime(data_path) # mark as recently used, for the eviction
+        return CacheEntry(url, content, meta.get("etag"), meta.get("last_modified"), meta.get("fetched_at"))
+    
+    def is_stale(self, entry:CacheEntry) -> bool:
+        return entry.age() > self.ttl
+    
+    def put(self, url:str, content:bytes, etag:str=None, last_modified:str=None) -> None:
+        """Stores (or replaces) a page, evicting old pages if the cache is over its size cap."""
+        data_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        compressed = zlib.compress(content, 6)
+        old_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        # write to temporary files first, so a crash never leaves a truncated page behind
+        _atomic_write(data_path, compressed)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()}
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+        with self.lock:
+            self.size += len(compressed) - old_size
+            if self.size > self.max_size:
+                self._evict()
+    
+    def refresh(self, entry:CacheEntry) -> None:
+        """The server said the page didn't change (304): restart its ttl."""
+        _, meta_path = self._paths(entry.url)
+        entry.fetched_at = time.time()
+        meta = {"url": entry.url, "etag": entry.etag, "last_modified": entry.last_modified, "fetched_at": entry.fetched_at}
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+    
+    def _evict(self) -> None:
+        """Deletes the least recently used pages until the cache is back to 90% of its cap. Call with the lock held."""
+        target = self.max_size * 0.9
+        for data_path, _ in sorted(self._data_files(), key=lambda f: f[1]):
+            if self.size <= target:
+                break
+            size = os.path.getsize(data_path)
+            meta_path = data_path[:-len(".html.z")] + ".json"
+            for path in (data_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.size -= size
+            self.evictions += 1
+    
+    def record(self, outcome:str) -> None:
+        """Counts a lookup. outcome is one of "hit", "revalidated" or "miss"."""
+        with self.lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "revalidated":
+                self.revalidated += 1
+            else:
+                self.misses += 1
+    
+    def stats(self) -> dict:
+        """Hit statistics since the cache was opened."""
+        lookups = self.hits + self.revalidated + self.misses
+        return {"hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.revalidated) / lookups if lookups else 0.0,
+                "size_bytes": self.size}
+    
+    def clear(self) -> None:
+        """Deletes every cached page."""
+        with self.lock:
+            for data_path, _ in list(self._data_files()):
+                os.remove(data_path)
+                meta_path = data_path[:-len(".html.z")] + ".json"
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+            self.size = 0
+
+def _atomic_write(path:str, data:bytes) -> None:
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
@@ -0,0 +1,136 @@
+from scipy import sparse
+import numpy as np
+
+"""
+Louvain community detection on a CSR adjacency matrix, with every step vectorized over all the nodes.
+
+Louvain alternates two phases until the modularity stops improving:
+    1. local moving: nodes move to the neighbouring community that increases the modularity the most
+    2. aggregation: every community becomes a single node of a smaller graph (C^T A C)
+
+The classic local moving visits the nodes one by one. Here every node picks its best move at once, from the
+sparse product A C (the weight from each node to each community), and a random subset of the nodes that want to move
+actually moves: if all of them moved together, two neighbours could swap communities forever. When a sweep lowers
+the modularity it's undone and the next sweeps move fewer nodes at a time.
+
+A previous partition can be given as a warm start (e.g. the communities of the graph before some issues were added):
+the first local moving starts from it instead of one community per node, so it only has to fix what changed.
+The random choices come from a seeded generator, so a given graph and seed always give the same partition.
+
+Conventions: A is symmetric, 2m = A.sum(), the degree of a node is its row sum, and
+    modularity = sum over communities c of  in(c) / 2m - resolution * (tot(c) / 2m)^2
+where in(c) sums A over the pairs inside c and tot(c) sums the degrees in c.
+"""
+
+TOLERANCE = 1e-7 # smallest modularity gain that counts as an improvement
+
+def adjacency_from_edges(source:np.ndarray, target:np.ndarray, weights:np.ndarray, n_nodes:int) -> sparse.csr_matrix:
+    """The symmetric float64 CSR adjacency of an undirected edge list (e.g. the arrays of prepare_edges.EdgeArrays)."""
+    rows = np.concatenate([source, target])
+    cols = np.concatenate([target, source])
+    return sparse.csr_matrix((np.concatenate([weights, weights]).astype(np.float64), (rows, cols)), shape=(n_nodes, n_nodes))
+
+def modularity(adjacency:sparse.csr_matrix, labels:np.ndarray, resolution:float=1.0) -> float:
+    total = adjacency.sum()
+    if total == 0:
+        return 0.0
+    labels = np.asarray(labels)
+    coo = adjacency.tocoo()
+    inside = np.bincount(labels[coo.row], weights=coo.data * (labels[coo.row] == labels[coo.col]), minlength=labels.max() + 1)
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    tot = np.bincount(labels, weights=degrees, minlength=labels.max() + 1)
+    return float(inside.sum() / total - resolution * ((tot / total) ** 2).sum())
+
+def relabel(labels:np.ndarray) -> np.ndarray:
+    """Numbers the communities 0, 1, 2... in order of their first node."""
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    return order[inverse]
+
+def one_hot(labels:np.ndarray, n_communities:int) -> sparse.csr_matrix:
+    n = len(labels)
+    return sparse.csr_matrix((np.ones(n), (np.arange(n), labels)), shape=(n, n_communities))
+
+def best_moves(adjacency:sparse.csr_matrix, labels:np.ndarray, degrees:np.ndarray, total:float, resolution:float) -> tuple:
+    """
+    For every node, the community it would gain the most modularity by moving to, and the gain (0 if it should stay).
+    """
+    n = len(labels)
+    n_communities = labels.max() + 1
+    tot = np.bincount(labels, weights=degrees, minlength=n_communities)
+    off_diagonal = adjacency - sparse.diags(adjacency.diagonal())
+    to_communities = (off_diagonal @ one_hot(labels, n_communities)).tocoo() # weight from each node to each community
+    nodes, communities, weights = to_communities.row, to_communities.col, to_communities.data
+    # the node itself doesn't count in the total of its own community
+    own = communities == labels[nodes]
+    scores = weights - resolution * degrees[nodes] * (tot[communities] - own * degrees[nodes]) / total
+    # staying: also for the nodes with no neighbour left in their own community
+    stay = -resolution * degrees * (tot[labels] - degrees) / total
+    stay[nodes[own]] = scores[own]
+    # best community of every node: highest score, then lowest community
+    order = np.lexsort((communities, -scores, nodes))
+    first_of_node = order[np.r_[True, nodes[order][1:] != nodes[order][:-1]]]
+    best = labels.copy()
+    gain = np.zeros(n)
+    best[nodes[first_of_node]] = communities[first_of_node]
+    gain[nodes[first_of_node]] = scores[first_of_node] - stay[nodes[first_of_node]]
+    return best, gain
+
+def local_moving(adjacency:sparse.csr_matrix, labels:np.ndarray, resolution:float, rng:np.random.Generator,
+                 max_sweeps:int=100) -> np.ndarray:
+    """Moves the nodes between communities (all at once, a random part of them at a time) while the modularity improves."""
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    total = adjacency.sum()
+    quality = modularity(adjacency, labels, resolution)
+    moving_fraction = 0.5
+    for _ in range(max_sweeps):
+        best, gain = best_moves(adjacency, labels, degrees, total, resolution)
+        wants_to_move = gain > TOLERANCE * total
+        if not wants_to_move.any() or moving_fraction < 1 / 64:
+            break
+        moves = wants_to_move & (rng.random(len(labels)) < moving_fraction)
+        candidate = np.where(moves, best, labels)
+        new_quality = modularity(adjacency, candidate, resolution)
+        if new_quality > quality + TOLERANCE:
+            labels, quality = candidate, new_quality
+        else:
+            moving_fraction /= 2 # too many neighbours moved together: move fewer at a time
+    return relabel(labels)
+
+def louvain(adjacency:sparse.csr_matrix, partition:np.ndarray=None, resolution:float=1.0, seed:int=0,
+            max_levels:int=20) -> np.ndarray:
+    """
+    Returns the community of every node (numbered in order of their first node).
+    partition: a previous community of every node to start from (any integers, -1 for new nodes), or None.
+    """
+    adjacency = sparse.csr_matrix(adjacency, dtype=np.float64)
+    n = adjacency.shape[0]
+    if n == 0 or adjacency.sum() == 0:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    if partition is None:
+        labels = np.arange(n)
+    else:
+        # new nodes start in a community of their own
+        partition = np.asarray(partition).copy()
+        new = partition < 0
+        partition[new] = partition.max(initial=-1) + 1 + np.arange(new.sum())
+        labels = relabel(partition)
+
+    node_community = np.arange(n) # community of every original node, in the current (aggregated) graph
+    for _ in range(max_levels):
+        start = labels
+        labels = local_moving(adjacency, labels, resolution, rng)
+        node_community = labels[node_community]
+        n_communities = labels.max() + 1
+        if n_communities == adjacency.shape[0] and np.array_equal(start, np.arange(len(start))):
+            break # nothing moved: done
+        # aggregate every community into a node, and start again from one community per node
+        membership = one_hot(labels, n_communities)
+        adjacency = (membership.T @ adjacency @ membership).tocsr()
+        labels = np.arange(n_communities)
+    return relabel(node_community)
+
+def partition_to_labels(nodes:list, partition:dict) -> np.ndarray:
+    """A {node: community} dict (e.g. from a previous run) as an array in the order of nodes (-1 for the missing ones)."""
+    return np.array([partition.get(node, -1) for node in nodes], dtype=np.int64)
@@ -0,0 +1,178 @@
+from scipy import sparse
+import pandas as pd
+import numpy as np
+import json
+import os
+
+"""
+Pearson correlations between characters, computed straight from the sparse characters x issues matrix of weights.
+
+For two characters with weights x and y over the M issues:
+    corr(x, y) = (x.y - sum(x) sum(y) / M) / sqrt((x.x - sum(x)^2 / M) (y.y - sum(y)^2 / M))
+so only the co-appearance products x.y (a sparse product, since most characters never meet)
+and the per-character sums and sums of squares are needed.
+The matrix is stored as float32; the products are accumulated in float64.
+
+Like pandas' DataFrame.corr(), characters whose weight never changes (zero variance) get NaN correlations.
+"""
+
+DEFAULT_BLOCK_SIZE = 256 # rows per block in the top-k mode
+
+def to_sparse_weights(weights) -> sparse.csr_matrix:
+    """Returns the weights as a float32 CSR matrix (characters x issues)."""
+    if isinstance(weights, pd.DataFrame):
+        weights = weights.iloc[:, 1:].to_numpy(dtype=np.float32) # first column is the character name
+    return sparse.csr_matrix(weights, dtype=np.float32)
+
+def row_statistics(matrix:sparse.csr_matrix) -> tuple:
+    """Returns the per-row sums and centered sums of squares (M times the variance), in float64."""
+    n_issues = matrix.shape[1]
+    sums = np.asarray(matrix.sum(axis=1, dtype=np.float64)).ravel()
+    sums_of_squares = np.asarray(matrix.multiply(matrix).sum(axis=1, dtype=np.float64)).ravel()
+    centered = sums_of_squares - sums * sums / n_issues
+    # constant rows have no correlation (up to rounding: a row of 0.7s doesn't quite cancel out)
+    centered[centered <= 1e-12 * np.maximum(sums_of_squares, 1)] = np.nan
+    return sums, centered
+
+def correlation_block(matrix:sparse.csr_matrix, rows:slice, sums:np.ndarray, centered:np.ndarray) -> np.ndarray:
+    """Returns the dense correlations between the given rows and every row of the (float64) matrix."""
+    n_issues = matrix.shape[1]
+    products = (matrix[rows] @ matrix.T).toarray() # sparse co-appearances, densified per block
+    covariance = products - np.outer(sums[rows], sums) / n_issues
+    correlations = covariance / np.sqrt(np.outer(centered[rows], centered))
+    return np.clip(correlations, -1, 1, out=correlations)
+
+def sparse_correlations(matrix:sparse.csr_matrix) -> np.ndarray:
+    """Returns the full N x N correlation matrix of the rows of the matrix."""
+    matrix = matrix.astype(np.float64)
+    sums, centered = row_statistics(matrix)
+    correlations = correlation_block(matrix, slice(0, matrix.shape[0]), sums, centered)
+    np.fill_diagonal(correlations, np.where(np.isnan(centered), np.nan, 1.0))
+    return correlations
+
+def top_k_correlations(matrix:sparse.csr_matrix, k:int, block_size:int=DEFAULT_BLOCK_SIZE) -> tuple:
+    """
+    Returns (rows, cols, correlations) of the k highest correlations of each row (excluding itself), as flat arrays.
+    
+    The rows are processed block_size at a time, so at most block_size x N correlations are held in memory at once.
+    NaN correlations are never selected.
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    matrix = matrix.astype(np.float64)
+    sums, centered = row_statistics(matrix)
+    all_rows, all_cols, all_values = [], [], []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = correlation_block(matrix, slice(start, stop), sums, centered)
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf # not with itself
+        block[np.isnan(block)] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k] if k > 0 else np.empty((stop - start, 0), dtype=int)
+        values = np.take_along_axis(block, top, axis=1)
+        rows = np.repeat(np.arange(start, stop), top.shape[1])
+        keep = np.isfinite(values.ravel())
+        all_rows.append(rows[keep])
+        all_cols.append(top.ravel()[keep])
+        all_values.append(values.ravel()[keep])
+    return (np.concatenate(all_rows).astype(np.int32), np.concatenate(all_cols).astype(np.int32),
+            np.concatenate(all_values).astype(np.float32))
+
+# Out-of-core mode: the correlation matrix is never held in memory, only one tile of it at a time.
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024**2 # bytes
+CSR_FILES = {"indptr": ("indptr.i64", np.int64), "indices": ("indices.i32", np.int32), "data": ("data.f32", np.float32)}
+PAIR_FILES = {"rows": ("rows.i32", np.int32), "cols": ("cols.i32", np.int32), "correlations": ("correlations.f64", np.float64)}
+
+def write_csr(matrix:sparse.csr_matrix, directory:str) -> None:
+    """Writes a float32 CSR matrix as raw arrays (plus its shape), to be memory-mapped by open_csr."""
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+    os.makedirs(directory, exist_ok=True)
+    for attribute, (file_name, dtype) in CSR_FILES.items():
+        getattr(matrix, attribute).astype(dtype).tofile(os.path.join(directory, file_name))
+    with open(os.path.join(directory, "shape.json"), "w") as f:
+        json.dump(list(matrix.shape), f)
+
+def open_csr(directory:str) -> sparse.csr_matrix:
+    """A CSR matrix written by write_csr, whose arrays stay on disk (memory-mapped) until rows are sliced out of it."""
+    with open(os.path.join(directory, "shape.json")) as f:
+        shape = tuple(json.load(f))
+    arrays = {}
+    for attribute, (file_name, dtype) in CSR_FILES.items():
+        path = os.path.join(directory, file_name)
+        arrays[attribute] = np.memmap(path, dtype=dtype, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=dtype)
+    return sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape, copy=False)
+
+def tile_size(n_issues:int, memory_budget:int=DEFAULT_MEMORY_BUDGET, dense:bool=False) -> int:
+    """
+    The number of characters per tile, so that a tile fits in the budget: about three tile x tile float64 arrays
+    (the correlations, a temporary, and the sparse product before it's densified),
+    plus (if dense) two dense float64 blocks of weights (tile x issues).
+    """
+    # 24 t^2 + 16 t m <= budget
+    a, b, c = 24, 16 * n_issues if dense else 0, -memory_budget
+    return max(1, int((-b + np.sqrt(b * b - 4 * a * c)) / (2 * a)))
+
+def tiled_correlations(matrix:sparse.csr_matrix, directory:str, threshold:float,
+                       memory_budget:int=DEFAULT_MEMORY_BUDGET, dense:bool=False) -> int:
+    """
+    Writes every pair of rows (i < j) whose correlation is above the threshold to directory, and returns how many there are.
+    
+    The rows are read a tile at a time (matrix can be memory-mapped, see open_csr), and the pairs of each tile are
+    appended to the files right away (see read_pairs), so the memory used depends on memory_budget,
+    not on the number of characters.
+    The products of a tile are sparse products, which give the same correlations as sparse_correlations.
+    With dense, the tiles are densified and multiplied with BLAS instead: faster when most characters meet,
+    but the rounding differs in the last bits, so exact ties can break the other way.
+    """
+    n, n_issues = matrix.shape
+    size = tile_size(n_issues, memory_budget, dense=dense)
+    # per row statistics, a tile at a time
+    sums, centered = np.empty(n), np.empty(n)
+    for start in range(0, n, size):
+        rows = slice(start, min(start + size, n))
+        sums[rows], centered[rows] = row_statistics(matrix[rows].astype(np.float64))
+    
+    def read_block(rows:slice):
+        block = matrix[rows].astype(np.float64)
+        return block.toarray() if dense else block
+    
+    os.makedirs(directory, exist_ok=True)
+    files = {column: open(os.path.join(directory, file_name), "wb") for column, (file_name, _) in PAIR_FILES.items()}
+    n_pairs = 0
+    try:
+        for row_start in range(0, n, size):
+            rows = slice(row_start, min(row_start + size, n))
+            row_block = read_block(rows)
+            for col_start in range(row_start, n, size):
+                cols = slice(col_start, min(col_start + size, n))
+                col_block = row_block if col_start == row_start else read_block(cols)
+                correlations = row_block @ col_block.T
+                correlations = correlations if dense else correlations.toarray()
+                # same operations as correlation_block, in place to keep at most two tiles in memory
+                correlations -= np.outer(sums[rows], sums[cols]) / n_issues
+                correlations /= np.sqrt(np.outer(centered[rows], centered[cols]))
+                np.clip(correlations, -1, 1, out=correlations)
+                with np.errstate(invalid="ignore"):
+                    above = correlations > threshold # NaN is never above
+                if col_start == row_start:
+                    above = np.triu(above, k=1) # each pair once, and not with itself
+                tile_rows, tile_cols = np.nonzero(above)
+                files["rows"].write((tile_rows + row_start).astype(np.int32).tobytes())
+                files["cols"].write((tile_cols + col_start).astype(np.int32).tobytes())
+                files["correlations"].write(correlations[tile_rows, tile_cols].astype(np.float64).tobytes())
+                n_pairs += len(tile_rows)
+    finally:
+        for f in files.values():
+            f.close()
+    return n_pairs
+
+def read_pairs(directory:str, mmap:bool=True) -> tuple:
+    """(rows, cols, correlations) written by tiled_correlations."""
+    pairs = []
+    for file_name, dtype in PAIR_FILES.values():
+        path = os.path.join(directory, file_name)
+        if mmap and os.path.getsize(path):
+            pairs.append(np.memmap(path, dtype=dtype, mode="r"))
+        else:
+            pairs.append(np.fromfile(path, dtype=dtype))
+    return tuple(pairs)
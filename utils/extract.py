@@ -0,0 +1,104 @@
+from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+import re
+
+"""
+Extractors of the category titles of an issue page (the "ul.categories" block at the bottom of the wiki pages),
+e.g. ["Category:Scott Summers (Earth-616)/Appearances", "Category:Comics", ...].
+
+- "soup":  parses the whole page with BeautifulSoup's html.parser (the original way, slow: the page is ~200kB).
+- "fast":  finds the categories block in the raw bytes and only tokenizes that block.
+- "lxml":  same, but parses the block with lxml. lxml is optional (pip install -r requirements-optional.txt):
+           without it, this extractor raises an ImportError.
+They all return the same titles, in page order.
+"""
+
+# a <ul> whose class attribute has "categories" as one of its (whitespace separated) classes, like class_="categories"
+# in BeautifulSoup: not "categories-list". The tag and attribute names are case-insensitive, the class isn't.
+CATEGORIES_START = re.compile(rb"""<ul\s(?:[^>]*\s)?class\s*=\s*(?:"(?:[^"]*\s)?(?-i:categories)(?:\s[^"]*)?"|"""
+                              rb"""'(?:[^']*\s)?(?-i:categories)(?:\s[^']*)?'|(?-i:categories)(?=[\s/>]))""", re.IGNORECASE)
+CATEGORIES_END = re.compile(rb"</ul\s*>", re.IGNORECASE)
+
+def extract_with_soup(page:bytes) -> list[str]:
+    """Category titles of the page, with a full BeautifulSoup parse."""
+    soup = BeautifulSoup(page, "html.parser")
+    categories = soup.find_all("ul", class_="categories")[0].find_all("span", class_="name")
+    titles = []
+    for c in categories:
+        a_tag = c.find("a")
+        if a_tag is not None and a_tag.get("title") is not None:
+            titles.append(a_tag.get("title"))
+    return titles
+
+def categories_block(page:bytes) -> str:
+    """Returns the html of the first ul.categories of the page, decoded. Raises ValueError if there is none."""
+    start = CATEGORIES_START.search(page)
+    if start is None:
+        raise ValueError("No categories in the page.")
+    end = CATEGORIES_END.search(page, start.end())
+    block = page[start.start():end.end() if end else len(page)]
+    return block.decode("utf-8", errors="replace")
+
+class CategoriesParser(HTMLParser):
+    """Tokenizes the categories block, keeping the title of the first link of every span.name."""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.titles = []
+        self.span_depth = 0     # depth of nested spans inside the current span.name (0: not in one)
+        self.link_found = False # the first <a> of the current span.name was already seen
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == "span":
+            if self.span_depth:
+                self.span_depth += 1
+            elif "name" in (dict(attrs).get("class") or "").split():
+                self.span_depth = 1
+                self.link_found = False
+        elif tag == "a" and self.span_depth and not self.link_found:
+            self.link_found = True
+            title = dict(attrs).get("title")
+            if title is not None:
+                self.titles.append(title)
+    
+    def handle_endtag(self, tag):
+        if tag == "span" and self.span_depth:
+            self.span_depth -= 1
+
+def extract_fast(page:bytes) -> list[str]:
+    """Category titles of the page, tokenizing only the categories block."""
+    parser = CategoriesParser()
+    parser.feed(categories_block(page))
+    parser.close()
+    return parser.titles
+
+def extract_with_lxml(page:bytes) -> list[str]:
+    """Category titles of the page, parsing only the categories block with lxml."""
+    try:
+        import lxml.html
+    except ImportError as error:
+        raise ImportError("The lxml extractor needs lxml (pip install -r requirements-optional.txt), "
+                          "or use the \"fast\" extractor.") from error
+    block = lxml.html.fragment_fromstring(categories_block(page), create_parent="div")
+    titles = []
+    for span in block.xpath(".//ul[1]//span[contains(concat(' ', normalize-space(@class), ' '), ' name ')]"):
+        links = span.xpath(".//a")
+        if links and links[0].get("title") is not None:
+            titles.append(links[0].get("title"))
+    return titles
+
+EXTRACTORS = {"soup": extract_with_soup,
+              "fast": extract_fast,
+              "lxml": extract_with_lxml}
+DEFAULT_EXTRACTOR = "fast"
+
+def available_extractors() -> list[str]:
+    """The extractors that can run here (lxml is optional)."""
+    try:
+        import lxml.html
+        return list(EXTRACTORS)
+    except ImportError:
+        return [name for name in EXTRACTORS if name != "lxml"]
+
+def category_titles(page:bytes, extractor:str=DEFAULT_EXTRACTOR) -> list[str]:
+    """Returns the category titles of the page, with the given extractor (a key of EXTRACTORS)."""
+    return EXTRACTORS[extractor](page)
@@ -0,0 +1,214 @@
+from utils import aliases
+from pandas.api.types import CategoricalDtype
+from array import array
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+"""
+Sparse storage of who appears in which issue.
+
+Instead of merging every issue into a wide DataFrame as it's scraped, the appearances are collected as
+(character id, issue id, level) triples, with the names interned to integer ids. The wide
+table_of_appearances is only built when asked for.
+The characters are interned under the name they're shown as (aliases.canonical_name), so a character has one id
+whether it comes from a scraped page (raw name) or a saved table (hero name).
+
+The level of an appearance is its code in TYPE_OF_APPEARANCE plus one, so that 0 means "not in the issue":
+    0: no appearance, 1: Mentions, 2: Minor Appearances, 3: Appearances
+"""
+
+TYPE_OF_APPEARANCE = CategoricalDtype(categories=["Mentions", "Minor Appearances", "Appearances"], ordered=True)
+NO_APPEARANCE = 0
+LEVELS = {type_of_appearance: code + 1 for code, type_of_appearance in enumerate(TYPE_OF_APPEARANCE.categories)}
+
+class Interner:
+    """Gives every distinct name an integer id, in order of first sight."""
+    def __init__(self, names:list[str]=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.id_of(name)
+    
+    def id_of(self, name:str) -> int:
+        """Returns the id of the name, giving it a new one if it's the first time it's seen."""
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def __contains__(self, name:str) -> bool:
+        return name in self.ids
+
+class IdTranslation:
+    """
+    Maps the ids of shared name tables (see the names module, or the characters of another store) to the ids of
+    an Interner, interning each name (as aliases.canonical_name) the first time its id is seen. Only new ids cost a string lookup.
+    """
+    def __init__(self, interner:Interner):
+        self.interner = interner
+        self.tables = {} # id of the list of names -> (the list, the id in the Interner of each of its ids, -1 if not seen yet)
+    
+    def __call__(self, ids:np.ndarray, names:list[str]) -> np.ndarray:
+        """ids: ids in a shared table, names: its list of names. Returns the ids in the Interner."""
+        ids = np.asarray(ids, dtype=np.int32)
+        table = self.tables.get(id(names))
+        if table is None or table[0] is not names:
+            table = self.tables[id(names)] = (names, np.zeros(0, dtype=np.int32))
+        local_ids = table[1]
+        if len(ids) == 0:
+            return ids
+        if ids.max() >= len(local_ids):
+            grown = np.full(max(ids.max() + 1, 2 * len(local_ids)), -1, dtype=np.int32)
+            grown[:len(local_ids)] = local_ids
+            local_ids = grown
+            self.tables[id(names)] = (names, local_ids)
+        for i in ids[local_ids[ids] < 0]:
+            if local_ids[i] < 0: # could be listed twice in the same issue
+                local_ids[i] = self.interner.id_of(aliases.canonical_name(names[i]))
+        return local_ids[ids]
+
+class IncidenceBuilder:
+    """
+    Accumulates the appearances of each issue, one issue at a time.
+    
+    Usage:
+        builder = IncidenceBuilder()
+        builder.add_issue("X-Men Vol 1 94", ["Scott Summers", "Ororo Munroe"], ["Appearances", "Mentions"])
+        table = builder.to_table()
+    """
+    def __init__(self):
+        self.characters = Interner()
+        self.issues = Interner()
+        self.rows = array("i")   # character ids
+        self.cols = array("i")   # issue ids
+        self.levels = array("b") # see LEVELS
+        self.translation = IdTranslation(self.characters)
+    
+    def add_issue(self, issue_name:str, character_names, types_of_appearance) -> None:
+        """
+        Records the characters of an issue with their type of appearance.
+        Types that aren't in TYPE_OF_APPEARANCE (or missing) are ignored, but the character still gets a row.
+        """
+        issue_id = self.issues.id_of(issue_name)
+        for name, type_of_appearance in zip(character_names, types_of_appearance):
+            character_id = self.characters.id_of(aliases.canonical_name(name))
+            level = LEVELS.get(type_of_appearance, NO_APPEARANCE)
+            if level != NO_APPEARANCE:
+                self.rows.append(character_id)
+                self.cols.append(issue_id)
+                self.levels.append(level)
+    
+    def add_issue_ids(self, issue_name:str, ids:np.ndarray, levels:np.ndarray, names:list[str]) -> None:
+        """
+        Same as add_issue, with the characters given as ids of a shared name table (names: its list of names)
+        and their levels, as returned by names.NameTable.parse_titles.
+        """
+        issue_id = self.issues.id_of(issue_name)
+        rows = self.translation(ids, names)
+        levels = np.asarray(levels, dtype=np.int8)
+        appears = levels != NO_APPEARANCE
+        self.rows.extend(rows[appears].tolist())
+        self.cols.extend([issue_id] * int(appears.sum()))
+        self.levels.extend(levels[appears].tolist())
+    
+    def add_issue_table(self, issue_table:pd.DataFrame) -> None:
+        """Records an issue table as returned by parse_issues.build_issue_table."""
+        issue_name = issue_table.columns[-1]
+        self.add_issue(issue_name, issue_table["character name"], issue_table[issue_name])
+    
+    def to_csr(self) -> sparse.csr_matrix:
+        """
+        Returns the characters x issues matrix of levels.
+        If a character is listed more than once in an issue, the highest type of appearance wins.
+        """
+        shape = (len(self.characters), len(self.issues))
+        rows = np.frombuffer(self.rows, dtype=np.int32)
+        cols = np.frombuffer(self.cols, dtype=np.int32)
+        levels = np.frombuffer(self.levels, dtype=np.int8)
+        rows, cols, levels = keep_highest_level(rows, cols, levels, shape[1])
+        return sparse.csr_matrix((levels, (rows, cols)), shape=shape, dtype=np.int8)
+    
+    def to_incidence(self) -> "Incidence":
+        return Incidence(list(self.characters.names), list(self.issues.names), self.to_csr())
+    
+    def to_table(self) -> pd.DataFrame:
+        """Returns the wide table_of_appearances (one row per character, one column per issue)."""
+        return self.to_incidence().to_table()
+
+class Incidence:
+    """
+    The characters x issues matrix of levels, with the names of the rows and columns.
+    """
+    def __init__(self, characters:list[str], issues:list[str], matrix:sparse.csr_matrix):
+        self.characters = characters
+        self.issues = issues
+        self.matrix = matrix
+    
+    @property
+    def shape(self) -> tuple:
+        return self.matrix.shape
+    
+    def select_issues(self, issues:list[str]) -> "Incidence":
+        """
+        Returns the incidence of the given issues only, in that order.
+        Characters that don't appear in any of them are dropped, unless every issue is selected.
+        """
+        issues = list(dict.fromkeys(issues))
+        position = {issue: j for j, issue in enumerate(self.issues)}
+        missing = [issue for issue in issues if issue not in position]
+        if missing:
+            raise KeyError(f"Issues not in the incidence matrix: {missing[:5]}")
+        matrix = self.matrix[:, [position[issue] for issue in issues]]
+        if len(issues) == len(self.issues):
+            return Incidence(self.characters, issues, matrix.tocsr())
+        keep = np.flatnonzero(matrix.getnnz(axis=1))
+        return Incidence([self.characters[i] for i in keep], issues, matrix[keep].tocsr())
+    
+    def dense_levels(self) -> np.ndarray:
+        """The levels as a dense int8 array."""
+        return self.matrix.toarray()
+    
+    def to_table(self) -> pd.DataFrame:
+        """Returns the wide table_of_appearances, with the types of appearance as TYPE_OF_APPEARANCE categoricals."""
+        levels = self.dense_levels()
+        columns = {"character name": pd.Series(self.characters, dtype="object")}
+        for j, issue in enumerate(self.issues):
+            columns[issue] = pd.Categorical.from_codes(levels[:, j].astype(np.int8) - 1, dtype=TYPE_OF_APPEARANCE)
+        return pd.DataFrame(columns)
+    
+    @classmethod
+    def from_table(cls, table:pd.DataFrame) -> "Incidence":
+        """Reads a wide table_of_appearances (e.g. loaded from a csv)."""
+        levels = levels_of_table(table)
+        return cls(list(table["character name"]), list(table.columns[1:]), sparse.csr_matrix(levels))
+
+def keep_highest_level(rows:np.ndarray, cols:np.ndarray, levels:np.ndarray, n_cols:int) -> tuple:
+    """Drops the duplicated (row, col) pairs, keeping the highest level of each."""
+    keys = rows.astype(np.int64) * n_cols + cols
+    order = np.lexsort((levels, keys)) # by key, then by level
+    keys = keys[order]
+    last_of_each_key = np.ones(len(keys), dtype=bool)
+    last_of_each_key[:-1] = keys[1:] != keys[:-1]
+    keep = order[last_of_each_key]
+    return rows[keep], cols[keep], levels[keep]
+
+def levels_of_table(table:pd.DataFrame) -> np.ndarray:
+    """
+    Converts the types of appearance of a wide table (strings or TYPE_OF_APPEARANCE categoricals) to an int8 array of levels.
+    Anything that isn't a known type of appearance becomes NO_APPEARANCE.
+    """
+    columns = [table[issue] for issue in table.columns[1:]]
+    if all(column.dtype == TYPE_OF_APPEARANCE for column in columns):
+        # already categorical (e.g. straight from build_full_table): just read the codes, no strings involved
+        levels = np.empty((len(table), len(columns)), dtype=np.int8)
+        for j, column in enumerate(columns):
+            levels[:, j] = column.cat.codes.to_numpy() + 1
+        return levels
+    values = table.iloc[:, 1:].to_numpy(dtype=object)
+    codes = pd.Categorical(values.ravel(), dtype=TYPE_OF_APPEARANCE).codes
+    return (codes + 1).astype(np.int8).reshape(values.shape)
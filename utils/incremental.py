@@ -0,0 +1,188 @@
+from utils.incidence import LEVELS
+from utils.storage import AppearanceStore
+from scipy import sparse
+import pandas as pd
+import numpy as np
+import os
+
+"""
+Sufficient statistics of the correlations, updated one issue at a time.
+
+For every character i (weights x_i over the issues) and pair of characters (i, j), keeps:
+    - the number of issues M
+    - sum(x_i) and sum(x_i^2)
+    - the co-appearance products x_i . x_j (sparse: only pairs that met)
+    - the number of appearances of each type (what count_types_of_appearances returns)
+Adding (or removing) an issue with k characters costs O(k^2), whatever the size of the corpus.
+The correlations of any set of characters follow from these (see correlation.py for the formula),
+without going back to the issues.
+"""
+
+ZERO_TOLERANCE = 1e-9 # far under the product of any two weights of appearances
+MAX_PENDING = 1_000_000 # products kept aside before merging them into the sparse matrix (16 bytes each)
+TYPE_COLUMNS = {level: type_of_appearance for type_of_appearance, level in LEVELS.items()}
+
+class CooccurrenceStats:
+    def __init__(self, weights_lookup:np.ndarray, n_characters:int=0):
+        """weights_lookup: the weight of each level of appearance (see prepare_edges.weights_lookup)."""
+        self.weights_lookup = np.asarray(weights_lookup, dtype=np.float64)
+        self.n_issues = 0
+        self.sums = np.zeros(n_characters)
+        self.sums_of_squares = np.zeros(n_characters)
+        self.type_counts = np.zeros((n_characters, len(self.weights_lookup)), dtype=np.int32) # column = level
+        self.products = sparse.csr_matrix((n_characters, n_characters))
+        self.pending = [] # (rows, cols, values) of products not yet merged into self.products
+        self.n_pending = 0
+        self.affected = set() # characters whose statistics changed since the last call to pop_affected
+    
+    @property
+    def n_characters(self) -> int:
+        return len(self.sums)
+    
+    def grow(self, n_characters:int) -> None:
+        """Makes room for new characters (ids up to n_characters - 1)."""
+        extra = n_characters - self.n_characters
+        if extra <= 0:
+            return
+        self.sums = np.concatenate([self.sums, np.zeros(extra)])
+        self.sums_of_squares = np.concatenate([self.sums_of_squares, np.zeros(extra)])
+        self.type_counts = np.vstack([self.type_counts, np.zeros((extra, self.type_counts.shape[1]), dtype=np.int32)])
+        self.products.resize((n_characters, n_characters))
+    
+    def add_issue(self, character_ids:np.ndarray, levels:np.ndarray) -> None:
+        """Adds an issue, given as the ids of its characters and their levels of appearance."""
+        self._update(np.asarray(character_ids), np.asarray(levels), sign=1)
+    
+    def remove_issue(self, character_ids:np.ndarray, levels:np.ndarray) -> None:
+        """Takes out an issue that was added (e.g. when it leaves a sliding window, see the temporal module)."""
+        self._update(np.asarray(character_ids), np.asarray(levels), sign=-1)
+    
+    def _update(self, character_ids:np.ndarray, levels:np.ndarray, sign:int) -> None:
+        if len(character_ids):
+            self.grow(character_ids.max() + 1)
+        weights = self.weights_lookup[levels]
+        self.n_issues += sign
+        np.add.at(self.sums, character_ids, sign * weights)
+        np.add.at(self.sums_of_squares, character_ids, sign * weights * weights)
+        np.add.at(self.type_counts, (character_ids, levels), sign)
+        # every pair of characters in the issue (k^2 products)
+        rows = np.repeat(character_ids, len(character_ids))
+        cols = np.tile(character_ids, len(character_ids))
+        self.pending.append((rows, cols, sign * np.outer(weights, weights).ravel()))
+        self.n_pending += len(rows)
+        self.affected.update(character_ids.tolist())
+        # merged every MAX_PENDING products, so that streaming many issues in doesn't keep them all
+        if self.n_pending >= MAX_PENDING:
+            self._flush()
+    
+    def add_from_store(self, store:AppearanceStore, first_issue:int=None) -> list[int]:
+        """
+        Adds the issues of a store, from first_issue (default: the ones not added yet, assuming
+        the store's issues were added in order). Returns the ids of the issues added.
+        """
+        if first_issue is None:
+            first_issue = self.n_issues
+        columns = store.columns()
+        starts = [0] + store.issue_ends[:-1]
+        added = []
+        for issue_id in range(first_issue, len(store.issues)):
+            rows = slice(starts[issue_id], store.issue_ends[issue_id])
+            self.add_issue(np.asarray(columns["character_id"][rows]), np.asarray(columns["level"][rows]))
+            added.append(issue_id)
+        self.grow(len(store.characters)) # characters that never made it into an appearance
+        return added
+    
+    def _flush(self) -> None:
+        """Merges the pending products into the sparse matrix."""
+        if not self.pending:
+            return
+        rows, cols, values = (np.concatenate(parts) for parts in zip(*self.pending))
+        shape = (self.n_characters, self.n_characters)
+        self.products = (self.products + sparse.csr_matrix((values, (rows, cols)), shape=shape)).tocsr()
+        # products of pairs whose issues were all removed are back to zero, up to rounding
+        self.products.data[np.abs(self.products.data) < ZERO_TOLERANCE] = 0
+        self.products.eliminate_zeros()
+        self.pending = []
+        self.n_pending = 0
+    
+    def pop_affected(self) -> set:
+        """Returns the characters whose statistics changed since the last call, and forgets them."""
+        affected, self.affected = self.affected, set()
+        return affected
+    
+    def correlations(self, character_ids:np.ndarray) -> np.ndarray:
+        """
+        Returns the correlation matrix of the given characters over all the issues added.
+        Same values as correlation.sparse_correlations on their weights (NaN for zero variance).
+        """
+        self._flush()
+        character_ids = np.asarray(character_ids)
+        products = self.products[character_ids][:, character_ids].toarray()
+        sums = self.sums[character_ids]
+        centered = self.sums_of_squares[character_ids] - sums * sums / self.n_issues
+        centered[centered <= 1e-12 * np.maximum(self.sums_of_squares[character_ids], 1)] = np.nan
+        corr = (products - np.outer(sums, sums) / self.n_issues) / np.sqrt(np.outer(centered, centered))
+        np.clip(corr, -1, 1, out=corr)
+        np.fill_diagonal(corr, np.where(np.isnan(centered), np.nan, 1.0))
+        return corr
+    
+    def pair_correlations(self, character_ids:np.ndarray) -> tuple:
+        """
+        Returns (rows, cols, correlations) of the pairs of the given characters that met in at least one issue
+        (rows < cols, as positions in character_ids), without the matrix of all the pairs.
+        Same values as correlations: the pairs that never met have a correlation of 0 or less.
+        """
+        self._flush()
+        character_ids = np.asarray(character_ids)
+        products = sparse.triu(self.products[character_ids][:, character_ids], k=1).tocoo()
+        rows, cols = products.row.astype(np.int32), products.col.astype(np.int32)
+        sums = self.sums[character_ids]
+        centered = self.sums_of_squares[character_ids] - sums * sums / self.n_issues
+        centered[centered <= 1e-12 * np.maximum(self.sums_of_squares[character_ids], 1)] = np.nan
+        corr = (products.data - sums[rows] * sums[cols] / self.n_issues) / np.sqrt(centered[rows] * centered[cols])
+        np.clip(corr, -1, 1, out=corr)
+        known = ~np.isnan(corr)
+        return rows[known], cols[known], corr[known]
+    
+    def character_stats(self, names:list[str], sort:bool=True) -> pd.DataFrame:
+        """Returns the same table as process_appearances.count_types_of_appearances, from the counts."""
+        characters = pd.DataFrame({"character name": pd.Series(names, dtype="object")})
+        for level in sorted(TYPE_COLUMNS, reverse=True):
+            characters[TYPE_COLUMNS[level]] = self.type_counts[:len(names), level].astype(np.int64)
+        characters["Total Appearances (Full and Minor)"] = characters["Appearances"] + characters["Minor Appearances"]
+        characters["Appearances and Mentions (Full + Minor + Mentions)"] = characters["Total Appearances (Full and Minor)"] + characters["Mentions"]
+        if sort:
+            characters.sort_values(by="Appearances", ascending=False, inplace=True)
+        return characters
+    
+    def save(self, path:str) -> None:
+        """Saves the statistics to a .npz file."""
+        self._flush()
+        np.savez_compressed(path, weights_lookup=self.weights_lookup, n_issues=self.n_issues,
+                            sums=self.sums, sums_of_squares=self.sums_of_squares, type_counts=self.type_counts,
+                            products_data=self.products.data, products_indices=self.products.indices,
+                            products_indptr=self.products.indptr)
+    
+    @classmethod
+    def load(cls, path:str) -> "CooccurrenceStats":
+        with np.load(path) as f:
+            stats = cls(f["weights_lookup"])
+            stats.n_issues = int(f["n_issues"])
+            stats.sums, stats.sums_of_squares, stats.type_counts = f["sums"], f["sums_of_squares"], f["type_counts"]
+            n = len(stats.sums)
+            stats.products = sparse.csr_matrix((f["products_data"], f["products_indices"], f["products_indptr"]), shape=(n, n))
+        return stats
+
+def load_or_build(path:str, store:AppearanceStore, weights_lookup:np.ndarray) -> "CooccurrenceStats":
+    """
+    Loads the statistics saved in path and adds the issues appended to the store since they were saved.
+    If there are none (or they were made with other weights), builds them from the whole store.
+    """
+    if os.path.exists(path):
+        stats = CooccurrenceStats.load(path)
+        if np.allclose(stats.weights_lookup, weights_lookup, equal_nan=True) and stats.n_issues <= len(store.issues):
+            stats.add_from_store(store)
+            return stats
+    stats = CooccurrenceStats(weights_lookup)
+    stats.add_from_store(store)
+    return stats
@@ -0,0 +1,288 @@
+from contextlib import contextmanager
+import pandas as pd
+import numpy as np
+import threading
+import tracemalloc
+import cProfile
+import pstats
+import argparse
+import datetime
+import json
+import time
+import sys
+import os
+try:
+    import resource # not on Windows
+except ImportError:
+    resource = None
+
+"""
+What a run spent its time and memory on, to compare the nightly rebuilds with each other.
+
+    - StageTracker: time and memory of every stage of a run (the pipeline records its stages with one).
+      Every stage gets the resident memory of the process after it and the peak of the process so far (cheap).
+      Stages can also be profiled, one by one: "cprofile" (saved to <stage>.prof, for pstats or snakeviz)
+      or "tracemalloc" (peak of the python and numpy allocations during the stage, and the lines that allocated the most).
+    - FetchStats: latency histogram, status codes, retries and failures of the requests sent to the wiki
+      (scrape.download records every request in scrape.FETCH_STATS).
+    - run_report / write_run_report: the stages, the requests and the page cache of a run, as json (and the stages as csv),
+      in a folder of reports. compare_reports lists what got slower or bigger since an earlier report.
+
+    python -m utils.instrumentation "results/Krakoa Era/data/reports"   (compares the last two reports)
+"""
+
+PROFILERS = ("cprofile", "tracemalloc")
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # upper bounds, in seconds (the last bucket has the slower ones)
+TOP_ALLOCATIONS = 20 # lines written to the tracemalloc profile of a stage
+
+def resident_memory() -> float:
+    """Resident memory of the process, in MB (NaN where it can't be read)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, AttributeError):
+        return np.nan
+
+def peak_resident_memory() -> float:
+    """Highest resident memory of the process since it started, in MB (NaN where it can't be read)."""
+    if resource is None:
+        return np.nan
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+class StageTracker:
+    """
+    Usage:
+        tracker = StageTracker(profile={"corr": "cprofile"}, profile_dir="results/X-Men/data/reports")
+        with tracker.stage("stats"):
+            ...
+        tracker.print_report()
+    
+    Every stage gets its time, the resident memory after it (rss_mb) and the peak resident memory of the process
+    so far (max_rss_mb). With track_memory, or for the stages profiled with "tracemalloc", peak_mb is the most memory
+    allocated at once while the stage ran, over what was allocated when it started (tracemalloc slows down the
+    allocations, so it's off by default).
+    """
+    def __init__(self, track_memory:bool=False, profile:dict=None, profile_dir:str=None):
+        """profile: {stage: "cprofile" or "tracemalloc"}, the stages to profile (written to profile_dir)."""
+        profile = profile or {}
+        for name, profiler in profile.items():
+            if profiler not in PROFILERS:
+                raise ValueError(f"Unknown profiler for stage {name}: {profiler} (use one of {PROFILERS})")
+        if profile and profile_dir is None:
+            raise ValueError("Profiling a stage needs a profile_dir to write it to.")
+        self.track_memory = track_memory
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.report = []
+    
+    @contextmanager
+    def stage(self, name:str):
+        profiler = self.profile.get(name)
+        traced = self.track_memory or profiler == "tracemalloc"
+        started_tracing = traced and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if traced:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+        if profiler == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak, profile_path = None, None
+            if profiler == "cprofile":
+                profile.disable()
+                profile_path = self._profile_path(name, "prof")
+                profile.dump_stats(profile_path)
+            if traced:
+                _, peak = tracemalloc.get_traced_memory()
+                peak = (peak - before) / 1024**2
+            if profiler == "tracemalloc":
+                profile_path = self._profile_path(name, "tracemalloc.txt")
+                top = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+                with open(profile_path, "w", encoding="utf-8") as f:
+                    f.write("".join(f"{line}\n" for line in top))
+            if started_tracing:
+                tracemalloc.stop()
+            self.report.append({"stage": name, "seconds": elapsed, "peak_mb": peak, "rss_mb": resident_memory(),
+                                "max_rss_mb": peak_resident_memory(), "profile": profile_path})
+    
+    def _profile_path(self, name:str, extension:str) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return os.path.join(self.profile_dir, f"{name}.{extension}")
+    
+    def report_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.report, columns=["stage", "seconds", "peak_mb", "rss_mb", "max_rss_mb", "profile"])
+    
+    def print_report(self) -> None:
+        for row in self.report_frame().itertuples():
+            peak = "" if pd.isna(row.peak_mb) else f"  peak {row.peak_mb:8.1f}MB"
+            print(f"  {row.stage:>10}: {row.seconds:8.3f}s  rss {row.rss_mb:8.1f}MB{peak}")
+
+def print_profile(path:str, top:int=20) -> None:
+    """Prints the functions that took the most time (cumulated) in a stage profiled with cprofile."""
+    pstats.Stats(path).sort_stats("cumulative").print_stats(top)
+
+class FetchStats:
+    """
+    Counts the requests sent to the wiki: their latency, status codes, retries and failures. Thread-safe.
+    A retry is a request sent again after a bad response; a failure is a page given up on after all its retries.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self) -> None:
+        with self.lock:
+            self.latencies = []
+            self.status_codes = {}
+            self.retries = 0
+            self.failures = 0
+    
+    def record_request(self, seconds:float, status_code:int) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+    
+    def record_retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+    
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+    
+    def histogram(self) -> dict:
+        """Number of requests per latency bucket, e.g. {"<=0.25s": 120, ..., ">10s": 1}."""
+        with self.lock:
+            latencies = np.array(self.latencies)
+        counts = np.bincount(np.searchsorted(LATENCY_BUCKETS, latencies, side="left"), minlength=len(LATENCY_BUCKETS) + 1)
+        labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        return dict(zip(labels, counts.tolist()))
+    
+    def stats(self) -> dict:
+        """The number of requests, retries and failures, the status codes, and the latencies (percentiles and histogram)."""
+        with self.lock:
+            latencies = np.array(self.latencies)
+            status_codes = {str(code): count for code, count in sorted(self.status_codes.items())}
+            retries, failures = self.retries, self.failures
+        percentiles = np.percentile(latencies, [50, 90, 99]).tolist() if len(latencies) else [np.nan] * 3
+        return {"requests": len(latencies), "retries": retries, "failures": failures, "status_codes": status_codes,
+                "latency_mean": float(latencies.mean()) if len(latencies) else np.nan,
+                "latency_p50": percentiles[0], "latency_p90": percentiles[1], "latency_p99": percentiles[2],
+                "latency_max": float(latencies.max()) if len(latencies) else np.nan,
+                "latency_histogram": self.histogram()}
+
+def run_report(stages:pd.DataFrame, fetches:FetchStats=None, cache=None, **metadata) -> dict:
+    """
+    The report of a run: metadata (e.g. title, number of issues), the stages (a report_frame), the requests
+    and the page cache (a scrape.PageCache, or None if it wasn't used).
+    """
+    return {"started": datetime.datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S-%f"), **metadata,
+            "stages": stages.to_dict("records"),
+            "fetches": fetches.stats() if fetches is not None else None,
+            "cache": cache.stats() if cache is not None else None}
+
+def write_run_report(report:dict, directory:str) -> str:
+    """
+    Writes the report to directory/run_<timestamp>.json, and its stages to run_<timestamp>.csv
+    (run_<timestamp>_<n> if a report with that timestamp is already there: never over another run's report).
+    Returns the path of the json.
+    """
+    os.makedirs(directory, exist_ok=True)
+    base_path = os.path.join(directory, f"run_{report['started']}")
+    path, n = base_path, 0
+    while True:
+        try:
+            with open(path + ".json", "x", encoding="utf-8") as f:
+                f.write(to_json(report))
+            break
+        except FileExistsError:
+            n += 1
+            path = f"{base_path}_{n}"
+    pd.DataFrame(report["stages"]).to_csv(path + ".csv", index=False)
+    return path + ".json"
+
+def to_json(report:dict) -> str:
+    """The report as json, with the NaNs as null."""
+    def clean(value):
+        if isinstance(value, dict):
+            return {key: clean(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [clean(item) for item in value]
+        if isinstance(value, (float, np.floating)):
+            return None if np.isnan(value) else float(value)
+        if isinstance(value, np.integer):
+            return int(value)
+        return value
+    return json.dumps(clean(report), indent=1)
+
+def load_reports(directory:str) -> list[dict]:
+    """The reports written to directory, from the oldest to the newest."""
+    if not os.path.exists(directory):
+        return []
+    reports = []
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.startswith("run_") and file_name.endswith(".json"):
+            with open(os.path.join(directory, file_name), encoding="utf-8") as f:
+                reports.append(json.load(f))
+    # by time (the older reports have their timestamps to the second only)
+    return sorted(reports, key=lambda report: report["started"])
+
+def compare_reports(previous:dict, report:dict, tolerance:float=1.5, min_seconds:float=0.5, min_mb:float=10) -> pd.DataFrame:
+    """
+    The stages of report that took more than tolerance times the time (or memory) of the same stage in previous.
+    Stages under min_seconds (or min_mb) in both are left out: their noise is bigger than they are.
+    Cache hits are only compared with cache hits, and the rest with the rest.
+    """
+    def frame(r:dict) -> pd.DataFrame:
+        stages = pd.DataFrame(r["stages"])
+        if "outcome" not in stages:
+            stages["outcome"] = None
+        stages["outcome"] = stages["outcome"].map(lambda outcome: "hit" if outcome == "hit" else "run")
+        return stages.drop_duplicates(["stage", "outcome"], keep="last").set_index(["stage", "outcome"])
+    before, after = frame(previous), frame(report)
+    common = before.index.intersection(after.index)
+    rows = []
+    for measure, minimum in [("seconds", min_seconds), ("peak_mb", min_mb), ("rss_mb", min_mb)]:
+        if measure not in before or measure not in after:
+            continue
+        old, new = before.loc[common, measure].astype(float), after.loc[common, measure].astype(float)
+        worse = (new > tolerance * old) & (np.maximum(old, new) >= minimum)
+        for (stage, outcome), old_value, new_value in zip(common[worse], old[worse], new[worse]):
+            rows.append({"stage": stage, "outcome": outcome, "measure": measure, "before": old_value, "after": new_value,
+                         "ratio": new_value / old_value if old_value else np.inf})
+    return pd.DataFrame(rows, columns=["stage", "outcome", "measure", "before", "after", "ratio"])
+
+def report_regressions(directory:str, report:dict, tolerance:float=1.5) -> pd.DataFrame:
+    """Compares the report with the last one written to directory before it, and prints what got worse."""
+    earlier = [r for r in load_reports(directory) if r["started"] < report["started"]]
+    if not earlier:
+        return compare_reports(report, report)
+    regressions = compare_reports(earlier[-1], report, tolerance=tolerance)
+    for row in regressions.itertuples():
+        print(f"  Regression since {earlier[-1]['started']}: {row.stage} ({row.outcome}) {row.measure} "
+              f"{row.before:.2f} -> {row.after:.2f} (x{row.ratio:.1f})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the last two run reports of a folder.")
+    parser.add_argument("directory")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+    reports = load_reports(args.directory)
+    if len(reports) < 2:
+        print(f"Need two reports in {args.directory} to compare them ({len(reports)} found).")
+        return
+    regressions = compare_reports(reports[-2], reports[-1], tolerance=args.tolerance)
+    print(f"{reports[-2]['started']} -> {reports[-1]['started']}")
+    print(regressions.to_string(index=False) if len(regressions) else "No regressions.")
+
+if __name__ == "__main__":
+    main()
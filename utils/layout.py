@@ -0,0 +1,216 @@
+from utils import communities
+from scipy import sparse
+import numpy as np
+import hashlib
+import json
+import os
+
+"""
+Positions of the nodes, computed before writing the html, so that the browser doesn't have to run the physics.
+
+The forces are those of ForceAtlas2:
+    - every pair of nodes repels with scaling * m_i * m_j / distance, where the mass m of a node is its degree + 1
+    - every edge pulls its ends together with weight * distance
+    - gravity pulls every node towards the center with gravity * m_i
+and every step moves each node along its force by at most the temperature, which cools down linearly
+(like Fruchterman-Reingold), so the layout settles in a fixed number of iterations.
+
+The repulsion of all the pairs is approximated like Barnes-Hut, on a quadtree of grids over the bounding square:
+at level l the square is cut in 2^l x 2^l cells, and a node feels the cells that are children of its parent's
+neighbours but aren't neighbours of its own cell as a single mass at their center of mass. At the finest level,
+the nodes in the neighbouring cells repel it exactly. Every other node is counted once, at the coarsest level where
+it's far enough, and every level is one vectorized step over all the nodes.
+
+Layouts are cached by the hash of the graph (see cached_layout). When the graph changed a little (e.g. after
+update_graph), the last layout is the starting point: the nodes that were already there keep their place, the new
+ones start next to their neighbours, and a few cooler iterations are enough.
+"""
+
+DEFAULT_ITERATIONS = 100
+WARM_ITERATIONS = 30  # when starting from a previous layout
+WARM_TEMPERATURE = 0.02
+SCALING = 10.0        # strength of the repulsion (ForceAtlas2's scalingRatio for graphs of more than 100 nodes)
+GRAVITY = 1.0
+EDGE_LENGTH = 150     # median length of the edges in the html, in pixels
+EPSILON = 1e-9
+
+def graph_hash(names:np.ndarray, source:np.ndarray, target:np.ndarray, weight:np.ndarray, **params) -> str:
+    """Hash of the nodes, edges and parameters of a layout."""
+    h = hashlib.sha256()
+    h.update(json.dumps([str(name) for name in names]).encode("utf-8"))
+    for array, dtype in ((source, np.int64), (target, np.int64), (weight, np.float64)):
+        h.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:20]
+
+def finest_level(n_nodes:int) -> int:
+    """Enough levels for about one node per cell, if they were spread evenly."""
+    return int(np.clip(np.ceil(np.log2(np.sqrt(max(n_nodes, 1)))), 2, 10))
+
+def grid_cells(positions:np.ndarray, levels:int) -> np.ndarray:
+    """The (x, y) cell of every node in the finest grid (2^levels cells per side) over the bounding square."""
+    low = positions.min(axis=0)
+    side = (positions.max(axis=0) - low).max()
+    unit = (positions - low) / (side if side > 0 else 1)
+    return np.minimum((unit * 2**levels).astype(np.int64), 2**levels - 1)
+
+def far_offsets(parity:int) -> np.ndarray:
+    """
+    The offsets (along one axis) from a cell to the children of its parent's neighbours:
+    from x = 2p + parity to 2(p - 1) ... 2(p + 1) + 1.
+    """
+    return np.arange(-2 - parity, 4 - parity)
+
+# for each parity of a cell (x % 2, y % 2), the offsets (dx, dy) of its interaction list:
+# children of its parent's neighbours, but not its own neighbours (27 cells)
+FAR_OFFSETS = np.array([[(dx, dy) for dx in far_offsets(px) for dy in far_offsets(py) if max(abs(dx), abs(dy)) > 1]
+                        for px in (0, 1) for py in (0, 1)])
+NEAR_OFFSETS = np.array([(dx, dy) for dx in range(-1, 2) for dy in range(-1, 2)])
+
+def repulsion(positions:np.ndarray, mass:np.ndarray, scaling:float=SCALING, levels:int=None) -> np.ndarray:
+    """The (approximate) repulsion on every node: scaling * m_i * m_j / distance from every other node j."""
+    n = len(positions)
+    levels = finest_level(n) if levels is None else levels
+    finest = grid_cells(positions, levels)
+    forces = np.zeros_like(positions)
+    for level in range(2, levels + 1):
+        size = 2**level
+        cells = finest >> (levels - level)
+        cell_ids = cells[:, 0] * size + cells[:, 1]
+        cell_mass = np.bincount(cell_ids, weights=mass, minlength=size * size)
+        center = np.stack([np.bincount(cell_ids, weights=mass * positions[:, axis], minlength=size * size) for axis in (0, 1)], axis=1)
+        center /= np.maximum(cell_mass, EPSILON)[:, None]
+        # every node against the 27 cells of its interaction list at once (the ones outside the grid have no mass)
+        offsets = FAR_OFFSETS[(cells[:, 0] & 1) * 2 + (cells[:, 1] & 1)]
+        other_x, other_y = cells[:, 0, None] + offsets[:, :, 0], cells[:, 1, None] + offsets[:, :, 1]
+        inside = (other_x >= 0) & (other_x < size) & (other_y >= 0) & (other_y < size)
+        other_ids = np.where(inside, other_x * size + other_y, 0)
+        delta_x = positions[:, 0, None] - center[other_ids, 0]
+        delta_y = positions[:, 1, None] - center[other_ids, 1]
+        magnitude = scaling * mass[:, None] * np.where(inside, cell_mass[other_ids], 0) / np.maximum(delta_x**2 + delta_y**2, EPSILON)
+        forces[:, 0] += (magnitude * delta_x).sum(axis=1)
+        forces[:, 1] += (magnitude * delta_y).sum(axis=1)
+    # the nodes of the neighbouring cells of the finest grid, one by one
+    size = 2**levels
+    cell_ids = finest[:, 0] * size + finest[:, 1]
+    order = np.argsort(cell_ids, kind="stable")
+    starts = np.searchsorted(cell_ids[order], np.arange(size * size + 1))
+    other = finest[:, None, :] + NEAR_OFFSETS[None, :, :]
+    valid = ((other >= 0) & (other < size)).all(axis=2)
+    node, offset = np.nonzero(valid)
+    other_ids = other[node, offset, 0] * size + other[node, offset, 1]
+    counts = starts[other_ids + 1] - starts[other_ids]
+    first = np.repeat(starts[other_ids], counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    node, neighbour = np.repeat(node, counts), order[first + within]
+    node, neighbour = node[node != neighbour], neighbour[node != neighbour]
+    forces += pair_forces(positions, mass, node, positions[neighbour], mass[neighbour], scaling, n)
+    return forces
+
+def pair_forces(positions:np.ndarray, mass:np.ndarray, node:np.ndarray, other_position:np.ndarray, other_mass:np.ndarray,
+                scaling:float, n:int) -> np.ndarray:
+    """Sum over the pairs (node[k], a mass other_mass[k] at other_position[k]) of the repulsion on node[k]."""
+    delta = positions[node] - other_position
+    magnitude = scaling * mass[node] * other_mass / np.maximum((delta**2).sum(axis=1), EPSILON) # force / distance
+    return np.stack([np.bincount(node, weights=magnitude * delta[:, axis], minlength=n) for axis in (0, 1)], axis=1)
+
+def exact_repulsion(positions:np.ndarray, mass:np.ndarray, scaling:float=SCALING, block_size:int=1024) -> np.ndarray:
+    """The repulsion of every pair, without the quadtree (O(n^2), to check the approximation)."""
+    forces = np.zeros_like(positions)
+    for start in range(0, len(positions), block_size):
+        block = slice(start, start + block_size)
+        delta = positions[block, None, :] - positions[None, :, :]
+        squared = np.maximum((delta**2).sum(axis=2), EPSILON)
+        magnitude = scaling * mass[block, None] * mass[None, :] / squared
+        magnitude[np.arange(delta.shape[0]), np.arange(start, start + delta.shape[0])] = 0
+        forces[block] = (magnitude[:, :, None] * delta).sum(axis=1)
+    return forces
+
+def force_layout(adjacency:sparse.csr_matrix, positions:np.ndarray=None, iterations:int=DEFAULT_ITERATIONS,
+                 temperature:float=0.1, scaling:float=SCALING, gravity:float=GRAVITY, seed:int=0) -> np.ndarray:
+    """
+    Returns the (n x 2) positions of the nodes of the weighted graph, after the given number of iterations.
+    positions: where to start from (default: random). temperature: the largest first step, as a fraction of the size
+    of the layout (use a smaller one when starting from a good layout).
+    """
+    adjacency = sparse.csr_matrix(adjacency, dtype=np.float64)
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.zeros((0, 2))
+    rng = np.random.default_rng(seed)
+    if positions is None:
+        positions = (rng.random((n, 2)) - 0.5) * np.sqrt(n) * np.sqrt(scaling)
+    positions = np.array(positions, dtype=np.float64)
+    mass = np.diff(adjacency.indptr) + 1.0
+    weighted_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    for cooling in np.linspace(1, 0.01, iterations):
+        step = cooling * temperature * max(np.ptp(positions, axis=0).max(), 1.0)
+        forces = repulsion(positions, mass, scaling)
+        forces += adjacency @ positions - weighted_degree[:, None] * positions # attraction: sum of w_ij (p_j - p_i)
+        distance = np.sqrt((positions**2).sum(axis=1))
+        forces -= gravity * (mass / np.maximum(distance, EPSILON))[:, None] * positions
+        length = np.sqrt((forces**2).sum(axis=1))
+        positions += forces * (np.minimum(length, step) / np.maximum(length, EPSILON))[:, None]
+    return positions
+
+def initial_positions(names:list, adjacency:sparse.csr_matrix, previous:dict, seed:int=0) -> np.ndarray:
+    """
+    Starting positions from a previous layout ({node: [x, y]}): the nodes that were there keep their place,
+    the new ones start at the mean of their placed neighbours (or anywhere in the layout, if none was placed).
+    """
+    rng = np.random.default_rng(seed)
+    placed = np.array([name in previous for name in names])
+    positions = np.array([previous.get(name, (0.0, 0.0)) for name in names], dtype=np.float64).reshape(-1, 2)
+    if not placed.any():
+        return None
+    low, high = positions[placed].min(axis=0), positions[placed].max(axis=0)
+    links = sparse.csr_matrix(adjacency)[:, placed]
+    links.data[:] = 1
+    count = np.asarray(links.sum(axis=1)).ravel()
+    near = ~placed & (count > 0)
+    jitter = (rng.random((len(names), 2)) - 0.5) * 0.05 * max((high - low).max(), 1.0)
+    positions[near] = (links @ positions[placed])[near] / count[near, None] + jitter[near]
+    alone = ~placed & (count == 0)
+    positions[alone] = low + rng.random((alone.sum(), 2)) * (high - low)
+    return positions
+
+def pixel_positions(positions:np.ndarray, source:np.ndarray, target:np.ndarray) -> np.ndarray:
+    """The positions centered and scaled so that the median edge is EDGE_LENGTH pixels long."""
+    positions = positions - positions.mean(axis=0)
+    if len(source) == 0:
+        return positions
+    lengths = np.sqrt(((positions[source] - positions[target])**2).sum(axis=1))
+    return positions * EDGE_LENGTH / max(np.median(lengths), EPSILON)
+
+def cached_layout(names:np.ndarray, source:np.ndarray, target:np.ndarray, weight:np.ndarray, directory:str,
+                  iterations:int=DEFAULT_ITERATIONS, seed:int=0) -> np.ndarray:
+    """
+    Returns the (n x 2) layout of the graph (nodes names, edges source-target), from directory/<hash of the graph>.json
+    if it was already computed. Otherwise it's computed, starting from the last layout saved in directory (latest.json)
+    if there's one, and saved as both.
+    """
+    os.makedirs(directory, exist_ok=True)
+    names = [str(name) for name in names]
+    path = os.path.join(directory, f"{graph_hash(names, source, target, weight, iterations=iterations, seed=seed)}.json")
+    latest_path = os.path.join(directory, "latest.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        positions = np.array([saved[name] for name in names], dtype=np.float64).reshape(-1, 2)
+    else:
+        adjacency = communities.adjacency_from_edges(source, target, weight, len(names))
+        start = None
+        if os.path.exists(latest_path):
+            with open(latest_path, encoding="utf-8") as f:
+                start = initial_positions(names, adjacency, json.load(f), seed=seed)
+        if start is None:
+            positions = force_layout(adjacency, iterations=iterations, seed=seed)
+        else:
+            positions = force_layout(adjacency, positions=start, iterations=min(iterations, WARM_ITERATIONS),
+                                     temperature=WARM_TEMPERATURE, seed=seed)
+        layout = dict(zip(names, positions.tolist()))
+        for destination in (path, latest_path):
+            with open(destination + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(layout, f)
+            os.replace(destination + ".tmp", destination)
+    return positions
@@ -0,0 +1,103 @@
+from utils import correlation
+from scipy import sparse
+import numpy as np
+
+"""
+Approximate correlations for corpora too big for the all-pairs products (tens of thousands of characters).
+
+Every character is sketched by a MinHash signature of the set of issues it appears in: for each of n_hashes random
+hash functions of the issue ids, the smallest hash over its issues. Two characters agree on a given hash with
+probability equal to the Jaccard similarity of their sets of issues.
+
+The signatures are cut into bands of rows_per_band hashes (locality-sensitive hashing): two characters whose band is
+identical in at least one band are a candidate pair. With b bands of r rows, a pair of Jaccard similarity s is
+a candidate with probability 1 - (1 - s^r)^b, so similar pairs are almost always found and the (many) characters
+that never meet are almost never compared.
+
+Only the candidate pairs get their exact Pearson correlation, from the same sufficient statistics as the
+correlation module.
+"""
+
+PRIME = 2**31 - 1 # hashes are (a * issue + b) mod PRIME
+DEFAULT_HASHES = 128
+DEFAULT_ROWS_PER_BAND = 2
+MAX_BUCKET_SIZE = 1000 # bigger buckets (e.g. hundreds of characters in the same single issue) are cut to this size
+
+def minhash_signatures(matrix:sparse.csr_matrix, n_hashes:int=DEFAULT_HASHES, seed:int=0, chunk_size:int=8) -> np.ndarray:
+    """
+    Returns the (characters x n_hashes) uint32 MinHash signatures of the rows of the matrix (the nonzero columns).
+    Empty rows get the largest value everywhere. chunk_size hashes are computed at a time, to bound the memory.
+    """
+    matrix = sparse.csr_matrix(matrix, copy=True)
+    matrix.eliminate_zeros()
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, size=n_hashes, dtype=np.int64)
+    b = rng.integers(0, PRIME, size=n_hashes, dtype=np.int64)
+    signatures = np.full((matrix.shape[0], n_hashes), np.iinfo(np.uint32).max, dtype=np.uint32)
+    nonempty = np.flatnonzero(np.diff(matrix.indptr))
+    if len(nonempty) == 0:
+        return signatures
+    starts = matrix.indptr[nonempty]
+    issues = matrix.indices.astype(np.int64)
+    for first in range(0, n_hashes, chunk_size):
+        last = min(first + chunk_size, n_hashes)
+        hashes = (a[first:last, None] * issues + b[first:last, None]) % PRIME
+        # the minimum of every row's segment (the empty rows in between have no elements, so they don't split them)
+        signatures[nonempty, first:last] = np.minimum.reduceat(hashes, starts, axis=1).T
+    return signatures
+
+def lsh_candidates(signatures:np.ndarray, rows_per_band:int=DEFAULT_ROWS_PER_BAND, candidates_of:np.ndarray=None,
+                   max_bucket_size:int=MAX_BUCKET_SIZE) -> tuple:
+    """
+    Returns the candidate pairs (rows, cols), with rows < cols: the characters that share a whole band of their signatures.
+    Only the characters in candidates_of (default: all) are considered.
+    """
+    n = signatures.shape[0]
+    characters = np.arange(n) if candidates_of is None else np.asarray(candidates_of)
+    pairs = []
+    for first in range(0, signatures.shape[1] - rows_per_band + 1, rows_per_band):
+        band = signatures[characters, first:first + rows_per_band].astype(np.uint64)
+        # one 64 bit key per band (collisions between different bands are astronomically rare)
+        keys = np.zeros(len(characters), dtype=np.uint64)
+        for column in range(rows_per_band):
+            keys = keys * np.uint64(0x9E3779B97F4A7C15) + band[:, column]
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # a run of equal keys is a bucket: pair every character with the ones after it in the same run
+        bucket_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        largest_bucket = np.diff(np.r_[bucket_starts, len(keys)]).max()
+        for offset in range(1, min(largest_bucket, max_bucket_size)):
+            same_bucket = sorted_keys[offset:] == sorted_keys[:-offset]
+            left = characters[order[:-offset][same_bucket]]
+            right = characters[order[offset:][same_bucket]]
+            pairs.append(np.minimum(left, right).astype(np.int64) * n + np.maximum(left, right))
+    if not pairs:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    keys = np.unique(np.concatenate(pairs))
+    return (keys // n).astype(np.int32), (keys % n).astype(np.int32)
+
+def pair_correlations(matrix:sparse.csr_matrix, rows:np.ndarray, cols:np.ndarray, block_size:int=1_000_000) -> np.ndarray:
+    """The exact Pearson correlation of each pair (rows[k], cols[k]) of rows of the matrix (NaN for zero variance)."""
+    matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+    sums, centered = correlation.row_statistics(matrix)
+    n_issues = matrix.shape[1]
+    values = np.empty(len(rows), dtype=np.float64)
+    for start in range(0, len(rows), block_size):
+        block = slice(start, start + block_size)
+        products = np.asarray(matrix[rows[block]].multiply(matrix[cols[block]]).sum(axis=1)).ravel()
+        covariance = products - sums[rows[block]] * sums[cols[block]] / n_issues
+        values[block] = covariance / np.sqrt(centered[rows[block]] * centered[cols[block]])
+    return np.clip(values, -1, 1)
+
+def approximate_correlations(matrix:sparse.csr_matrix, n_hashes:int=DEFAULT_HASHES, rows_per_band:int=DEFAULT_ROWS_PER_BAND,
+                             seed:int=0) -> tuple:
+    """
+    Returns (rows, cols, correlations) of the candidate pairs found by MinHash + LSH, with rows < cols,
+    as flat int32, int32, float32 arrays (like correlation.top_k_correlations). Pairs with a NaN correlation are dropped.
+    """
+    signatures = minhash_signatures(matrix, n_hashes=n_hashes, seed=seed)
+    nonempty = np.flatnonzero(np.diff(sparse.csr_matrix(matrix).indptr))
+    rows, cols = lsh_candidates(signatures, rows_per_band=rows_per_band, candidates_of=nonempty)
+    values = pair_correlations(matrix, rows, cols)
+    keep = ~np.isnan(values)
+    return rows[keep], cols[keep], values[keep].astype(np.float32)
@@ -0,0 +1,118 @@
+from utils import aliases
+from utils.incidence import Interner, LEVELS, NO_APPEARANCE
+import numpy as np
+import json
+import os
+
+"""
+One integer id per character name, for everything that comes after the scraping.
+
+An issue page lists its characters as category titles, like "Category:Scott Summers (Earth-616)/Appearances".
+The same titles come back in issue after issue, so each distinct title is cleaned only once, the first time it's seen,
+and remembered as (character id, level). After that, an issue is just two arrays: int32 ids and int8 levels.
+
+The aliases (see the aliases module) are compiled into the same id space: the hero name gets an id of its own,
+and canonical_ids maps every id to the id of the name it's shown as. parse_titles returns those ids, so the stores
+and builders only ever get one id per character, already under its hero name.
+
+The cleaned titles are saved to a json file, so the next run (and the other series) can reuse them.
+"""
+
+DEFAULT_PATH = "cache/names.json"
+NORMALIZATION_VERSION = 1 # bump when normalize_title changes, to throw away the saved titles
+
+def normalize_title(title:str) -> tuple[str, str]:
+    """
+    "Category:Scott Summers (Earth-616)/Appearances" -> ("Scott Summers", "Appearances")
+
+    Removes the "Category:" prefix and the default universe (Earth-616), then splits off the type of appearance
+    (the last bit after a '/'; the name itself can have '/' in it).
+    """
+    name = title.replace("Category:", "").replace(" (Earth-616)", "")
+    *name_parts, type_of_appearance = name.split("/")
+    return "/".join(name_parts), type_of_appearance
+
+class NameTable:
+    """
+    Usage:
+        names = NameTable.load()
+        ids, levels = names.parse_titles(["Category:Scott Summers (Earth-616)/Appearances"])
+        names.names_of(ids) # ["Cyclops (Scott Summers)"]
+        names.save()
+    """
+    def __init__(self, path:str=None, alias_map:dict=None):
+        self.path = path
+        self.characters = Interner()
+        self.titles = {} # category title -> (character id, level)
+        self.alias_map = aliases.ALIASES if alias_map is None else alias_map
+        self.alias_ids = np.zeros(0, dtype=np.int32)
+        self.compile_aliases()
+
+    @classmethod
+    def load(cls, path:str=DEFAULT_PATH, alias_map:dict=None) -> "NameTable":
+        """Reads the titles cleaned by earlier runs (if any, and if they were cleaned the same way)."""
+        table = cls(path, alias_map)
+        if path is None or not os.path.exists(path):
+            return table
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("version") != NORMALIZATION_VERSION:
+            return table
+        table.characters = Interner(saved["names"])
+        table.titles = {title: (character_id, level) for title, (character_id, level) in saved["titles"].items()}
+        table.compile_aliases()
+        return table
+
+    def save(self, path:str=None) -> None:
+        path = path or self.path
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # write to a temporary file first, so a crash can't leave half a file behind
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"version": NORMALIZATION_VERSION, "names": self.characters.names, "titles": self.titles}, f)
+        os.replace(temporary_path, path)
+
+    def __len__(self) -> int:
+        return len(self.characters)
+
+    def id_of(self, name:str) -> int:
+        character_id = self.characters.id_of(name)
+        if character_id >= len(self.alias_ids):
+            self._grow()
+        return character_id
+
+    def _grow(self) -> None:
+        """Makes room for the new names in alias_ids. A new name is its own alias (the names of the alias map got their ids in compile_aliases)."""
+        old_size = len(self.alias_ids)
+        self.alias_ids = np.concatenate([self.alias_ids, np.arange(old_size, len(self.characters), dtype=np.int32)])
+
+    def compile_aliases(self) -> None:
+        """Gives the hero names ids, and points the ids of the aliased names to them."""
+        targets = [(self.characters.id_of(name), self.characters.id_of(alias)) for name, alias in self.alias_map.items()]
+        self.alias_ids = np.arange(len(self.characters), dtype=np.int32)
+        for character_id, alias_id in targets:
+            self.alias_ids[character_id] = alias_id
+
+    def parse_titles(self, titles:list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the character ids (int32, see canonical_ids) and levels (int8, see incidence.LEVELS) of a list of
+        category titles. Types of appearance that aren't known get NO_APPEARANCE.
+        """
+        ids = np.empty(len(titles), dtype=np.int32)
+        levels = np.empty(len(titles), dtype=np.int8)
+        for i, title in enumerate(titles):
+            parsed = self.titles.get(title)
+            if parsed is None:
+                name, type_of_appearance = normalize_title(title)
+                parsed = self.titles[title] = (self.id_of(name), LEVELS.get(type_of_appearance, NO_APPEARANCE))
+            ids[i], levels[i] = parsed
+        return self.canonical_ids(ids), levels
+
+    def canonical_ids(self, ids:np.ndarray) -> np.ndarray:
+        """The id of the name each character is shown as."""
+        return self.alias_ids[np.asarray(ids, dtype=np.int32)]
+
+    def names_of(self, ids:np.ndarray) -> list[str]:
+        return [self.characters.names[i] for i in self.canonical_ids(ids)]
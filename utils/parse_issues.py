@@ -1,9 +1,12 @@
 import pandas as pd
-from utils import scrape, aliases
-from bs4 import BeautifulSoup
+from utils import scrape, aliases, storage, extract
+from utils.names import NameTable
+from utils.incidence import IncidenceBuilder, TYPE_OF_APPEARANCE
 from tqdm import tqdm
-from pandas.api.types import CategoricalDtype
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import numpy as np
+import os
 
 """
 The goal of this module is to take in a list of issues and return a dataframe.
@@ -15,55 +18,154 @@ Output: dataframe of appearances.
     - values: type of appearance
 """
 
-TYPE_OF_APPEARANCE = CategoricalDtype(categories=["Mentions", "Minor Appearances", "Appearances"], ordered=True)
-
-def build_full_table(issues:list, path:str="data/table_of_appearances.csv", save_progress=True) -> pd.DataFrame:
-    """ Takes in a list of issues and urls, and returns a table of appearances. """
-    def save_full_table(main_table:pd.DataFrame, path:str="data/table_of_appearances.csv") -> None:
-        """Save the full table to a csv."""
-        if save_progress:
-            main_table.to_csv(path, index=False)
-
-    main_table = pd.DataFrame({'character name': pd.Series(dtype='str')}) #initialize first column
-    for i, issue in enumerate(tqdm(issues)):
-        # iterate through each issue in the list of issues.
-        issue_table = build_issue_table(issue) # make a column with the values of the issue
-        main_table = append_issue_column_to_main_table(main_table, issue_table) # merge to the main table as you go
-        if i % 10 == 0:
-            # every 10 issues, save it to the file
-            save_full_table(main_table, path=path)
-    save_full_table(main_table, path=path)
+def build_full_table(issues:list, path:str="data/table_of_appearances.csv", save_progress=True,
+                     max_in_flight:int=scrape.MAX_IN_FLIGHT,
+                     requests_per_second:float=scrape.REQUESTS_PER_SECOND_PER_HOST,
+                     journal_path:str=None, parse_workers:int=0, extractor:str=extract.DEFAULT_EXTRACTOR,
+                     names:NameTable=None, refresh:bool=False) -> pd.DataFrame:
+    """
+    Takes in a list of issues and urls, and returns a table of appearances.
     
-    # remove duplicates:
-    no_dupes = remove_duplicates(main_table)
+    The pages are downloaded max_in_flight at a time (1 to download them one by one),
+    and parsed by parse_workers processes (0 to parse them in this process),
+    but they are always processed in the order of the list, so the table is the same either way.
+    requests_per_second caps the requests sent to the wiki (None for no cap).
+    names is the table the character names are cleaned and interned with (by default, the one saved in the cache folder).
     
-    # swap the names for the hero names:
-    # this has to be done at the end because we use the default names as unique identifiers when merging the issues
-    replace_aliases(no_dupes)
+    If save_progress, every issue is appended to a journal (a storage.AppearanceStore in journal_path,
+    by default the store shared by every series, storage.SHARED_STORE_DIR) as soon as it's scraped.
+    The issues that are already in the journal (from an interrupted run, or from another series) aren't scraped again,
+    so a page corrected on the wiki after it was scraped stays as it was in the journal, unless refresh:
+    then every page is fetched again through the page cache (if it's enabled, see scrape.enable_cache: the pages
+    younger than its ttl are read from disk, the others are revalidated with their ETag / Last-Modified),
+    and the issues whose characters changed are rewritten in the journal (see scrape_into_journal).
+    """
+    if names is None:
+        names = NameTable.load()
+    if save_progress:
+        if journal_path is None:
+            journal_path = storage.SHARED_STORE_DIR
+        journal = storage.AppearanceStore(journal_path)
+        scrape_into_journal(issues, journal, max_in_flight=max_in_flight, requests_per_second=requests_per_second,
+                            parse_workers=parse_workers, extractor=extractor, names=names, refresh=refresh)
+    else:
+        # collect the appearances in memory, in a sparse builder
+        builder = IncidenceBuilder()
+        for issue, titles in iter_parsed_issues(issues, max_in_flight=max_in_flight, requests_per_second=requests_per_second,
+                                                parse_workers=parse_workers, extractor=extractor):
+            ids, levels = names.parse_titles(titles)
+            builder.add_issue_ids(issue["title"], ids, levels, names.characters.names)
+        names.save()
+    
+    # build the table. Duplicates (characters listed twice in an issue) keep their highest type of appearance.
+    # The characters already have their hero names (aliases): names.parse_titles gives the id of the hero name.
+    if save_progress:
+        # the journal can also have issues from other runs and series: only read the ones asked for
+        incidence = journal.select([storage.canonical_issue_id(issue) for issue in issues], [issue["title"] for issue in issues])
+    else:
+        incidence = builder.to_incidence()
+    full_table = incidence.to_table()
     
     #finally, save and return it
-    save_full_table(no_dupes, path=path)
-    return no_dupes
+    if save_progress:
+        full_table.to_csv(path, index=False)
+    return full_table
+
+def scrape_into_journal(issues:list, journal:storage.AppearanceStore, max_in_flight:int=scrape.MAX_IN_FLIGHT,
+                        requests_per_second:float=scrape.REQUESTS_PER_SECOND_PER_HOST,
+                        parse_workers:int=0, extractor:str=extract.DEFAULT_EXTRACTOR, names:NameTable=None,
+                        refresh:bool=False) -> list[str]:
+    """
+    Scrapes the issues that aren't in the journal yet, appending each one (under its storage.canonical_issue_id)
+    as soon as it's parsed. Returns the ids of the issues that were added (or changed).
+    
+    With refresh, the issues already in the journal are scraped again too (through the page cache, if it's enabled),
+    and the ones whose characters or types of appearance changed are rewritten (AppearanceStore.replace_issues).
+    """
+    if names is None:
+        names = NameTable.load()
+    issues_to_scrape = list({storage.canonical_issue_id(issue): issue for issue in issues
+                             if refresh or storage.canonical_issue_id(issue) not in journal}.values())
+    if len(issues_to_scrape) < len(issues):
+        print(f"Skipping {len(issues) - len(issues_to_scrape)} issues already scraped in {journal.directory}")
+    added, changed = [], {}
+    for issue, titles in iter_parsed_issues(issues_to_scrape, max_in_flight=max_in_flight, requests_per_second=requests_per_second,
+                                            parse_workers=parse_workers, extractor=extractor):
+        ids, levels = names.parse_titles(titles)
+        issue_id = storage.canonical_issue_id(issue)
+        if issue_id not in journal:
+            journal.append_issue_ids(issue_id, ids, levels, names.characters.names)
+            added.append(issue_id)
+        elif not journal.has_same_rows(issue_id, ids, levels, names.characters.names):
+            changed[issue_id] = (ids, levels)
+    if changed:
+        print(f"Rewriting {len(changed)} issues that changed on the wiki in {journal.directory}")
+        journal.replace_issues(changed, names.characters.names)
+    names.save()
+    return added + list(changed)
+
+def iter_parsed_issues(issues:list, max_in_flight:int=scrape.MAX_IN_FLIGHT,
+                       requests_per_second:float=scrape.REQUESTS_PER_SECOND_PER_HOST,
+                       parse_workers:int=0, extractor:str=extract.DEFAULT_EXTRACTOR, queue_size:int=None):
+    """
+    Yields (issue, [character category title, ...]) for every issue, in order.
+    
+    The pages are downloaded by max_in_flight threads and handed to a pool of parse_workers processes
+    (or parsed here if parse_workers is 0). At most queue_size pages (default: 2 per worker) wait to be parsed:
+    when the parsers fall behind, the downloads wait for them, and the other way around.
+    """
+    pages = scrape.iter_html_from_urls([issue["url"] for issue in issues], max_in_flight=max(max_in_flight, 1),
+                                       requests_per_second=requests_per_second)
+    progress = tqdm(total=len(issues))
+    if parse_workers == 0:
+        for issue, page in zip(issues, pages):
+            progress.update()
+            yield issue, parse_issue_page(page, extractor)
+        progress.close()
+        return
+    
+    queue_size = queue_size or 2 * parse_workers
+    with ProcessPoolExecutor(max_workers=parse_workers) as parsers:
+        pending = deque()
+        for issue, page in zip(issues, pages):
+            pending.append((issue, parsers.submit(parse_issue_page, page, extractor)))
+            if len(pending) >= queue_size:
+                # wait for the oldest page before downloading more
+                oldest_issue, parsed = pending.popleft()
+                progress.update()
+                yield oldest_issue, parsed.result()
+        while pending:
+            oldest_issue, parsed = pending.popleft()
+            progress.update()
+            yield oldest_issue, parsed.result()
+    progress.close()
+
+def parse_issue_page(page:bytes, extractor:str=extract.DEFAULT_EXTRACTOR) -> list[str]:
+    """
+    Returns the category titles of the characters in an issue page, e.g. "Category:Scott Summers (Earth-616)/Appearances".
+    They're cleaned afterwards by a NameTable, once per distinct title (see the names module).
+    Plain strings, so it's cheap to run (and to send back) from another process.
+    """
+    # keep only the characters (see build_issue_table)
+    return [title for title in extract.category_titles(page, extractor) if "(Earth-" in title]
 
-def build_issue_table(issue:dict) -> pd.DataFrame:
+def build_issue_table(issue:dict, issue_html:bytes=None, extractor:str=extract.DEFAULT_EXTRACTOR) -> pd.DataFrame:
     """
     Runs a battery of functions.
     Returns a table with the type of appearance for every character in the issue.
+    
+    If the html of the issue page was already downloaded, pass it as issue_html to skip the request.
+    extractor is how the categories are read from the page (see the extract module).
     """
-    def list_characters_in_issue(soup:BeautifulSoup) -> pd.DataFrame:
-        """Takes in the url of an issue and returns a pandas dataframe of characters in the issue."""
-        categories = soup.find_all("ul", class_="categories")[0].find_all("span", class_="name")
-        
+    def list_characters_in_issue(page:bytes) -> pd.DataFrame:
+        """Takes in the html of an issue and returns a pandas dataframe of characters in the issue."""
         issue_table = []
-        for c in categories:
-            a_tag = c.find("a")
-            u, name = a_tag.get("href"), a_tag.get("title")
+        for name in extract.category_titles(page, extractor):
             if "(Earth-" in name:
                 # Problem: "Categories" typically include items, locations etc. that are not characters.
                 # Characters always include the universe they are from. (e.g. 'Earth-616').
                 # Since we want only characters, we need to filter out the ones that are not characters.
                 
-                #characters_in_issue.append({"url": u, "name": name}) # not used anymore
                 issue_table.append({"character name": name})
         issue_table = pd.DataFrame(issue_table)
         
@@ -107,15 +209,20 @@ def build_issue_table(issue:dict) -> pd.DataFrame:
     
     #unpack the issue dictionary
     issue_name, issue_url = issue["title"], issue["url"]
-    issue_soup = scrape.soup_from_url(issue_url)
+    if issue_html is None:
+        issue_html = scrape.html_from_url(issue_url)
     
-    issue_table = list_characters_in_issue(issue_soup)
+    issue_table = list_characters_in_issue(issue_html)
     issue_table = clean_characters_names(issue_table)
     issue_table = split_type_of_appearance(issue_table, issue_name)
     return issue_table
 
 def append_issue_column_to_main_table(main_table:pd.DataFrame, issue_table:pd.DataFrame) -> pd.DataFrame:
-    """Appends the new issue column to the main table."""
+    """
+    Appends the new issue column to the main table.
+    
+    Not used by build_full_table anymore (a merge per issue is quadratic): see incidence.IncidenceBuilder.
+    """
     main_table = main_table.merge(issue_table, on="character name", how="outer")
     return main_table
 
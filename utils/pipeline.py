@@ -0,0 +1,156 @@
+from utils.instrumentation import StageTracker
+import pandas as pd
+import numpy as np
+import dataclasses
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+"""
+A small memoizing pipeline: named stages, each with its inputs (other stages) and parameters.
+
+Every stage gets a key: the hash of its name, the source code of its function, its parameters and the keys of its inputs.
+(Only the stage's own function is hashed: clear the cache after changing the code it calls.)
+The result of a cached stage is pickled to cache_dir/<stage>-<key>.pkl, so running the pipeline again
+only recomputes the stages downstream of what changed (e.g. changing the edge thresholds reuses the correlations).
+Stages that aren't cached (e.g. reading the data, writing the html) always run,
+and their key is the hash of what they returned.
+The time and memory of every stage (run or loaded) are measured by an instrumentation.StageTracker,
+which can also profile some of them.
+"""
+
+@dataclasses.dataclass
+class Stage:
+    name:str
+    function:object
+    inputs:tuple = ()
+    params:dict = dataclasses.field(default_factory=dict)
+    cache:bool = True
+
+class Pipeline:
+    """
+    Usage:
+        pipeline = Pipeline("results/X-Men/data/stages")
+        pipeline.add_stage("stats", process_appearances.count_types_of_appearances, inputs=["scrape"])
+        pipeline.add_stage("corr", prepare_edges.calculate_correlations, inputs=["weights"], params={"backend": "sparse"})
+        corr_matrix = pipeline.run("corr")
+        pipeline.print_report()
+    
+    A stage's function is called with the results of its inputs as positional arguments, and its params as keyword arguments.
+    """
+    def __init__(self, cache_dir:str=None, tracker:StageTracker=None):
+        """
+        Without a cache_dir, results are only kept in memory for the run.
+        tracker: measures the stages (default: time and resident memory only, see instrumentation.StageTracker).
+        """
+        self.cache_dir = cache_dir
+        self.tracker = tracker or StageTracker()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.stages = {}
+        self.keys = {}
+        self.results = {}
+        self.report = [] # one row per stage that was run or loaded
+    
+    def add_stage(self, name:str, function, inputs:list=(), params:dict=None, cache:bool=True) -> None:
+        for input_name in inputs:
+            if input_name not in self.stages:
+                raise KeyError(f"Stage {name} needs {input_name}, which hasn't been added yet.")
+        self.stages[name] = Stage(name, function, tuple(inputs), params or {}, cache)
+    
+    def key(self, name:str) -> str:
+        """The hash of everything the result of the stage depends on."""
+        if name in self.keys:
+            return self.keys[name]
+        stage = self.stages[name]
+        if not stage.cache:
+            self.run(name) # the key of an uncached stage is the hash of its result
+            return self.keys[name]
+        h = hashlib.sha256()
+        h.update(name.encode("utf-8"))
+        h.update(source_of(stage.function).encode("utf-8"))
+        h.update(json.dumps(stage.params, sort_keys=True, default=repr).encode("utf-8"))
+        for input_name in stage.inputs:
+            h.update(self.key(input_name).encode("utf-8"))
+        self.keys[name] = h.hexdigest()[:20]
+        return self.keys[name]
+    
+    def upstream(self, name:str) -> set:
+        """The stage and every stage it depends on."""
+        stages = {name}
+        for input_name in self.stages[name].inputs:
+            stages |= self.upstream(input_name)
+        return stages
+    
+    def _artifact_path(self, name:str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{self.key(name)}.pkl")
+    
+    def run(self, name:str):
+        """Returns the result of the stage, computing (or loading) only what's needed."""
+        if name in self.results:
+            return self.results[name]
+        stage = self.stages[name]
+        
+        # a stage that is profiled runs again, instead of profiling the loading of its result
+        if (stage.cache and self.cache_dir is not None and name not in self.tracker.profile
+                and os.path.exists(self._artifact_path(name))):
+            with self.tracker.stage(name):
+                with open(self._artifact_path(name), "rb") as f:
+                    result = pickle.load(f)
+            self._record(name, "hit")
+            # the profiled stages upstream aren't needed, but still run for their profile
+            for input_name in stage.inputs:
+                if self.tracker.profile.keys() & self.upstream(input_name):
+                    self.run(input_name)
+        else:
+            inputs = [self.run(input_name) for input_name in stage.inputs]
+            with self.tracker.stage(name):
+                result = stage.function(*inputs, **stage.params)
+            if not stage.cache:
+                self.keys[name] = content_hash(result)
+            elif self.cache_dir is not None:
+                with open(self._artifact_path(name), "wb") as f:
+                    pickle.dump(result, f)
+            self._record(name, "miss" if stage.cache else "uncached")
+        self.results[name] = result
+        return result
+    
+    def _record(self, name:str, outcome:str) -> None:
+        """Adds the cache outcome and key of the stage to what the tracker measured of it."""
+        measured = {key: value for key, value in self.tracker.report[-1].items() if key != "stage"}
+        self.report.append({"stage": name, "outcome": outcome, **measured, "key": self.keys.get(name, "")})
+    
+    def report_frame(self) -> pd.DataFrame:
+        """Cache hits/misses, time and memory of every stage that was needed, in the order they finished."""
+        return pd.DataFrame(self.report, columns=["stage", "outcome", "seconds", "peak_mb", "rss_mb", "max_rss_mb",
+                                                  "profile", "key"])
+    
+    def print_report(self) -> None:
+        report = self.report_frame()
+        for row in report.itertuples():
+            peak = "" if pd.isna(row.peak_mb) else f"  peak {row.peak_mb:8.1f}MB"
+            print(f"  {row.stage:>10}: {row.outcome:>8}  {row.seconds:8.3f}s  rss {row.rss_mb:8.1f}MB{peak}")
+        hits = (report["outcome"] == "hit").sum()
+        cached = report["outcome"].isin(["hit", "miss"]).sum()
+        print(f"  cache hits: {hits}/{cached}")
+
+def source_of(function) -> str:
+    """The source code of the function, so that changing the code invalidates the cache."""
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return getattr(function, "__qualname__", repr(function))
+
+def content_hash(obj) -> str:
+    """Hash of the contents of a result."""
+    h = hashlib.sha256()
+    if isinstance(obj, pd.DataFrame):
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        h.update(json.dumps([str(c) for c in obj.columns]).encode("utf-8"))
+    elif isinstance(obj, np.ndarray):
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(pickle.dumps(obj))
+    return h.hexdigest()[:20]
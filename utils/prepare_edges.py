@@ -1,5 +1,7 @@
 import pandas as pd
 import numpy as np
+from utils import correlation, incidence, minhash
+from dataclasses import dataclass
 #from tqdm import tqdm
 
 WEIGHTS_OF_APPEARANCES = {"Appearances":1,
@@ -11,27 +13,48 @@ def build_weights_df(table:pd.DataFrame, weights_dict:dict=WEIGHTS_OF_APPEARANCE
     """
     Converts the types of appearances to numeric values to be processed further (used in the correlation matrix).
     
-    Uses the global variable WEIGHTS_OF_APPEARANCES to determine the weight of each appearance.
+    Uses the global variable WEIGHTS_OF_APPEARANCES to determine the weight of each appearance,
+    unless another weights_dict is given (e.g. SettingsToTweak.weights_for_types_of_appearances()).
+    The weights are float32.
     """
-    weights = table.copy() #copy table to variable weights to avoid changing the original table
-    
-    #turn the categories into numbers according to the global weights dictionary
-    weights.iloc[:,1:] = weights.iloc[:,1:].astype('str').replace(weights_dict).astype(np.float64)
-    
-    #pd.to_numeric(weights.iloc[:,1:]) # turn into numbers
-    if fill_na:
-        weights = weights.fillna(0) # fill NaN (not an appearance in that issue) with 0
-    #pd.to_numeric(weights.iloc[:,1:]) # turn into numbers again, to be sure
-    weights.iloc[:,1:] = weights.iloc[:,1:].astype(np.float64)
-    
+    weights = weights_matrix(incidence.levels_of_table(table), weights_dict, fill_na=fill_na)
+    weights = pd.DataFrame(weights, index=table.index, columns=table.columns[1:])
+    weights.insert(0, table.columns[0], table.iloc[:, 0])
     return weights
 
-def calculate_correlations(weights_df:pd.DataFrame) -> pd.DataFrame:
+def weights_lookup(weights_dict:dict=WEIGHTS_OF_APPEARANCES, fill_na:bool=True) -> np.ndarray:
+    """
+    Returns an array with the weight of each level of appearance (see incidence.LEVELS), so that lookup[level] is its weight.
+    Types of appearance missing from weights_dict weigh 0. No appearance weighs 0 (or NaN if not fill_na).
+    """
+    lookup = np.zeros(len(incidence.LEVELS) + 1, dtype=np.float32)
+    lookup[incidence.NO_APPEARANCE] = 0 if fill_na else np.nan
+    for type_of_appearance, level in incidence.LEVELS.items():
+        lookup[level] = weights_dict.get(type_of_appearance, 0)
+    return lookup
+
+def weights_matrix(levels:np.ndarray, weights_dict:dict=WEIGHTS_OF_APPEARANCES, fill_na:bool=True) -> np.ndarray:
+    """Turns an int8 array of levels of appearance into a float32 array of weights, with a single lookup."""
+    return weights_lookup(weights_dict, fill_na=fill_na)[levels]
+
+def calculate_correlations(weights_df:pd.DataFrame, backend:str="sparse") -> pd.DataFrame:
     """
     Calculates the correlation between each character.
     
     This takes in a weights_df where the columns are issues, the rows are characters and the values are numbers.
-    """    
+    
+    backend:
+        - "sparse": Pearson correlations from a sparse float32 matrix of the weights (see the correlation module).
+        - "pandas": transpose the table and use DataFrame.corr().
+    """
+    if backend == "sparse":
+        names = weights_df.iloc[:, 0]
+        corr_matrix = correlation.sparse_correlations(correlation.to_sparse_weights(weights_df))
+        corr_matrix = pd.DataFrame(corr_matrix, index=pd.Index(names, name=""), columns=pd.Index(names, name="character name"))
+        return corr_matrix
+    elif backend != "pandas":
+        raise ValueError(f"Unknown correlation backend: {backend}")
+    
     #To use the .corr() method, we need the columns to be what we're correlating (i.e.: the characters).
     #Therefore, first we transpose the weights_df. Then we use the .corr() method to get the correlation matrix.
     weights_df_T = weights_df.T 
@@ -78,8 +101,9 @@ def select_biggest_edges(edges:pd.DataFrame) -> pd.DataFrame:
 def select_n_biggest_edges(edges:pd.DataFrame, n:int) -> pd.DataFrame:
     """
     Returns the top n edges with the highest correlation for each source.
+    Ties are broken by the order of the edges (stable sort), so the result is always the same.
     """
-    edges_desc = edges.sort_values(by="correlation", ascending=False)
+    edges_desc = edges.sort_values(by="correlation", ascending=False, kind="stable")
     grouped = edges_desc.groupby("source", sort=False, as_index=False)
     n_first = grouped.head(n)
     
@@ -121,4 +145,128 @@ def filter_edges(edges:pd.DataFrame, soft_floor:float, hard_floor:float, top_n:i
     #trim the top_n_edges to only include edges with a correlation greater than the hard threshold
     top_n_edges = top_n_edges[top_n_edges["correlation"] > hard_floor]
     
-    return pd.concat([high_correlations, top_n_edges]).drop_duplicates()
\ No newline at end of file
+    return pd.concat([high_correlations, top_n_edges]).drop_duplicates()
+
+@dataclass
+class EdgeArrays:
+    """
+    Undirected edges as flat typed arrays: edge k goes from names[source[k]] to names[target[k]], with source < target.
+    """
+    names:np.ndarray
+    source:np.ndarray      # int32
+    target:np.ndarray      # int32
+    correlation:np.ndarray # float32
+    
+    def __len__(self) -> int:
+        return len(self.source)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the edges in the same format as build_edge_list/filter_edges (columns: source, target, correlation)."""
+        return pd.DataFrame({"source": self.names[self.source],
+                             "target": self.names[self.target],
+                             "correlation": self.correlation})
+
+def extract_edges(corr_matrix:pd.DataFrame, soft_floor:float, hard_floor:float, top_n:int,
+                  edge_list_path:str=None) -> EdgeArrays:
+    """
+    Same selection as filter_edges(build_edge_list(corr_matrix), soft_floor, hard_floor, top_n),
+    read straight from the correlation matrix without stacking every pair into an edge list first.
+    
+    Every edge is returned once (the correlation matrix is symmetric), instead of once per direction.
+    If edge_list_path is given, the full edge list (build_edge_list) is also written there as a csv.
+    """
+    if edge_list_path is not None:
+        build_edge_list(corr_matrix).to_csv(edge_list_path, index=False)
+    
+    names = np.asarray(corr_matrix.columns)
+    corr = corr_matrix.to_numpy(dtype=np.float64, copy=True)
+    n = corr.shape[0]
+    # no edges from a character to itself, and NaN never passes a threshold
+    np.fill_diagonal(corr, np.nan)
+    
+    # edges above the soft floor, from the upper triangle
+    above_soft = np.triu(corr > soft_floor, k=1)
+    source, target = np.nonzero(above_soft)
+    
+    # the top n edges of every character, if above the hard floor
+    top_n = min(top_n, n - 1)
+    if top_n > 0:
+        ranked = np.where(np.isnan(corr), -np.inf, corr)
+        # the n-th highest correlation of each row
+        nth_highest = -np.partition(-ranked, top_n - 1, axis=1)[:, top_n - 1:top_n]
+        # everything above it is in the top n. Ties with it are taken in column order,
+        # like the stable sort in select_n_biggest_edges.
+        above = ranked > nth_highest
+        tied = ranked == nth_highest
+        places_left = top_n - above.sum(axis=1, keepdims=True)
+        in_top_n = above | (tied & (np.cumsum(tied, axis=1) <= places_left))
+        rows, columns = np.nonzero(in_top_n & (corr > hard_floor))
+        # store as (smaller index, bigger index), like the upper triangle
+        source = np.concatenate([source, np.minimum(rows, columns)])
+        target = np.concatenate([target, np.maximum(rows, columns)])
+    
+    # an edge can be selected more than once (above the soft floor and in a top n)
+    keys = np.unique(source.astype(np.int64) * n + target)
+    source, target = (keys // n).astype(np.int32), (keys % n).astype(np.int32)
+    return EdgeArrays(names, source, target, corr[source, target].astype(np.float32))
+
+def extract_edges_from_pairs(names:np.ndarray, rows:np.ndarray, cols:np.ndarray, correlations:np.ndarray,
+                             soft_floor:float, hard_floor:float, top_n:int) -> EdgeArrays:
+    """
+    Same selection as extract_edges, from a list of pairs (rows < cols) and their correlations instead of a full matrix.
+    The pairs that aren't listed are treated as uncorrelated: they're never edges, nor in anyone's top n.
+    """
+    names = np.asarray(names)
+    n = len(names)
+    rows, cols, correlations = np.asarray(rows), np.asarray(cols), np.asarray(correlations, dtype=np.float64)
+    above_soft = correlations > soft_floor
+    source, target = rows[above_soft], cols[above_soft]
+    
+    if top_n > 0 and len(rows) > 0:
+        # every pair in both directions, sorted by character, then from the strongest, then in column order
+        character = np.concatenate([rows, cols])
+        other = np.concatenate([cols, rows])
+        values = np.concatenate([correlations, correlations])
+        order = np.lexsort((other, -values, character))
+        character, other, values = character[order], other[order], values[order]
+        # rank of each pair among the pairs of its character
+        first_of_character = np.searchsorted(character, character, side="left")
+        in_top_n = (np.arange(len(character)) - first_of_character < top_n) & (values > hard_floor)
+        source = np.concatenate([source, np.minimum(character, other)[in_top_n]])
+        target = np.concatenate([target, np.maximum(character, other)[in_top_n]])
+    
+    # an edge can be selected more than once. Then look up the correlation of each edge among the pairs
+    keys = np.unique(source.astype(np.int64) * n + target)
+    source, target = (keys // n).astype(np.int32), (keys % n).astype(np.int32)
+    pair_keys = rows.astype(np.int64) * n + cols
+    order = np.argsort(pair_keys)
+    values = correlations[order][np.searchsorted(pair_keys[order], keys)]
+    return EdgeArrays(names, source, target, values.astype(np.float32))
+
+def approximate_edges(weights_df:pd.DataFrame, soft_floor:float, hard_floor:float, top_n:int,
+                      n_hashes:int=minhash.DEFAULT_HASHES, rows_per_band:int=minhash.DEFAULT_ROWS_PER_BAND,
+                      seed:int=0) -> EdgeArrays:
+    """
+    The approximate counterpart of extract_edges(calculate_correlations(weights_df), ...), for corpora too big for
+    the full correlation matrix: only the pairs of characters proposed by MinHash + LSH get their (exact) correlation
+    (see the minhash module). More hashes per band means fewer candidates, and a lower recall of the weak edges.
+    """
+    names = np.asarray(weights_df.iloc[:, 0])
+    rows, cols, correlations = minhash.approximate_correlations(correlation.to_sparse_weights(weights_df), n_hashes=n_hashes,
+                                                                rows_per_band=rows_per_band, seed=seed)
+    return extract_edges_from_pairs(names, rows, cols, correlations, soft_floor, hard_floor, top_n)
+
+def out_of_core_edges(weights, names:np.ndarray, soft_floor:float, hard_floor:float, top_n:int, directory:str,
+                      memory_budget:int=correlation.DEFAULT_MEMORY_BUDGET, dense:bool=False) -> EdgeArrays:
+    """
+    Same edges as extract_edges(calculate_correlations(weights_df), ...), for more characters than the correlation matrix
+    fits in memory: the correlations are computed a tile at a time (see correlation.tiled_correlations), and only the
+    pairs above the hard floor are written to directory. Nothing under the hard floor can be an edge, so they're enough.
+    
+    weights: a CSR matrix of weights (characters x issues), e.g. memory-mapped with correlation.open_csr, or a weights_df.
+    """
+    if isinstance(weights, pd.DataFrame):
+        weights = correlation.to_sparse_weights(weights)
+    correlation.tiled_correlations(weights, directory, hard_floor, memory_budget=memory_budget, dense=dense)
+    rows, cols, correlations = correlation.read_pairs(directory)
+    return extract_edges_from_pairs(names, rows, cols, correlations, soft_floor, hard_floor, top_n)
@@ -1,11 +1,15 @@
+from utils.incidence import levels_of_table, LEVELS, NO_APPEARANCE
 import pandas as pd
+import numpy as np
 
 def count_types_of_appearances(table:pd.DataFrame, sort=True) -> pd.DataFrame:
     """For each character in the table, count the number of each type of appearance."""
-    characters = pd.DataFrame({"character name":    pd.Series(table["character name"]), 
-                               "Appearances":       pd.Series((table.iloc[:,1:] == "Appearances").sum(axis=1)),
-                               "Minor Appearances": pd.Series((table.iloc[:,1:] == "Minor Appearances").sum(axis=1)),
-                               "Mentions":          pd.Series((table.iloc[:,1:] == "Mentions").sum(axis=1))})
+    # one pass over the int8 levels (see incidence.LEVELS), instead of a string comparison of the whole table per type
+    counts = count_levels(levels_of_table(table))
+    characters = pd.DataFrame({"character name":    pd.Series(table["character name"]),
+                               "Appearances":       pd.Series(counts[:, LEVELS["Appearances"]], index=table.index),
+                               "Minor Appearances": pd.Series(counts[:, LEVELS["Minor Appearances"]], index=table.index),
+                               "Mentions":          pd.Series(counts[:, LEVELS["Mentions"]], index=table.index)})
     
     characters["Total Appearances (Full and Minor)"] = characters["Appearances"] + characters["Minor Appearances"]
     characters["Appearances and Mentions (Full + Minor + Mentions)"] = characters["Total Appearances (Full and Minor)"] + characters["Mentions"]
@@ -15,6 +19,19 @@ def count_types_of_appearances(table:pd.DataFrame, sort=True) -> pd.DataFrame:
     
     return characters
 
+def count_levels(levels:np.ndarray) -> np.ndarray:
+    """
+    Counts the levels in each row of a characters x issues array of levels.
+    Returns an int64 array with a row per character and a column per level (column 0: the issues they're not in).
+    """
+    n_characters, n_issues = levels.shape
+    counts = np.empty((n_characters, len(LEVELS) + 1), dtype=np.int64)
+    # one pass per level over the int8 array (a boolean mask of the same size at a time, no int64 copy of it)
+    for level in LEVELS.values():
+        counts[:, level] = np.count_nonzero(levels == level, axis=1)
+    counts[:, NO_APPEARANCE] = n_issues - counts[:, NO_APPEARANCE + 1:].sum(axis=1)
+    return counts
+
 def drop_less_relevant_characters(dataframe_to_modify:pd.DataFrame, key_df:pd.DataFrame, column:str, threshold:int) -> pd.DataFrame:
     """Drop characters with less than a certain number of appearances."""
     result = dataframe_to_modify[key_df[column] >= threshold]
@@ -37,7 +54,34 @@ def filter_less_frequent_characters(dataframe_to_modify:pd.DataFrame, key_df:pd.
     
     """
   
-    number_of_characters_in_df = dataframe_to_modify.shape[0]
+    characters = characters_to_keep(key_df, number_of_issues=dataframe_to_modify.shape[1],
+                                    top_n_characters=top_n_characters, min_number_of_apperances=min_number_of_apperances,
+                                    character_percentile=character_percentile, min_frequency=min_frequency)
+    # key_df keeps the index of the table it was counted from (see count_types_of_appearances)
+    return dataframe_to_modify.loc[characters]
+
+def characters_to_keep(key_df:pd.DataFrame, number_of_issues:int,
+                       top_n_characters:int=None, min_number_of_apperances:int=None,
+                       character_percentile:float=None, min_frequency:float=None) -> pd.Index:
+    """
+    Same criteria as filter_less_frequent_characters, but only looks at the counts in key_df
+    (as returned by count_types_of_appearances).
+    Returns the index of the characters to keep, from the most to the least appearances.
+    """
+    positions = select_top_characters(key_df["Appearances"].to_numpy(), number_of_issues,
+                                      top_n_characters=top_n_characters, min_number_of_apperances=min_number_of_apperances,
+                                      character_percentile=character_percentile, min_frequency=min_frequency)
+    return key_df.index[positions]
+
+def select_top_characters(appearances:np.ndarray, number_of_issues:int,
+                          top_n_characters:int=None, min_number_of_apperances:int=None,
+                          character_percentile:float=None, min_frequency:float=None) -> np.ndarray:
+    """
+    Same criteria as filter_less_frequent_characters, on an array with the number of appearances of each character.
+    Returns the positions of the characters to keep, from the most to the least appearances
+    (characters with as many appearances stay in the order of the array).
+    """
+    number_of_characters_in_df = len(appearances)
     # Both -> convert, compare and keep the most restrictive criterion
     # None-None -> keep all characters    
     # None-x% -> keep top x% of characters
@@ -53,28 +97,38 @@ def filter_less_frequent_characters(dataframe_to_modify:pd.DataFrame, key_df:pd.
         number_of_characters_to_keep = top_x_perc_characters
     else:
         number_of_characters_to_keep = number_of_characters_in_df
-    # this relies on the 2 dataframes having the same index for the same characters.
     number_of_characters_to_keep = min(number_of_characters_to_keep, number_of_characters_in_df) # make sure we don't keep more than the number of characters in the dataframe
     number_of_characters_to_keep = int(number_of_characters_to_keep) # make sure we get an integer
-    characters_to_keep_idx = key_df.sort_values(by="Appearances", ascending=False).head(number_of_characters_to_keep).index
-    characters_to_keep = dataframe_to_modify.iloc[characters_to_keep_idx]
+    # only the characters that make the cut get sorted
+    top_characters = top_positions(appearances, number_of_characters_to_keep)
     
     # Now filter based on the number of appearances:
-    number_of_issues_in_df = dataframe_to_modify.shape[1]
     if min_number_of_apperances != None and min_frequency != None:
         # select the most restrictive of the conditions:
-        top_x_perc_appearances = number_of_issues_in_df * min_frequency
+        top_x_perc_appearances = number_of_issues * min_frequency
         min_appearances_to_keep = max(min_number_of_apperances, top_x_perc_appearances)
     elif min_number_of_apperances != None:
         min_appearances_to_keep = min_number_of_apperances
     elif min_frequency != None:
-        top_x_perc_appearances = number_of_issues_in_df * min_frequency
+        top_x_perc_appearances = number_of_issues * min_frequency
         min_appearances_to_keep = top_x_perc_appearances
     else:
         min_appearances_to_keep = 0
-    # this relies on the 2 dataframes having the same index for the same characters.
-    min_appearances_to_keep = min(min_appearances_to_keep, number_of_issues_in_df) # make sure we don't filter out more than the max number of issues
+    min_appearances_to_keep = min(min_appearances_to_keep, number_of_issues) # make sure we don't filter out more than the max number of issues
     min_appearances_to_keep = int(min_appearances_to_keep) # make sure we get an integer
-    characters_to_keep = characters_to_keep[key_df["Appearances"] >= min_appearances_to_keep]
-     
-    return characters_to_keep
\ No newline at end of file
+    return top_characters[appearances[top_characters] >= min_appearances_to_keep]
+
+def top_positions(values:np.ndarray, n:int) -> np.ndarray:
+    """The positions of the n highest values, from highest to lowest. Ties are kept in the order of the array."""
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    values = np.asarray(values)
+    if n < len(values):
+        # partition around the nth highest value, then take every value above it and the first of its ties
+        nth_value = values[np.argpartition(-values, n - 1)[n - 1]]
+        above = np.flatnonzero(values > nth_value)
+        ties = np.flatnonzero(values == nth_value)[:n - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.lexsort((candidates, -values[candidates]))]
@@ -0,0 +1,274 @@
+from utils import communities, storage, visualization
+from utils.incidence import Incidence
+from scipy import sparse
+import pandas as pd
+import numpy as np
+import argparse
+import bisect
+import json
+import os
+
+"""
+Questions about the graph of a saved run, answered from indexes built once from its data folder:
+    - the edges of every character, as a CSR adjacency with every row sorted by weight (strongest first)
+    - the issues of every character, as a CSR inverted index with every row sorted by issue
+    - the community of every character, and the members of every community (most appearances first)
+    - the names in lower case, sorted, to find "storm" or "Cyclops" by prefix
+
+Neighbours and top k are a slice of a row, shared issues an intersection of sorted rows, communities a slice,
+and paths a breadth-first search from both ends, so every query takes well under a millisecond on our graphs.
+
+The index is saved to data/index.npz next to the files it was built from, and built again when they change.
+
+    python -m utils.query "results/Krakoa Era" top Storm -k 20
+    python -m utils.query "results/Krakoa Era" links Cyclops Magneto
+    python -m utils.query "results/Krakoa Era" path Cyclops "Mister Sinister"
+    python -m utils.query "results/Krakoa Era" community 3
+    python -m utils.query "results/Krakoa Era" issues Cyclops "Jean Grey"
+"""
+
+INDEX_FILE = "index.npz"
+SOURCE_FILES = ["edges_filtered.csv", "communities.json", "table_of_appearances.csv", os.path.join("appearances", storage.ISSUES_FILE)]
+
+def csr_rows(rows:np.ndarray, values:np.ndarray, n_rows:int) -> tuple:
+    """(indptr, values) of a CSR with the values grouped by row, in their order within each row."""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, values[order]
+
+class GraphIndex:
+    def __init__(self, arrays:dict):
+        """arrays: the saved arrays (see build)."""
+        self.arrays = arrays
+        self.names = arrays["names"].tolist()
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.issues = arrays["issues"].tolist()
+        self.lookup_keys = arrays["lookup_keys"].tolist()
+        self.lookup_ids = arrays["lookup_ids"]
+        self.indptr, self.neighbours, self.weights = arrays["indptr"], arrays["neighbours"], arrays["weights"]
+        self.issue_indptr, self.issue_ids = arrays["issue_indptr"], arrays["issue_ids"]
+        self.n_appearances = arrays["n_appearances"]
+        self.community = arrays["community"]
+        self.community_indptr, self.community_members = arrays["community_indptr"], arrays["community_members"]
+
+    @classmethod
+    def build(cls, edges:pd.DataFrame, appearances:Incidence, partition:dict=None) -> "GraphIndex":
+        """
+        edges: source, target, weight (like edges_filtered.csv). appearances: who appears in which issue
+        (aliases are merged). partition: {character: community} (default: the communities of the graph, like in the html).
+        """
+        characters = np.array(appearances.characters, dtype=object)
+        source, target, weight = edges.iloc[:, 0].to_numpy(), edges.iloc[:, 1].to_numpy(), edges.iloc[:, 2].to_numpy(np.float64)
+        codes, names = pd.factorize(np.concatenate([source, target, characters]))
+        n = len(names)
+        source, target, rows = codes[:len(source)], codes[len(source):2 * len(source)], codes[2 * len(source):]
+        # edge lists saved by filter_edges have every edge in both directions: keep each pair once
+        _, first = np.unique(np.minimum(source, target).astype(np.int64) * n + np.maximum(source, target), return_index=True)
+        first = np.sort(first)
+        source, target, weight = source[first], target[first], weight[first]
+
+        # adjacency, both directions, every row sorted by weight (then by name, for ties)
+        row, neighbour, weights = np.r_[source, target], np.r_[target, source], np.r_[weight, weight]
+        alphabetical = np.argsort(np.argsort(np.asarray(names, dtype=str), kind="stable"))
+        order = np.lexsort((alphabetical[neighbour], -weights, row))
+        indptr, neighbours = csr_rows(row[order], neighbour[order], n)
+        neighbour_weights = weights[order]
+
+        # issues of every character (the rows of aliases merged), sorted
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(n, len(rows))) @ (appearances.matrix > 0)
+        matrix = sparse.csr_matrix(matrix)
+        matrix.sort_indices()
+        issue_indptr, issue_ids = matrix.indptr.astype(np.int64), matrix.indices.astype(np.int32)
+
+        # communities: of the graph's nodes, -1 for the other characters
+        if partition is None:
+            G = visualization.make_graph(edges)
+            partition = G.partition_communities()
+        community = communities.partition_to_labels(list(names), partition)
+        n_appearances = np.diff(issue_indptr)
+        members = np.flatnonzero(community >= 0)
+        members = members[np.lexsort((members, -n_appearances[members], community[members]))]
+        community_indptr = np.zeros(community.max(initial=-1) + 2, dtype=np.int64)
+        np.cumsum(np.bincount(community[members], minlength=len(community_indptr) - 1), out=community_indptr[1:])
+
+        lower = np.array([name.lower() for name in names], dtype=object)
+        lookup_order = np.argsort(lower, kind="stable")
+        arrays = {"names": np.array(names, dtype=str), "issues": np.array(appearances.issues, dtype=str),
+                  "indptr": indptr, "neighbours": neighbours.astype(np.int32), "weights": neighbour_weights,
+                  "issue_indptr": issue_indptr, "issue_ids": issue_ids, "n_appearances": n_appearances,
+                  "community": community, "community_indptr": community_indptr, "community_members": members.astype(np.int32),
+                  "lookup_keys": lower[lookup_order].astype(str), "lookup_ids": lookup_order.astype(np.int32)}
+        return cls(arrays)
+
+    def save(self, path:str) -> None:
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **self.arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path:str) -> "GraphIndex":
+        with np.load(path) as saved:
+            return cls({key: saved[key] for key in saved.files})
+
+    def resolve(self, name:str) -> int:
+        """
+        The id of a character: its exact name, or else the one with the most appearances among the names that start with
+        it (or contain it), ignoring case. "storm" finds "Storm (Ororo Munroe)".
+        """
+        i = self.ids.get(name)
+        if i is not None:
+            return i
+        key = name.lower()
+        first = bisect.bisect_left(self.lookup_keys, key)
+        last = bisect.bisect_left(self.lookup_keys, key + "\uffff")
+        candidates = self.lookup_ids[first:last]
+        if len(candidates) == 0:
+            candidates = [self.lookup_ids[k] for k, other in enumerate(self.lookup_keys) if key in other]
+        if len(candidates) == 0:
+            raise KeyError(f"No character called {name!r}.")
+        candidates = np.asarray(candidates)
+        return int(candidates[np.argmax(self.n_appearances[candidates])])
+
+    def top_k(self, name:str, k:int=None) -> list:
+        """The k strongest edges of the character (all of them by default): [(neighbour, weight)], strongest first."""
+        i = self.resolve(name)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        if k is not None:
+            end = min(end, start + k)
+        return [(self.names[j], w) for j, w in zip(self.neighbours[start:end].tolist(), self.weights[start:end].tolist())]
+
+    def neighbours_of(self, name:str) -> list:
+        return [neighbour for neighbour, _ in self.top_k(name)]
+
+    def links(self, first:str, second:str) -> list:
+        """The characters linked to both: [(character, weight to first, weight to second)], by the weaker of the two links."""
+        i, j = self.resolve(first), self.resolve(second)
+        row_i, row_j = slice(self.indptr[i], self.indptr[i + 1]), slice(self.indptr[j], self.indptr[j + 1])
+        common, in_i, in_j = np.intersect1d(self.neighbours[row_i], self.neighbours[row_j], assume_unique=True, return_indices=True)
+        weight_i, weight_j = self.weights[row_i][in_i], self.weights[row_j][in_j]
+        order = np.lexsort((common, -np.minimum(weight_i, weight_j)))
+        return [(self.names[c], a, b) for c, a, b in zip(common[order].tolist(), weight_i[order].tolist(), weight_j[order].tolist())]
+
+    def path(self, first:str, second:str) -> list:
+        """A shortest path (fewest edges) from one character to the other, both included ([] if they aren't connected)."""
+        i, j = self.resolve(first), self.resolve(second)
+        if i == j:
+            return [self.names[i]]
+        # breadth-first from both ends, always growing the smaller frontier
+        parents = [{i: None}, {j: None}]
+        frontiers = [[i], [j]]
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            seen, other = parents[side], parents[1 - side]
+            next_frontier = []
+            for node in frontiers[side]:
+                for neighbour in self.neighbours[self.indptr[node]:self.indptr[node + 1]].tolist():
+                    if neighbour in seen:
+                        continue
+                    seen[neighbour] = node
+                    if neighbour in other:
+                        return self._join(parents, neighbour)
+                    next_frontier.append(neighbour)
+            frontiers[side] = next_frontier
+        return []
+
+    def _join(self, parents:list, meeting:int) -> list:
+        halves = []
+        for side in (0, 1):
+            half, node = [], meeting
+            while node is not None:
+                half.append(node)
+                node = parents[side][node]
+            halves.append(half)
+        return [self.names[node] for node in halves[0][::-1] + halves[1][1:]]
+
+    def community_of(self, name:str) -> int:
+        """The community of the character in the graph (-1 if it isn't in the graph)."""
+        return int(self.community[self.resolve(name)])
+
+    def members(self, community:int) -> list:
+        """The characters of a community, most appearances first."""
+        if not 0 <= community < len(self.community_indptr) - 1:
+            raise KeyError(f"No community {community}: there are {len(self.community_indptr) - 1}.")
+        return [self.names[i] for i in self.community_members[self.community_indptr[community]:self.community_indptr[community + 1]].tolist()]
+
+    def issues_of(self, *names:str) -> list:
+        """The issues all the characters appear in, in the order of the corpus."""
+        shared = None
+        for name in names:
+            i = self.resolve(name)
+            row = self.issue_ids[self.issue_indptr[i]:self.issue_indptr[i + 1]]
+            shared = row if shared is None else np.intersect1d(shared, row, assume_unique=True)
+        return [self.issues[k] for k in shared.tolist()]
+
+def build_index(data_path:str) -> GraphIndex:
+    """Builds the index of a run's data folder (edges_filtered.csv, appearances, and communities.json if there is one)."""
+    edges_path = os.path.join(data_path, "edges_filtered.csv")
+    if not os.path.exists(edges_path):
+        raise FileNotFoundError(f"{edges_path} doesn't exist: run the pipeline first.")
+    partition = None
+    if os.path.exists(os.path.join(data_path, "communities.json")):
+        with open(os.path.join(data_path, "communities.json"), encoding="utf-8") as f:
+            partition = json.load(f)
+    return GraphIndex.build(pd.read_csv(edges_path), storage.load_run_appearances(data_path), partition)
+
+def open_index(data_path:str, rebuild:bool=False) -> GraphIndex:
+    """The index of a run's data folder, built (and saved as data/index.npz) if it's missing or older than its sources."""
+    path = os.path.join(data_path, INDEX_FILE)
+    sources = [os.path.join(data_path, file_name) for file_name in SOURCE_FILES]
+    newest_source = max((os.path.getmtime(source) for source in sources if os.path.exists(source)), default=0)
+    if not rebuild and os.path.exists(path) and os.path.getmtime(path) >= newest_source:
+        return GraphIndex.load(path)
+    index = build_index(data_path)
+    index.save(path)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Queries the graph of a saved run.")
+    parser.add_argument("run", help='the folder of the run, e.g. "results/Krakoa Era"')
+    parser.add_argument("--rebuild", action="store_true", help="build the index again")
+    commands = parser.add_subparsers(dest="command", required=True)
+    top = commands.add_parser("top", help="strongest edges of a character")
+    top.add_argument("character")
+    top.add_argument("-k", type=int, default=20)
+    for command, help_text in (("links", "characters linked to both"), ("path", "shortest path between them")):
+        pair = commands.add_parser(command, help=help_text)
+        pair.add_argument("first")
+        pair.add_argument("second")
+    community = commands.add_parser("community", help="members of a community, or the community of a character")
+    community.add_argument("community")
+    issues = commands.add_parser("issues", help="issues all the characters appear in")
+    issues.add_argument("characters", nargs="+")
+    args = parser.parse_args()
+
+    index = open_index(os.path.join(args.run, "data"), rebuild=args.rebuild)
+    try:
+        run_command(index, args)
+    except KeyError as error:
+        parser.exit(1, f"{error.args[0]}\n")
+
+def run_command(index:GraphIndex, args:argparse.Namespace) -> None:
+    if args.command == "top":
+        for neighbour, weight in index.top_k(args.character, args.k):
+            print(f"{weight:6.3f}  {neighbour}")
+    elif args.command == "links":
+        links = index.links(args.first, args.second)
+        for character, first, second in links:
+            print(f"{first:6.3f} {second:6.3f}  {character}")
+        if not links:
+            print("No character is linked to both. Shortest path: " + (" -> ".join(index.path(args.first, args.second)) or "none."))
+    elif args.command == "path":
+        print(" -> ".join(index.path(args.first, args.second)) or "Not connected.")
+    elif args.command == "community":
+        number = int(args.community) if args.community.lstrip("-").isdigit() else index.community_of(args.community)
+        members = index.members(number)
+        print(f"Community {number}:")
+        for member in members:
+            print(f"  {member}")
+    elif args.command == "issues":
+        for issue in index.issues_of(*args.characters):
+            print(issue)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
 from utils.ComicSeries import ComicSeries
+from utils.cache import PageCache, DEFAULT_CACHE_DIR, DEFAULT_TTL, DEFAULT_MAX_SIZE
+from utils.instrumentation import FetchStats
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from urllib.parse import urlsplit
+import threading
 import logging
+import time
 
 #set up logging
 logging.basicConfig(filename = "error.log", encoding='utf-8', level=logging.INFO)
@@ -17,6 +25,65 @@ TITLES_TO_DOWNLOAD = [ComicSeries(title="X-Men",         volume=1, first_issue=9
                       ComicSeries(title="Fallen Angels", volume=1, first_issue=1, last_issue=8),
                       ComicSeries(title="X-Terminators", volume=1, first_issue=1, last_issue=4)]
 
+MAX_IN_FLIGHT = 8 # default number of concurrent requests
+REQUESTS_PER_SECOND_PER_HOST = 10 # be nice to the wiki
+
+class ScrapeError(Exception):
+    """Raised when a page could not be downloaded after all the retries."""
+
+class RateLimiter:
+    """
+    Spaces out the requests made to each host so that there are at most `requests_per_second` of them.
+    
+    Thread-safe: every fetcher thread calls wait(url) before sending its request.
+    """
+    def __init__(self, requests_per_second:float=REQUESTS_PER_SECOND_PER_HOST):
+        self.min_interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = {} # host -> earliest time the next request can go out
+        self.lock = threading.Lock()
+    
+    def wait(self, url:str) -> None:
+        if self.min_interval == 0:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            # reserve the next free slot for this host, then sleep outside the lock
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def make_session(pool_size:int=MAX_IN_FLIGHT) -> requests.Session:
+    """
+    Returns a requests session that keeps up to pool_size connections open per host,
+    so concurrent fetchers reuse connections instead of doing a new handshake per issue.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# shared by every call that doesn't pass its own session
+SESSION = make_session()
+
+# shared page cache. None (the default) means every page is downloaded again.
+CACHE = None
+
+# latency, retries and failures of every request sent (see the instrumentation module). Reset it to measure a run.
+FETCH_STATS = FetchStats()
+
+def enable_cache(directory:str=DEFAULT_CACHE_DIR, ttl:float=DEFAULT_TTL, max_size:int=DEFAULT_MAX_SIZE) -> PageCache:
+    """Keeps the downloaded pages on disk, so the next runs only revalidate them. Returns the cache."""
+    global CACHE
+    CACHE = PageCache(directory, ttl=ttl, max_size=max_size)
+    return CACHE
+
+def disable_cache() -> None:
+    global CACHE
+    CACHE = None
+
 def build_full_list_of_issues(titles_to_download:list[ComicSeries]=TITLES_TO_DOWNLOAD) -> list[dict]:
     """
     Returns a list of issues for each title in TITLES_TO_DOWNLOAD.
@@ -33,25 +100,102 @@ def build_full_list_of_issues(titles_to_download:list[ComicSeries]=TITLES_TO_DOW
     return full_list_of_issues
 
 
-def soup_from_url(url:str, retries=0, max_retries=3):
+def html_from_url(url:str, retries=0, max_retries=3, session:requests.Session=None, rate_limiter:RateLimiter=None,
+                  cache:PageCache=None) -> bytes:
     """
-    Returns the soup from the url. If it fails, tries a maximum of max_retries times.
+    Returns the raw html of the url. If it fails, tries a maximum of max_retries times.
+    
+    If a page cache is enabled (see enable_cache), fresh pages are read from disk,
+    and stale ones are revalidated with a conditional request.
+    """
+    cache = cache or CACHE
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and not cache.is_stale(entry):
+        cache.record("hit")
+        return entry.content
+    
+    headers = entry.conditional_headers() if entry is not None else {}
+    response = download(url, headers, retries=retries, max_retries=max_retries, session=session, rate_limiter=rate_limiter)
+    
+    if response.status_code == 304:
+        # not modified since we cached it
+        cache.refresh(entry)
+        cache.record("revalidated")
+        return entry.content
+    if cache is not None:
+        cache.record("miss")
+        cache.put(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return response.content
+
+def download(url:str, headers:dict=None, retries=0, max_retries=3, session:requests.Session=None,
+             rate_limiter:RateLimiter=None) -> requests.Response:
+    """
+    Sends the request, retrying a maximum of max_retries times.
+    Returns the response if it's a 200, or a 304 to a conditional request.
     """
-    response = requests.get(url)    
-    soup = BeautifulSoup(response.content, "html.parser")
+    session = session or SESSION
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    start = time.perf_counter()
+    response = session.get(url, headers=headers)
+    FETCH_STATS.record_request(time.perf_counter() - start, response.status_code)
     
-    if response.status_code == 200:
+    if response.status_code == 200 or (response.status_code == 304 and headers):
         # All good. Return.
-        return soup
+        return response
     elif retries <= max_retries: #retry at most this many tries
         error_message = f"Tried to scrape and failed.   " \
                         f"Response code: {response.status_code}   " \
                         f"Tries: {retries}   " \
-                        f"len(soup): {len(soup)}   " \
                         f"len(response.content()): {len(response.content)}   " \
                         f"URL: {url.split('/')[-1]}"
         logging.warning(error_message)
-        return soup_from_url(url, retries=retries+1)
+        FETCH_STATS.record_retry()
+        return download(url, headers, retries=retries+1, max_retries=max_retries, session=session, rate_limiter=rate_limiter)
     else:
-        logging.error(f"Tried too many times and failed. Exiting.")
-        assert False #assert False is bad practice. create an err.
\ No newline at end of file
+        logging.error(f"Tried too many times and failed. URL: {url}")
+        FETCH_STATS.record_failure()
+        raise ScrapeError(f"Failed to download {url} after {retries} tries (last response code: {response.status_code}).")
+
+def soup_from_url(url:str, retries=0, max_retries=3, session:requests.Session=None, rate_limiter:RateLimiter=None) -> BeautifulSoup:
+    """
+    Returns the soup from the url. If it fails, tries a maximum of max_retries times.
+    """
+    html = html_from_url(url, retries=retries, max_retries=max_retries, session=session, rate_limiter=rate_limiter)
+    return BeautifulSoup(html, "html.parser")
+
+def iter_html_from_urls(urls:list[str], max_in_flight:int=MAX_IN_FLIGHT,
+                        requests_per_second:float=REQUESTS_PER_SECOND_PER_HOST,
+                        session:requests.Session=None):
+    """
+    Downloads the urls concurrently and yields their raw html in the same order as the urls.
+    
+    At most max_in_flight requests are running (or finished but not yet consumed) at any time,
+    so a slow consumer doesn't make the whole list pile up in memory.
+    Each host gets at most requests_per_second requests (None or 0 to disable the limit).
+    """
+    session = session or (SESSION if max_in_flight <= MAX_IN_FLIGHT else make_session(max_in_flight))
+    rate_limiter = RateLimiter(requests_per_second)
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = deque()
+        urls = iter(urls)
+        # fill the window
+        for url in urls:
+            pending.append(executor.submit(html_from_url, url, session=session, rate_limiter=rate_limiter))
+            if len(pending) >= max_in_flight:
+                break
+        # yield in order, topping up the window every time one comes out
+        while pending:
+            html = pending.popleft().result()
+            next_url = next(urls, None)
+            if next_url is not None:
+                pending.append(executor.submit(html_from_url, next_url, session=session, rate_limiter=rate_limiter))
+            yield html
+
+def iter_soups_from_urls(urls:list[str], max_in_flight:int=MAX_IN_FLIGHT,
+                         requests_per_second:float=REQUESTS_PER_SECOND_PER_HOST,
+                         session:requests.Session=None):
+    """Same as iter_html_from_urls, but yields the parsed soups."""
+    for html in iter_html_from_urls(urls, max_in_flight=max_in_flight, requests_per_second=requests_per_second, session=session):
+        yield BeautifulSoup(html, "html.parser")
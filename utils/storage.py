@@ -0,0 +1,382 @@
+from utils import aliases
+from utils.incidence import Incidence, Interner, IdTranslation, LEVELS, NO_APPEARANCE, keep_highest_level
+from scipy import sparse
+import pandas as pd
+import numpy as np
+from urllib.parse import unquote
+import argparse
+import shutil
+import json
+import glob
+import os
+
+"""
+Long-format binary storage of the appearances, instead of the wide table_of_appearances.csv.
+
+A store is a directory with one file per column, as raw little-endian arrays that can be memory-mapped:
+    character_id.i32   int32
+    issue_id.i32       int32
+    level.i8           int8 (see incidence.LEVELS)
+and two string dictionaries, one json string per line (the id is the line number):
+    characters.jsonl   the names the characters are shown as (see aliases.canonical_name)
+    issues.jsonl       the issue title, and the number of rows and characters stored once the issue was complete
+
+The store is append-only: every issue appends its rows, then its line in issues.jsonl, which commits it.
+When a store is opened, anything written after the last committed issue (e.g. by a run that crashed) is cut off.
+
+Every series goes to the same shared store (SHARED_STORE_DIR), with the issues keyed by canonical_issue_id,
+so an issue that's in more than one reading order is only scraped and stored once.
+A corpus (the issues of one graph) is just a selection of that store, see AppearanceStore.select.
+"""
+
+COLUMNS = {"character_id": ("character_id.i32", np.int32),
+           "issue_id":     ("issue_id.i32", np.int32),
+           "level":        ("level.i8", np.int8)}
+CHARACTERS_FILE = "characters.jsonl"
+ISSUES_FILE = "issues.jsonl"
+# in the project folder, wherever the scripts are started from (a second store would scrape everything again)
+SHARED_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "appearances")
+
+def canonical_issue_id(issue:dict) -> str:
+    """
+    The name of the wiki page of an issue, which is what the store is keyed by.
+    {"title": "Devil's Reign: X-Men Vol 1 1", "url": "https://marvel.fandom.com/wiki/Devil%27s_Reign:_X-Men_Vol_1_1"}
+        -> "Devil's Reign: X-Men Vol 1 1"
+    Two entries that point to the same page are the same issue, whatever their titles.
+    """
+    return unquote(issue["url"].rsplit("/wiki/", 1)[-1]).replace("_", " ")
+
+class AppearanceStore:
+    """
+    Usage:
+        store = AppearanceStore("results/X-Men/data/appearances")
+        store.append_issue("X-Men Vol 1 94", ["Scott Summers", "Ororo Munroe"], ["Appearances", "Mentions"])
+        table = store.to_table()
+    """
+    def __init__(self, directory:str, durable:bool=False):
+        """durable: fsync after every issue, so a power cut can't lose a committed issue (slower)."""
+        self.directory = directory
+        self.durable = durable
+        os.makedirs(directory, exist_ok=True)
+        self.issues = Interner()
+        self.issue_ends = [] # number of rows once each issue was committed
+        n_characters = None
+        for record in self._read_lines(ISSUES_FILE):
+            self.issues.id_of(record["title"])
+            self.issue_ends.append(record["end"])
+            n_characters = record["characters"]
+        characters = self._read_lines(CHARACTERS_FILE)
+        if n_characters is not None and len(characters) > n_characters:
+            # characters of an issue that was never committed
+            characters = characters[:n_characters]
+            self._rewrite_lines(CHARACTERS_FILE, characters)
+        self.characters = Interner(characters)
+        self.translation = IdTranslation(self.characters)
+        self._truncate_uncommitted()
+    
+    def _path(self, file_name:str) -> str:
+        return os.path.join(self.directory, file_name)
+    
+    def _read_lines(self, file_name:str) -> list:
+        """Reads a jsonl file, dropping a last line that was only partly written."""
+        path = self._path(file_name)
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(len(complete))
+        return [json.loads(line) for line in complete.decode("utf-8").splitlines()]
+    
+    def _rewrite_lines(self, file_name:str, records:list) -> None:
+        with open(self._path(file_name), "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+    
+    def _truncate_uncommitted(self) -> None:
+        """Cuts the column files back to the rows of the committed issues."""
+        n_rows = self.issue_ends[-1] if self.issue_ends else 0
+        for file_name, dtype in COLUMNS.values():
+            path = self._path(file_name)
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            size = n_rows * np.dtype(dtype).itemsize
+            if os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+    
+    def __len__(self) -> int:
+        """Number of appearances stored."""
+        return self.issue_ends[-1] if self.issue_ends else 0
+    
+    def __contains__(self, issue_title:str) -> bool:
+        return issue_title in self.issues
+    
+    def append_issue(self, issue_title:str, character_names, types_of_appearance) -> None:
+        """
+        Appends (and commits) the appearances of an issue. Types that aren't in TYPE_OF_APPEARANCE are ignored,
+        and a character listed more than once keeps its highest type of appearance.
+        """
+        new_characters = []
+        rows, levels = [], []
+        for name, type_of_appearance in zip(character_names, types_of_appearance):
+            name = aliases.canonical_name(name)
+            if name not in self.characters:
+                new_characters.append(name)
+            character_id = self.characters.id_of(name)
+            level = LEVELS.get(type_of_appearance, NO_APPEARANCE)
+            if level != NO_APPEARANCE:
+                rows.append(character_id)
+                levels.append(level)
+        self.append_rows(issue_title, np.array(rows, dtype=np.int32), np.array(levels, dtype=np.int8), new_characters)
+    
+    def append_issue_ids(self, issue_title:str, ids:np.ndarray, levels:np.ndarray, names:list[str]) -> None:
+        """
+        Same as append_issue, with the characters given as ids of a shared name table (names: its list of names)
+        and their levels, as returned by names.NameTable.parse_titles.
+        """
+        n_characters = len(self.characters)
+        character_ids = self.translation(ids, names)
+        levels = np.asarray(levels, dtype=np.int8)
+        appears = levels != NO_APPEARANCE
+        new_characters = self.characters.names[n_characters:]
+        self.append_rows(issue_title, character_ids[appears], levels[appears], new_characters)
+    
+    def append_rows(self, issue_title:str, character_ids:np.ndarray, levels:np.ndarray, new_characters:list[str]=()) -> None:
+        """Appends an issue given as character ids (already interned) and levels."""
+        issue_id = len(self.issues)
+        character_ids, _, levels = keep_highest_level(character_ids, np.zeros_like(character_ids), levels, 1)
+        self._append_lines(CHARACTERS_FILE, new_characters)
+        columns = {"character_id": character_ids.astype(np.int32),
+                   "issue_id": np.full(len(character_ids), issue_id, dtype=np.int32),
+                   "level": levels.astype(np.int8)}
+        for column, (file_name, dtype) in COLUMNS.items():
+            with open(self._path(file_name), "ab") as f:
+                f.write(columns[column].astype(dtype).tobytes())
+                self._sync(f)
+        # commit
+        end = len(self) + len(character_ids)
+        self._append_lines(ISSUES_FILE, [{"title": issue_title, "end": end, "characters": len(self.characters)}])
+        self.issues.id_of(issue_title)
+        self.issue_ends.append(end)
+    
+    def _append_lines(self, file_name:str, records:list) -> None:
+        if not records:
+            return
+        with open(self._path(file_name), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            self._sync(f)
+    
+    def _sync(self, f) -> None:
+        if self.durable:
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def columns(self, mmap:bool=True) -> dict:
+        """
+        Returns the character_id, issue_id and level arrays of the committed rows.
+        With mmap, they are read-only memory maps of the files (nothing is copied until used).
+        """
+        n_rows = len(self)
+        arrays = {}
+        for column, (file_name, dtype) in COLUMNS.items():
+            if n_rows == 0:
+                arrays[column] = np.empty(0, dtype=dtype)
+            elif mmap:
+                arrays[column] = np.memmap(self._path(file_name), dtype=dtype, mode="r", shape=(n_rows,))
+            else:
+                arrays[column] = np.fromfile(self._path(file_name), dtype=dtype, count=n_rows)
+        return arrays
+    
+    def to_incidence(self) -> Incidence:
+        columns = self.columns()
+        matrix = sparse.csr_matrix((columns["level"], (columns["character_id"], columns["issue_id"])),
+                                   shape=(len(self.characters), len(self.issues)), dtype=np.int8)
+        return Incidence(list(self.characters.names), list(self.issues.names), matrix)
+    
+    def select(self, issue_ids:list[str], titles:list[str]=None) -> Incidence:
+        """
+        Returns the incidence of some of the issues (e.g. the issues of one corpus), in that order,
+        reading only their rows. titles are the names of the columns (default: the issue ids).
+        Characters that don't appear in any of them are dropped.
+        """
+        titles = dict(zip(issue_ids, titles or issue_ids)) # also drops repeated issues
+        missing = [issue_id for issue_id in titles if issue_id not in self.issues]
+        if missing:
+            raise KeyError(f"Issues not in the store: {missing[:5]}")
+        columns = self.columns()
+        starts = np.array([0] + self.issue_ends[:-1], dtype=np.int64)
+        ends = np.array(self.issue_ends, dtype=np.int64)
+        positions = np.array([self.issues.ids[issue_id] for issue_id in titles], dtype=np.int64)
+        lengths = ends[positions] - starts[positions]
+        rows = np.concatenate([np.arange(starts[p], ends[p]) for p in positions]) if len(positions) else np.zeros(0, dtype=np.int64)
+        character_ids = np.asarray(columns["character_id"][rows])
+        characters = np.unique(character_ids) # same order as in the store
+        matrix = sparse.csr_matrix((np.asarray(columns["level"][rows]),
+                                    (np.searchsorted(characters, character_ids), np.repeat(np.arange(len(positions)), lengths))),
+                                   shape=(len(characters), len(positions)), dtype=np.int8)
+        return Incidence([self.characters.names[i] for i in characters], list(titles.values()), matrix)
+    
+    def issue_rows(self, issue_id:str) -> tuple[np.ndarray, np.ndarray]:
+        """The character ids and levels of one issue."""
+        position = self.issues.ids[issue_id]
+        start = self.issue_ends[position-1] if position > 0 else 0
+        columns = self.columns()
+        return (np.asarray(columns["character_id"][start:self.issue_ends[position]]),
+                np.asarray(columns["level"][start:self.issue_ends[position]]))
+    
+    def has_same_rows(self, issue_title:str, ids:np.ndarray, levels:np.ndarray, names:list[str]) -> bool:
+        """Whether the issue is stored with these characters (ids of a shared name table, see append_issue_ids) and levels."""
+        stored_ids, stored_levels = self.issue_rows(issue_title)
+        stored = dict(zip([self.characters.names[i] for i in stored_ids], stored_levels.tolist()))
+        given = {}
+        for character_id, level in zip(np.asarray(ids).tolist(), np.asarray(levels).tolist()):
+            if level != NO_APPEARANCE:
+                name = aliases.canonical_name(names[character_id])
+                given[name] = max(level, given.get(name, NO_APPEARANCE))
+        return given == stored
+    
+    def replace_issues(self, issues:dict, names:list[str]) -> None:
+        """
+        Replaces the appearances of some issues, {issue_title: (ids, levels)} with ids of a shared name table
+        (see append_issue_ids), keeping their place among the issues. The other issues keep their rows.
+        The store is written again to a folder next to it, which then takes its place: this is for the few issues
+        whose page changed, not for every run.
+        """
+        missing = [issue_title for issue_title in issues if issue_title not in self.issues]
+        if missing:
+            raise KeyError(f"Issues not in the store: {missing[:5]}")
+        new_directory = self.directory.rstrip("/\\") + ".rewrite"
+        if os.path.exists(new_directory):
+            shutil.rmtree(new_directory) # left by a rewrite that crashed
+        new = AppearanceStore(new_directory, durable=self.durable)
+        for name in self.characters.names:
+            new.characters.id_of(name) # same ids as before
+        new_characters = list(self.characters.names)
+        columns = self.columns(mmap=False)
+        start = 0
+        for issue_title, end in zip(self.issues.names, self.issue_ends):
+            if issue_title in issues:
+                n_characters = len(new.characters)
+                ids, levels = issues[issue_title]
+                character_ids = new.translation(ids, names)
+                levels = np.asarray(levels, dtype=np.int8)
+                appears = levels != NO_APPEARANCE
+                new_characters += new.characters.names[n_characters:]
+                new.append_rows(issue_title, character_ids[appears], levels[appears], new_characters)
+            else:
+                new.append_rows(issue_title, columns["character_id"][start:end], columns["level"][start:end], new_characters)
+            new_characters = []
+            start = end
+        # swap the folders, then read the new one
+        old_directory = self.directory.rstrip("/\\") + ".old"
+        if os.path.exists(old_directory):
+            shutil.rmtree(old_directory)
+        os.rename(self.directory, old_directory)
+        os.rename(new_directory, self.directory)
+        shutil.rmtree(old_directory)
+        self.__init__(self.directory, durable=self.durable)
+    
+    def to_table(self) -> pd.DataFrame:
+        """Returns the wide table_of_appearances."""
+        return self.to_incidence().to_table()
+    
+    @classmethod
+    def from_incidence(cls, incidence:Incidence, directory:str) -> "AppearanceStore":
+        """Writes an incidence matrix to a new store, issue by issue."""
+        store = cls(directory)
+        if len(store.issues) > 0:
+            raise FileExistsError(f"There is already a store in {directory}.")
+        new_characters = [name for name in incidence.characters if name not in store.characters]
+        for name in incidence.characters:
+            store.characters.id_of(name)
+        by_issue = incidence.matrix.tocsc()
+        for j, issue in enumerate(incidence.issues):
+            column = slice(by_issue.indptr[j], by_issue.indptr[j+1])
+            store.append_rows(issue, by_issue.indices[column], by_issue.data[column], new_characters if j == 0 else ())
+        if not incidence.issues:
+            store._append_lines(CHARACTERS_FILE, new_characters)
+        return store
+
+def copy_issues(source:AppearanceStore, target:AppearanceStore, issue_ids:list[str]=None) -> list[str]:
+    """
+    Appends the issues of source (by default, all of them) that target doesn't have yet.
+    Returns the ids of the issues that were copied.
+    """
+    if issue_ids is None:
+        issue_ids = source.issues.names
+    copied = []
+    for issue_id in issue_ids:
+        if issue_id in target:
+            continue
+        character_ids, levels = source.issue_rows(issue_id)
+        target.append_issue_ids(issue_id, character_ids, levels, source.characters.names)
+        copied.append(issue_id)
+    return copied
+
+def save_run_issues(shared:AppearanceStore, directory:str, issue_ids:list[str], rewrite:bool=False) -> tuple[AppearanceStore, bool]:
+    """
+    Copies the issues of a run from the shared store to the store of the run (e.g. results/X-Men/data/appearances),
+    in the order of issue_ids, so that the run can be updated (main.update_graph) or queried later without its series.
+    If the store of the run has issues that don't start the list (the run was made again with other series),
+    it's written again from scratch, as it is with rewrite (e.g. after issues of the shared store were refreshed).
+    Returns (the store, whether it was written again).
+    """
+    store = AppearanceStore(directory)
+    issue_ids = list(dict.fromkeys(issue_ids))
+    rewritten = (rewrite and len(store.issues) > 0) or store.issues.names != issue_ids[:len(store.issues)]
+    if rewritten:
+        shutil.rmtree(directory)
+        store = AppearanceStore(directory)
+    copy_issues(shared, store, issue_ids)
+    return store, rewritten
+
+def has_store(directory:str) -> bool:
+    """Whether there is a store (with at least one issue) in the directory."""
+    return os.path.exists(os.path.join(directory, ISSUES_FILE))
+
+def load_run_appearances(data_path:str) -> Incidence:
+    """The appearances of a saved run: its store if it was migrated, otherwise its table_of_appearances.csv."""
+    store_path = os.path.join(data_path, "appearances")
+    if has_store(store_path):
+        return AppearanceStore(store_path).to_incidence()
+    return Incidence.from_table(pd.read_csv(os.path.join(data_path, "table_of_appearances.csv")))
+
+def migrate_csv(csv_path:str, directory:str=None) -> AppearanceStore:
+    """
+    Converts a saved table_of_appearances.csv to a store.
+    By default the store is written to an "appearances" folder next to the csv.
+    """
+    if directory is None:
+        directory = os.path.join(os.path.dirname(csv_path), "appearances")
+    table = pd.read_csv(csv_path)
+    return AppearanceStore.from_incidence(Incidence.from_table(table), directory)
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts the table_of_appearances.csv of saved runs to binary stores, "
+                                                 "and adds their issues to the shared store.")
+    parser.add_argument("data_folders", nargs="*", help="default: every results/*/data folder")
+    parser.add_argument("--shared-store", default=SHARED_STORE_DIR, help="where the issues of every run are gathered")
+    args = parser.parse_args()
+    data_folders = args.data_folders or glob.glob(os.path.join("results", "*", "data"))
+    shared = AppearanceStore(args.shared_store)
+    for data_folder in data_folders:
+        csv_path = os.path.join(data_folder, "table_of_appearances.csv")
+        store_path = os.path.join(data_folder, "appearances")
+        if has_store(store_path):
+            print(f"{data_folder}: already migrated")
+            store = AppearanceStore(store_path)
+        elif os.path.exists(csv_path):
+            store = migrate_csv(csv_path)
+            print(f"{data_folder}: {len(store.characters)} characters, {len(store.issues)} issues, {len(store)} appearances")
+        else:
+            print(f"Skipping {data_folder}: no table_of_appearances.csv")
+            continue
+        # the saved tables are keyed by issue title, which is also the name of the wiki page
+        copied = copy_issues(store, shared)
+        print(f"    {len(copied)} new issues in the shared store")
+    print(f"Shared store: {len(shared.characters)} characters, {len(shared.issues)} issues, {len(shared)} appearances")
+
+if __name__ == "__main__":
+    main()
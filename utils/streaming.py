@@ -0,0 +1,95 @@
+from utils import scrape, parse_issues, prepare_edges, process_appearances, storage, incremental, extract
+from utils.names import NameTable
+import pandas as pd
+import numpy as np
+
+"""
+From the issues to the edges without the wide table of appearances.
+
+The table path (build_full_table, count_types_of_appearances, filter_less_frequent_characters, build_weights_df,
+calculate_correlations, extract_edges) makes several copies of the characters x issues table, and the N x N correlation
+matrix. Here every issue goes, as the ids and levels of its characters, from the scraper (or the store) straight into
+the running statistics of incremental.CooccurrenceStats, and is then dropped:
+    iter_issues -> accumulate -> select_characters -> stream_edges
+The edges come from the pairs of characters that met in an issue (CooccurrenceStats.pair_correlations):
+with floors of 0 or more, the pairs that never met (correlation of 0 or less) can't be edges, nor be ranked in a
+top n ahead of one, so the edges are the same as extract_edges on the whole matrix.
+The wide table is only built if it's asked for (see main.make_graph_streaming).
+
+The time and memory of every stage are recorded by an instrumentation.StageTracker.
+"""
+
+def iter_issues(issues:list, store:storage.AppearanceStore, scrape_missing:bool=True,
+                max_in_flight:int=scrape.MAX_IN_FLIGHT, requests_per_second:float=scrape.REQUESTS_PER_SECOND_PER_HOST,
+                parse_workers:int=0, extractor:str=extract.DEFAULT_EXTRACTOR, names:NameTable=None):
+    """
+    Yields (issue_id, character_ids, levels) for every issue of the list, in order, with the ids of the store's characters.
+    The issues already in the store are read from it. The others are scraped (as in parse_issues.scrape_into_journal),
+    appended to the store as soon as they're parsed, and yielded (with scrape_missing=False, they're an error).
+    An issue that is listed twice is only yielded once.
+    """
+    issue_ids = [storage.canonical_issue_id(issue) for issue in issues]
+    to_scrape = list({issue_id: issue for issue_id, issue in zip(issue_ids, issues) if issue_id not in store}.values())
+    if to_scrape and not scrape_missing:
+        raise KeyError(f"Issues not in the store: {[storage.canonical_issue_id(issue) for issue in to_scrape[:5]]}")
+    scraped = iter(())
+    if to_scrape:
+        if names is None:
+            names = NameTable.load()
+        scraped = parse_issues.iter_parsed_issues(to_scrape, max_in_flight=max_in_flight, requests_per_second=requests_per_second,
+                                                  parse_workers=parse_workers, extractor=extractor)
+    seen = set()
+    for issue_id in issue_ids:
+        if issue_id in seen:
+            continue
+        seen.add(issue_id)
+        if issue_id not in store:
+            # the next page scraped is this issue (same order as the list)
+            issue, titles = next(scraped)
+            ids, levels = names.parse_titles(titles)
+            store.append_issue_ids(storage.canonical_issue_id(issue), ids, levels, names.characters.names)
+        yield (issue_id, *store.issue_rows(issue_id))
+    if to_scrape:
+        names.save()
+
+def accumulate(issue_stream, weights_lookup:np.ndarray, n_characters:int=0) -> tuple:
+    """
+    Adds every issue of the stream to new CooccurrenceStats.
+    Returns (stats, issue_ids): the statistics and the ids of the issues, in the order they came.
+    """
+    stats = incremental.CooccurrenceStats(weights_lookup, n_characters)
+    issue_ids = []
+    for issue_id, character_ids, levels in issue_stream:
+        stats.add_issue(character_ids, levels)
+        issue_ids.append(issue_id)
+    stats.grow(n_characters)
+    return stats, issue_ids
+
+def select_characters(stats:incremental.CooccurrenceStats, names:list[str], top_n_characters:int=None,
+                      character_percentile:float=None, min_number_of_apperances:int=None) -> tuple:
+    """
+    Returns (char_stats, characters): the counts of the characters that appear in the issues added to stats
+    (what count_types_of_appearances returns for their table, sorted the same way, for the ties), and the index of
+    the ones filter_less_frequent_characters would keep, from the most to the least appearances.
+    """
+    char_stats = stats.character_stats(names, sort=False)
+    char_stats = char_stats[stats.type_counts[:len(names), 1:].sum(axis=1) > 0]
+    char_stats = char_stats.sort_values(by="Appearances", ascending=False)
+    characters = process_appearances.characters_to_keep(char_stats, number_of_issues=stats.n_issues,
+                                                        top_n_characters=top_n_characters,
+                                                        min_number_of_apperances=min_number_of_apperances,
+                                                        character_percentile=character_percentile)
+    return char_stats, characters
+
+def stream_edges(stats:incremental.CooccurrenceStats, char_stats:pd.DataFrame, characters:pd.Index,
+                 soft_floor:float, hard_floor:float, top_n:int) -> prepare_edges.EdgeArrays:
+    """
+    Same edges as extract_edges on the correlation matrix of the characters, from the pairs that met.
+    Floors under 0 need the pairs that never met too: then the matrix is built.
+    """
+    names = char_stats.loc[characters, "character name"].to_numpy()
+    if min(soft_floor, hard_floor) < 0:
+        corr_matrix = pd.DataFrame(stats.correlations(characters.to_numpy()), columns=names)
+        return prepare_edges.extract_edges(corr_matrix, soft_floor, hard_floor, top_n)
+    rows, cols, correlations = stats.pair_correlations(characters.to_numpy())
+    return prepare_edges.extract_edges_from_pairs(names, rows, cols, correlations, soft_floor, hard_floor, top_n)
@@ -0,0 +1,125 @@
+from utils import incremental, streaming, prepare_edges, visualization, layout, communities
+from utils.incidence import Incidence
+from dataclasses import dataclass
+from scipy import sparse
+import pandas as pd
+import numpy as np
+import json
+
+"""
+How the cast's network changes over a run: a graph for every window of `window` consecutive issues (in reading order,
+the order of the columns of table_of_appearances), every `stride` issues.
+
+The correlations of a window come from the sufficient statistics of incremental.CooccurrenceStats:
+moving to the next window adds the issues that enter it and removes the ones that leave it (O(k^2) per issue of
+k characters), instead of computing the correlations of every window from its table.
+Every window then goes through the same steps as the whole run (characters to keep, edges, communities, sizes).
+The communities and the layout of a window start from those of the one before, so they only change
+where the graph did, and can be animated.
+"""
+
+def windows(n_issues:int, window:int, stride:int) -> list[tuple]:
+    """
+    The (start, end) issues of every window (end excluded). A run shorter than the window is a single window.
+    The last window always ends with the last issue (closer to the one before it if the stride doesn't fit evenly).
+    """
+    if n_issues <= window:
+        return [(0, n_issues)]
+    starts = list(range(0, n_issues - window + 1, stride))
+    if starts[-1] + window < n_issues:
+        starts.append(n_issues - window)
+    return [(start, start + window) for start in starts]
+
+def sliding_stats(incidence:Incidence, weights_lookup:np.ndarray, window:int, stride:int):
+    """
+    Yields (start, end, stats) for every window: the same CooccurrenceStats, updated in place from one window
+    to the next (use or copy what's needed from it before asking for the next window).
+    """
+    columns = sparse.csc_matrix(incidence.matrix)
+    def issue(j:int) -> tuple:
+        rows = slice(columns.indptr[j], columns.indptr[j + 1])
+        return columns.indices[rows], columns.data[rows].astype(np.int64)
+    stats = incremental.CooccurrenceStats(weights_lookup, len(incidence.characters))
+    first, last = 0, 0 # issues in stats: first to last (excluded)
+    for start, end in windows(incidence.shape[1], window, stride):
+        for j in range(max(last, start), end):
+            stats.add_issue(*issue(j))
+        for j in range(first, min(start, last)):
+            stats.remove_issue(*issue(j))
+        first, last = start, end
+        yield start, end, stats
+
+def window_correlations(stats:incremental.CooccurrenceStats, names:list[str], top_n_characters:int=None,
+                        character_percentile:float=None, min_number_of_apperances:int=None) -> tuple:
+    """
+    Returns (character_stats, corr_matrix) of the issues in stats: the counts of the characters in them, and the
+    correlations of the ones filter_less_frequent_characters would keep from the window's table (in the same order).
+    names: the names of all the characters (incidence.characters).
+    """
+    present, kept = streaming.select_characters(stats, names, top_n_characters=top_n_characters,
+                                                character_percentile=character_percentile,
+                                                min_number_of_apperances=min_number_of_apperances)
+    kept_names = present.loc[kept, "character name"]
+    corr_matrix = pd.DataFrame(stats.correlations(kept.to_numpy()), index=pd.Index(kept_names, name=""),
+                               columns=pd.Index(kept_names, name="character name"))
+    return present, corr_matrix
+
+@dataclass
+class WindowGraph:
+    start:int            # first issue of the window
+    end:int              # issue after the last one
+    first_issue:str
+    last_issue:str
+    graph:visualization.GraphArrays
+    partition:dict       # {character: community}
+    modularity:float
+
+def window_graphs(incidence:Incidence, window:int, stride:int, weights_dict:dict=prepare_edges.WEIGHTS_OF_APPEARANCES,
+                  top_n_characters:int=None, character_percentile:float=None, min_number_of_apperances:int=None,
+                  soft_floor:float=0.5, hard_floor:float=0.2, top_n:int=3, with_layout:bool=True):
+    """
+    Yields a WindowGraph for every window: the graph of its most frequent characters (among the ones in the window),
+    with the communities started from the previous window's, the sizes of the nodes and (with_layout) their positions.
+    """
+    weights_lookup = prepare_edges.weights_lookup(weights_dict)
+    names = incidence.characters
+    previous_partition, previous_positions = None, None
+    for start, end, stats in sliding_stats(incidence, weights_lookup, window, stride):
+        present, corr_matrix = window_correlations(stats, names, top_n_characters=top_n_characters,
+                                                   character_percentile=character_percentile,
+                                                   min_number_of_apperances=min_number_of_apperances)
+        G = visualization.make_graph(prepare_edges.extract_edges(corr_matrix, soft_floor, hard_floor, top_n))
+        partition = G.partition_communities(previous=previous_partition)
+        G.set_node_size(present)
+        if with_layout and G.n_nodes:
+            adjacency = G.adjacency()
+            start_positions = None if previous_positions is None else layout.initial_positions(G.names.tolist(), adjacency, previous_positions)
+            if start_positions is None:
+                G.position = layout.force_layout(adjacency)
+            else:
+                G.position = layout.force_layout(adjacency, positions=start_positions, iterations=layout.WARM_ITERATIONS,
+                                                 temperature=layout.WARM_TEMPERATURE)
+            previous_positions = dict(zip(G.names.tolist(), G.position.tolist()))
+        previous_partition = partition
+        quality = communities.modularity(G.adjacency(), G.group) if len(G) else 0.0
+        yield WindowGraph(start, end, incidence.issues[start], incidence.issues[end - 1], G, partition, quality)
+
+def summary(frames:list[WindowGraph]) -> pd.DataFrame:
+    """One row per window: its issues, and the size, communities and modularity of its graph."""
+    return pd.DataFrame([{"window": k, "first issue": frame.first_issue, "last issue": frame.last_issue,
+                          "nodes": frame.graph.n_nodes, "edges": len(frame.graph),
+                          "communities": len(set(frame.partition.values())), "modularity": frame.modularity}
+                         for k, frame in enumerate(frames)])
+
+def write_timeline(frames:list[WindowGraph], path:str) -> None:
+    """
+    Writes the windows to a json file for animation: a list of frames with the window's issues,
+    and the vis.js nodes (with their group, size and x, y) and edges of its graph.
+    """
+    timeline = []
+    for k, frame in enumerate(frames):
+        nodes, edges = frame.graph.to_vis_json()
+        timeline.append({"window": k, "first_issue": frame.first_issue, "last_issue": frame.last_issue,
+                         "nodes": nodes, "edges": edges})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(timeline, f)
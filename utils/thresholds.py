@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+import pandas as pd
+import numpy as np
+
+"""
+How many edges extract_edges would keep, for any thresholds, without extracting them.
+
+An edge (i, j) is kept by extract_edges(corr_matrix, soft_floor, hard_floor, top_n) when
+    corr > soft_floor, or corr > hard_floor and j is in the top_n of i (or i in the top_n of j).
+So every pair only needs its correlation and its best rank: the smaller of its rank in the row of i and in the row
+of j (0 for the highest, ties in column order like extract_edges). The sweep keeps, once:
+    - the correlations of all the pairs, sorted
+    - for every best rank under max_top_n, the correlations of the pairs with that best rank, sorted
+    - the highest correlation of every character, sorted
+and then the number of edges for any (soft_floor, hard_floor, top_n) is a few binary searches (O(top_n log E)).
+A character has an edge when its highest correlation is above the soft floor, or above the hard floor if top_n > 0
+(its best pair is in its own top n), so the number of characters left in the graph is one more binary search.
+
+choose_thresholds uses it to pick the soft floor and top_n that give a target average degree.
+"""
+
+@dataclass
+class ThresholdSweep:
+    n_characters:int
+    values:np.ndarray         # correlation of every pair (i < j), sorted, without NaN
+    values_by_rank:list       # values_by_rank[k]: sorted correlations of the pairs whose best rank is k
+    highest:np.ndarray        # highest correlation of every character, sorted (-inf if it has none)
+
+    @property
+    def max_top_n(self) -> int:
+        return len(self.values_by_rank)
+
+    @classmethod
+    def from_correlations(cls, corr_matrix:pd.DataFrame, max_top_n:int=10) -> "ThresholdSweep":
+        corr = corr_matrix.to_numpy(dtype=np.float64, copy=True)
+        n = corr.shape[0]
+        np.fill_diagonal(corr, np.nan)
+        ranked = np.where(np.isnan(corr), -np.inf, corr)
+        # rank of every column in its row: highest first, ties in column order
+        order = np.argsort(-ranked, axis=1, kind="stable")
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(n)[None, :], axis=1)
+        rows, cols = np.triu_indices(n, k=1)
+        values = corr[rows, cols]
+        best_rank = np.minimum(rank[rows, cols], rank[cols, rows])
+        valid = ~np.isnan(values)
+        values, best_rank = values[valid], best_rank[valid]
+        max_top_n = max(0, min(max_top_n, n - 1))
+        values_by_rank = [np.sort(values[best_rank == k]) for k in range(max_top_n)]
+        highest = np.sort(ranked.max(axis=1, initial=-np.inf))
+        return cls(n, np.sort(values), values_by_rank, highest)
+
+    def n_edges(self, soft_floor, hard_floor, top_n:int) -> np.ndarray:
+        """The number of edges extract_edges would keep (soft_floor and hard_floor can be arrays of thresholds)."""
+        soft_floor, hard_floor = np.asarray(soft_floor, dtype=np.float64), np.asarray(hard_floor, dtype=np.float64)
+        if top_n > self.max_top_n:
+            raise ValueError(f"The sweep only has the ranks of the top {self.max_top_n} edges of every character.")
+        edges = len(self.values) - np.searchsorted(self.values, soft_floor, side="right")
+        # pairs in a top n, above the hard floor but not above the soft floor
+        for values in self.values_by_rank[:top_n]:
+            edges = edges + np.maximum(np.searchsorted(values, soft_floor, side="right")
+                                       - np.searchsorted(values, hard_floor, side="right"), 0)
+        return edges
+
+    def n_nodes(self, soft_floor, hard_floor, top_n:int) -> np.ndarray:
+        """The number of characters with at least one edge."""
+        floor = np.asarray(soft_floor, dtype=np.float64)
+        if top_n > 0:
+            floor = np.minimum(floor, hard_floor)
+        return len(self.highest) - np.searchsorted(self.highest, floor, side="right")
+
+    def average_degree(self, soft_floor, hard_floor, top_n:int) -> np.ndarray:
+        """Average number of edges of the characters in the graph (2 edges / nodes), 0 for an empty graph."""
+        edges, nodes = self.n_edges(soft_floor, hard_floor, top_n), self.n_nodes(soft_floor, hard_floor, top_n)
+        return 2 * edges / np.maximum(nodes, 1)
+
+    def table(self, soft_floors, hard_floors, top_ns) -> pd.DataFrame:
+        """Edges, nodes, isolated characters and average degree for every combination of the thresholds."""
+        soft, hard, top_n = (grid.ravel() for grid in np.meshgrid(soft_floors, hard_floors, top_ns, indexing="ij"))
+        rows = []
+        for k in np.unique(top_n):
+            chosen = top_n == k
+            edges, nodes = self.n_edges(soft[chosen], hard[chosen], int(k)), self.n_nodes(soft[chosen], hard[chosen], int(k))
+            rows.append(pd.DataFrame({"soft_floor": soft[chosen], "hard_floor": hard[chosen], "top_n": k, "edges": edges,
+                                      "nodes": nodes, "isolated": self.n_characters - nodes,
+                                      "average_degree": 2 * edges / np.maximum(nodes, 1)}))
+        return pd.concat(rows).sort_values(["soft_floor", "hard_floor", "top_n"], ignore_index=True)
+
+def closest_soft_floor(sweep:ThresholdSweep, target_average_degree:float, hard_floor:float, top_n:int) -> float:
+    """
+    The soft floor between the hard floor and 1 with the average degree closest to the target. With top_n > 0,
+    the characters in the graph don't depend on the soft floor, so the average degree only goes down as it goes up:
+    binary search over the correlations above the hard floor.
+    """
+    candidates = np.r_[hard_floor, sweep.values[np.searchsorted(sweep.values, hard_floor, side="right"):]]
+    # first candidate at or under the target
+    low, high = 0, len(candidates) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if sweep.average_degree(candidates[middle], hard_floor, top_n) <= target_average_degree:
+            high = middle
+        else:
+            low = middle + 1
+    # or the one before it, if it's closer
+    if low > 0 and (abs(sweep.average_degree(candidates[low - 1], hard_floor, top_n) - target_average_degree)
+                    < abs(sweep.average_degree(candidates[low], hard_floor, top_n) - target_average_degree)):
+        low -= 1
+    return float(candidates[low])
+
+def choose_thresholds(sweep:ThresholdSweep, target_average_degree:float, hard_floor:float, max_top_n:int) -> tuple:
+    """
+    Returns (soft_floor, hard_floor, top_n) with the average degree closest to the target: the hard floor stays,
+    and for every top_n from 1 to max_top_n the soft floor is searched (closest_soft_floor).
+    On a tie the biggest top_n wins, so that every character keeps as many of its strongest edges as possible.
+    """
+    best, best_error = None, np.inf
+    for top_n in range(min(1, sweep.max_top_n), min(max_top_n, sweep.max_top_n) + 1):
+        soft_floor = closest_soft_floor(sweep, target_average_degree, hard_floor, top_n)
+        error = abs(sweep.average_degree(soft_floor, hard_floor, top_n) - target_average_degree)
+        if error <= best_error:
+            best, best_error = (soft_floor, hard_floor, top_n), error
+    return best
+
+def automatic_thresholds(corr_matrix:pd.DataFrame, target_average_degree:float, hard_floor:float, max_top_n:int) -> tuple:
+    """The (soft_floor, hard_floor, top_n) of choose_thresholds, for the edges of a correlation matrix."""
+    sweep = ThresholdSweep.from_correlations(corr_matrix, max_top_n=max_top_n)
+    return choose_thresholds(sweep, target_average_degree, hard_floor, max_top_n)
@@ -1,7 +1,11 @@
 import networkx as nx
 from pyvis.network import Network
 from community import community_louvain
+from utils import communities, layout
+from scipy import sparse
+from dataclasses import dataclass
 import pandas as pd
+import numpy as np
 import datetime
 import math
 import os
@@ -54,12 +58,37 @@ def set_node_size(G:nx.Graph, size_key:pd.DataFrame) -> None:
         sizes_dict[character] = linear_scale(number_of_appearances, min_number_of_appearances, max_number_of_appearances, desired_min_size, desired_max_size)
     nx.set_node_attributes(G, sizes_dict, 'size')
 
-def partition_communities(G:nx.Graph) -> None:
+def partition_communities(G:nx.Graph, previous:dict=None, seed:int=0, backend:str="csr") -> dict:
     """
-    Makes a community partition of the graph using community_louvain.
+    Makes a community partition of the graph (the 'group' attribute of the nodes), and returns it as {node: community}.
+    
+    backend:
+        - "csr": Louvain on the adjacency matrix, vectorized (see the communities module).
+        - "python-louvain": community_louvain.best_partition on the networkx graph.
+    previous: the partition of an earlier run ({node: community}) to start from, e.g. before new issues were added.
+    The same graph, previous partition and seed always give the same communities.
     """
-    communities = community_louvain.best_partition(G)
-    nx.set_node_attributes(G, communities, 'group')
+    nodes = list(G.nodes())
+    if backend == "csr":
+        adjacency = sparse.csr_matrix(nx.to_scipy_sparse_array(G, nodelist=nodes, weight="weight"))
+        start = None if previous is None else communities.partition_to_labels(nodes, previous)
+        labels = communities.louvain(adjacency, partition=start, seed=seed)
+        partition = dict(zip(nodes, labels.tolist()))
+    elif backend == "python-louvain":
+        start = None
+        if previous is not None:
+            # every node needs a community: the new ones get their own
+            start = dict(zip(nodes, communities.relabel(communities.partition_to_labels(nodes, previous)).tolist()))
+            new_community = max(start.values(), default=-1) + 1
+            for node in nodes:
+                if node not in previous:
+                    start[node] = new_community
+                    new_community += 1
+        partition = community_louvain.best_partition(G, partition=start, random_state=seed)
+    else:
+        raise ValueError(f"Unknown community detection backend: {backend}")
+    nx.set_node_attributes(G, partition, 'group')
+    return partition
     
 def set_graph_attributes(G:nx.Graph, size_key:pd.DataFrame) -> None:
     """
@@ -68,27 +97,153 @@ def set_graph_attributes(G:nx.Graph, size_key:pd.DataFrame) -> None:
     set_node_size(G, size_key)
     partition_communities(G)
 
-def show_graph(G: nx.Graph, notebook:bool=False, physics_buttons:bool=False, title:str = "X-Men", save_path:str="output-test/") -> None:
+DEFAULT_NODE_SIZE = 10 # size of the nodes that aren't in the size key (same default as pyvis)
+
+@dataclass
+class GraphArrays:
     """
-    Creates an html file of the graph using pyvis.
+    An undirected graph as flat arrays, without networkx: node k is names[k], edge k goes from names[source[k]] to
+    names[target[k]]. The nodes are numbered in order of their first edge (the order networkx would add them in).
+    size, group and position are per node, and stay None until set_node_size, partition_communities and set_layout
+    are called (size is NaN for the nodes that aren't in the size key).
+    """
+    names:np.ndarray
+    source:np.ndarray # int32
+    target:np.ndarray # int32
+    weight:np.ndarray
+    width:np.ndarray
+    size:np.ndarray = None
+    group:np.ndarray = None
+    position:np.ndarray = None # (n x 2), in the units of the layout module
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.names)
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+    def adjacency(self) -> sparse.csr_matrix:
+        """The symmetric CSR matrix of the weights."""
+        return communities.adjacency_from_edges(self.source, self.target, self.weight, self.n_nodes)
+
+    def set_node_size(self, size_key:pd.DataFrame) -> None:
+        """Same sizes as set_node_size: the number of appearances, scaled linearly from 5 to 50."""
+        appearances = size_key["Appearances"].to_numpy()
+        scaled = linear_scale(appearances, appearances.min(), appearances.max(), 5, 50)
+        position = pd.Index(size_key["character name"]).get_indexer(self.names)
+        self.size = np.where(position >= 0, scaled[position], np.nan)
+
+    def partition_communities(self, previous:dict=None, seed:int=0, backend:str="csr") -> dict:
+        """Same communities as partition_communities on the networkx graph, kept in group. Returns {node: community}."""
+        if backend == "csr":
+            start = None if previous is None else communities.partition_to_labels(list(self.names), previous)
+            self.group = communities.louvain(self.adjacency(), partition=start, seed=seed)
+            return dict(zip(self.names.tolist(), self.group.tolist()))
+        # the other backends need the networkx graph
+        partition = partition_communities(self.to_networkx(), previous=previous, seed=seed, backend=backend)
+        self.group = np.array([partition[name] for name in self.names.tolist()])
+        return partition
+
+    def set_layout(self, directory:str, iterations:int=layout.DEFAULT_ITERATIONS, seed:int=0) -> None:
+        """
+        Computes the positions of the nodes (see the layout module), or reads them from directory if this graph
+        was laid out before. A new graph starts from the last layout saved in directory.
+        """
+        self.position = layout.cached_layout(self.names, self.source, self.target, self.weight, directory,
+                                             iterations=iterations, seed=seed)
+
+    def to_vis_json(self, font_color=None, default_node_size:int=DEFAULT_NODE_SIZE) -> tuple:
+        """
+        Returns (nodes, edges): the lists of dicts that pyvis gives vis.js, as net.from_nx(self.to_networkx()) would make them
+        (node sizes cut to integers, the weight of the edges as their label).
+        If the layout was set, the nodes also get their x and y in pixels.
+        """
+        ids = self.names.tolist()
+        sizes = np.full(self.n_nodes, default_node_size) if self.size is None else np.where(np.isnan(self.size), default_node_size, self.size)
+        columns = {"size": sizes.astype(int).tolist()}
+        if self.group is not None:
+            columns = {"group": self.group.tolist(), **columns}
+        if self.position is not None:
+            pixels = layout.pixel_positions(self.position, self.source, self.target)
+            columns.update(x=pixels[:, 0].tolist(), y=pixels[:, 1].tolist())
+        columns.update(id=ids, label=ids)
+        nodes = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        for node in nodes:
+            node["shape"] = "dot"
+            if font_color:
+                node["font"] = {"color": font_color}
+        weights = self.weight.tolist()
+        edges = [{"weight": weight, "width": width, "label": weight, "from": ids[source], "to": ids[target]}
+                 for weight, width, source, target in zip(weights, self.width.tolist(), self.source.tolist(), self.target.tolist())]
+        return nodes, edges
+
+    def to_networkx(self) -> nx.Graph:
+        """The same graph as make_nx_graph (with the size and group of the nodes, if they were set)."""
+        G = nx.Graph()
+        ids = self.names.tolist()
+        G.add_nodes_from(ids)
+        if self.group is not None:
+            nx.set_node_attributes(G, dict(zip(ids, self.group.tolist())), 'group')
+        if self.size is not None:
+            known = ~np.isnan(self.size)
+            nx.set_node_attributes(G, dict(zip(self.names[known].tolist(), self.size[known].tolist())), 'size')
+        G.add_edges_from((ids[source], ids[target], {"weight": weight, "width": width})
+                         for source, target, weight, width in zip(self.source.tolist(), self.target.tolist(),
+                                                                  self.weight.tolist(), self.width.tolist()))
+        return G
+
+def make_graph(pandas_edgelist:pd.DataFrame) -> GraphArrays:
+    """
+    Same graph as make_nx_graph, as arrays: the widths are the weights scaled linearly from 0.5 to 10, in one vectorized step.
+    Accepts the dataframe of edges (source, target, weight) or a prepare_edges.EdgeArrays.
+    """
+    if isinstance(pandas_edgelist, pd.DataFrame):
+        sources, targets = pandas_edgelist.iloc[:, 0].to_numpy(), pandas_edgelist.iloc[:, 1].to_numpy()
+        weights = pandas_edgelist.iloc[:, 2].to_numpy()
+    else:
+        sources, targets = pandas_edgelist.names[pandas_edgelist.source], pandas_edgelist.names[pandas_edgelist.target]
+        weights = pandas_edgelist.correlation
+    # number the nodes in order of their first edge, both ends of each edge in turn
+    codes, names = pd.factorize(np.column_stack([sources, targets]).ravel())
+    codes = codes.reshape(-1, 2).astype(np.int32)
+    # scaled in float64, like the python floats of make_nx_graph
+    widths = linear_scale(weights.astype(np.float64), weights.min(), weights.max(), 0.5, 10) if len(weights) else weights
+    return GraphArrays(np.asarray(names, dtype=object), codes[:, 0], codes[:, 1], weights, widths)
+
+def show_graph(G: nx.Graph, notebook:bool=False, physics_buttons:bool=False, title:str = "X-Men", save_path:str="output-test/") -> str:
+    """
+    Creates an html file of the graph using pyvis. Returns the path of the file.
+    G can be a networkx graph or a GraphArrays, whose nodes and edges are given to pyvis as they are
+    (net.from_nx adds them one at a time, and looks for duplicates among all the edges added before each one).
+    If the GraphArrays has a layout, the nodes are drawn where it put them and the physics are turned off.
     """
     if notebook:
         net = Network(notebook = True, height="900px", width="1400px", bgcolor="#222222", font_color="white")
     else:
         net = Network(height="100%", width="100%", bgcolor="#222222", font_color="white")
     
-    net.from_nx(G)
+    if isinstance(G, GraphArrays):
+        net.nodes, net.edges = G.to_vis_json(font_color=net.font_color)
+        net.node_ids = G.names.tolist()
+        nodes, edges = G.n_nodes, len(G)
+    else:
+        net.from_nx(G)
+        nodes, edges = len(G.nodes()), len(G.edges())
 
     if physics_buttons:
         net.show_buttons(filter_=['physics'])
         net.width = "70%"
+    elif isinstance(G, GraphArrays) and G.position is not None:
+        net.toggle_physics(False)
+        net.set_edge_smooth("continuous") # the default (dynamic) curves need the physics
     else:
         net.repulsion()
         
-    nodes, edges = len(G.nodes()), len(G.edges())
     timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S")
     file_path = os.path.join(save_path, f"{title}_{timestamp}_n{nodes}-e{edges}.html")
     net.show(file_path)
+    return file_path
     
     
 def linear_scale(x, min_x, max_x, min_y, max_y):